@@ -0,0 +1,5 @@
+#!/usr/bin/python
+# -- Content-Encoding: UTF-8 --
+"""
+Benchmarks of the Nao internal services
+"""
@@ -0,0 +1,421 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Benchmark of the MQTT messages dispatch of the MQTT connector.
+
+The connector is instantiated in a Pelix framework, and the listeners are
+registered as MQTT listener services. The connector is configured to use a
+fake MQTT connection, which gives it messages as if they were received from
+a server, and the time until each listener is notified is measured. Results
+are printed as JSON lines, one per scenario.
+
+Run from the ``python_on_nao`` folder::
+
+    python -m benchmarks.mqtt_dispatch [--messages=2000] [--output=file]
+"""
+
+# Nao Internals
+from internals.mqtt_topics import TopicTree
+import internals.mqtt
+
+# Pelix
+from pelix.ipopo.constants import use_ipopo
+import pelix.framework
+import pelix.services as services
+
+# Standard library
+from optparse import OptionParser
+import itertools
+import json
+import random
+import sys
+import threading
+import timeit
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+SUBSCRIPTIONS = (10, 100, 1000)
+""" Number of subscriptions per scenario """
+
+WILDCARDS = (0., .5, 1.)
+""" Part of the subscriptions using a wildcard """
+
+LISTENERS = (1, 10)
+""" Number of listeners per scenario """
+
+OVERLAPS = (False, True)
+"""
+If True, each subscription is shared by several listeners, and some listeners
+also subscribe to filters matching all the topics
+"""
+
+SHARED_LISTENERS = 3
+""" Number of listeners of each subscription, in overlapping scenarios """
+
+OVERLAPPING_FILTERS = ('/bench/+/value', '/bench/#')
+""" Filters matching all the topics, in overlapping scenarios """
+
+MODES = (internals.mqtt.MODE_POOL, internals.mqtt.MODE_LANES)
+""" Notification modes """
+
+INSTANCE_NAME = "mqtt-bench"
+""" Name of the benchmarked connector instance """
+
+CONFIGURATION_PID = "mqtt-bench-server"
+""" PID of the fake server configuration """
+
+# ------------------------------------------------------------------------------
+
+
+class FakeMessage(object):
+    """
+    An MQTT message, as given by the MQTT client
+    """
+    __slots__ = ('topic', 'payload', 'qos')
+
+    def __init__(self, topic, payload, qos=0):
+        """
+        Sets up members
+        """
+        self.topic = topic
+        self.payload = payload
+        self.qos = qos
+
+
+class FakeConnection(object):
+    """
+    An MQTT connection without server, used by the connector instead of
+    MqttConnection: the benchmark calls its on_message callback
+    """
+    instances = []
+    """ Connections created by the connector """
+
+    def __init__(self, client_id=None, buffer_size=0):
+        """
+        Sets up members
+        """
+        self.on_connect = None
+        self.on_message = None
+
+        # Statistics
+        self.buffered = 0
+        self.dropped = 0
+        self.in_flight = 0
+        self.reconnections = 0
+        self.ready_delay = None
+        FakeConnection.instances.append(self)
+
+    def connect(self, host="localhost", port=1883, keepalive=60):
+        """
+        Fake connection
+        """
+        pass
+
+    def disconnect(self):
+        """
+        Fake disconnection
+        """
+        FakeConnection.instances.remove(self)
+
+    def set_keepalive(self, keepalive):
+        """
+        Ignored
+        """
+        pass
+
+    def subscribe(self, topic, qos=0):
+        """
+        Ignored: the benchmark only sends messages matching subscriptions
+        """
+        pass
+
+    def unsubscribe(self, topic):
+        """
+        Ignored
+        """
+        pass
+
+    def receive(self, message):
+        """
+        Gives a message to the connector, as if it came from the server
+
+        :param message: A FakeMessage
+        """
+        self.on_message(self, message)
+
+
+class BenchListener(object):
+    """
+    An MQTT listener storing the notification latencies
+    """
+    def __init__(self, sent, latencies, done):
+        """
+        Sets up members
+
+        :param sent: Sending time of each message
+        :param latencies: List where to store the latencies
+        :param done: Object counting the deliveries
+        """
+        self._sent = sent
+        self._latencies = latencies
+        self._done = done
+
+    def handle_mqtt_message(self, topic, payload, qos):
+        """
+        An MQTT message has been received: the payload is its index
+        """
+        self._latencies.append(timeit.default_timer() - self._sent[payload])
+        self._done.count()
+
+
+class Countdown(object):
+    """
+    Sets an event once the expected number of deliveries has been reached
+    """
+    def __init__(self, expected):
+        """
+        Sets up members
+        """
+        self._remaining = expected
+        self._lock = threading.Lock()
+        self.event = threading.Event()
+        if expected <= 0:
+            self.event.set()
+
+    def count(self):
+        """
+        Counts a delivery
+        """
+        with self._lock:
+            self._remaining -= 1
+            if self._remaining <= 0:
+                self.event.set()
+
+# ------------------------------------------------------------------------------
+
+
+def make_filters(nb_subscriptions, wildcards):
+    """
+    Prepares the subscription filters of a scenario
+
+    :param nb_subscriptions: Number of subscriptions
+    :param wildcards: Part of the subscriptions using a wildcard
+    :return: A list of topic filters
+    """
+    nb_wildcards = int(nb_subscriptions * wildcards)
+    filters = []
+    for idx in range(nb_subscriptions):
+        if idx >= nb_wildcards:
+            filters.append('/bench/{0}/value'.format(idx))
+        elif idx % 2:
+            filters.append('/bench/{0}/+'.format(idx))
+        else:
+            filters.append('/bench/{0}/#'.format(idx))
+
+    return filters
+
+
+def assign_filters(filters, nb_listeners, overlap):
+    """
+    Gives the subscription filters to the listeners
+
+    :param filters: Subscription filters
+    :param nb_listeners: Number of listeners
+    :param overlap: If True, share each filter between several listeners and
+                    add the filters matching all the topics
+    :return: The list of filters of each listener
+    """
+    listeners_filters = [[] for _ in range(nb_listeners)]
+    nb_shared = min(nb_listeners, SHARED_LISTENERS) if overlap else 1
+    for idx, topic_filter in enumerate(filters):
+        for shift in range(nb_shared):
+            listeners_filters[(idx + shift) % nb_listeners].append(
+                topic_filter)
+
+    if overlap:
+        for idx, topic_filter in enumerate(OVERLAPPING_FILTERS):
+            listeners_filters[idx % nb_listeners].append(topic_filter)
+
+    return listeners_filters
+
+
+def count_deliveries(listeners_filters, topics):
+    """
+    Computes the number of notifications expected for the given topics: a
+    listener is notified once per message, even if several of its filters
+    match the topic
+
+    :param listeners_filters: The list of filters of each listener
+    :param topics: Topics of the injected messages
+    :return: The number of notifications
+    """
+    tree = TopicTree()
+    for listener, listener_filters in enumerate(listeners_filters):
+        for topic_filter in listener_filters:
+            tree.add(topic_filter, listener)
+
+    return sum(len(tree.match(topic)) for topic in topics)
+
+
+def percentile(values, ratio):
+    """
+    Returns the given percentile of sorted values
+
+    :param values: Sorted values
+    :param ratio: Percentile, between 0 and 1
+    """
+    if not values:
+        return None
+
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+def run_scenario(context, nb_subscriptions, wildcards, nb_listeners, overlap,
+                 mode, nb_messages):
+    """
+    Runs a benchmark scenario
+
+    :param context: Bundle context of the framework hosting the connector
+    :param nb_subscriptions: Number of subscriptions
+    :param wildcards: Part of the subscriptions using a wildcard
+    :param nb_listeners: Number of listeners
+    :param overlap: If True, several listeners are notified of each message
+    :param mode: Notification mode
+    :param nb_messages: Number of messages to inject
+    :return: The results of the scenario, as a dictionary
+    """
+    # Messages are sent on the topics matched by the subscriptions
+    filters = make_filters(nb_subscriptions, wildcards)
+    topics = ['/bench/{0}/value'.format(random.randrange(nb_subscriptions))
+              for _ in range(nb_messages)]
+    messages = [FakeMessage(topic, idx) for idx, topic in enumerate(topics)]
+
+    # Compute the expected number of deliveries
+    listeners_filters = assign_filters(filters, nb_listeners, overlap)
+    expected = count_deliveries(listeners_filters, topics)
+    done = Countdown(expected)
+
+    # Start a connector with unbounded queues: every message is delivered
+    with use_ipopo(context) as ipopo:
+        connector = ipopo.instantiate(
+            'MqttConnectorFactory', INSTANCE_NAME,
+            {'notification.mode': mode, 'notification.queue_size': 0})
+
+    # Let it "connect" to the fake server
+    connector.updated(CONFIGURATION_PID, {'host': 'localhost'})
+    connection = FakeConnection.instances[-1]
+
+    # Register the listeners
+    sent = [0.] * nb_messages
+    latencies = []
+    registrations = [
+        context.register_service(
+            services.SERVICE_MQTT_LISTENER,
+            BenchListener(sent, latencies, done),
+            {services.PROP_MQTT_TOPICS: listener_filters})
+        for listener_filters in listeners_filters]
+
+    try:
+        receive = connection.receive
+        timer = timeit.default_timer
+        start = timer()
+        for message in messages:
+            sent[message.payload] = timer()
+            receive(message)
+        dispatch_time = timer() - start
+
+        done.event.wait()
+        duration = timer() - start
+        stats = connector.get_statistics()
+    finally:
+        for registration in registrations:
+            registration.unregister()
+
+        with use_ipopo(context) as ipopo:
+            ipopo.kill(INSTANCE_NAME)
+
+    latencies.sort()
+    return {'subscriptions': nb_subscriptions,
+            'wildcards': wildcards,
+            'listeners': nb_listeners,
+            'overlap': overlap,
+            'mode': mode,
+            'messages': nb_messages,
+            'deliveries': len(latencies),
+            'fan_out': float(len(latencies)) / nb_messages,
+            'duration': duration,
+            'dispatch_time': dispatch_time,
+            'messages_per_second': nb_messages / duration,
+            'deliveries_per_second': len(latencies) / duration,
+            'latency_p50_ms': percentile(latencies, .5) * 1000.,
+            'latency_p90_ms': percentile(latencies, .9) * 1000.,
+            'latency_p99_ms': percentile(latencies, .99) * 1000.,
+            'latency_max_ms': latencies[-1] * 1000.,
+            'cache_hits': stats['cache.hits'],
+            'cache_misses': stats['cache.misses']}
+
+
+def main(nb_messages, output, modes):
+    """
+    Runs all the scenarios
+
+    :param nb_messages: Number of messages per scenario
+    :param output: Output stream of the JSON results
+    :param modes: Notification modes to test
+    """
+    # Use fake connections in the connector
+    internals.mqtt.MqttConnection = FakeConnection
+
+    framework = pelix.framework.create_framework(
+        ('pelix.ipopo.core', 'internals.mqtt'))
+    framework.start()
+    context = framework.get_bundle_context()
+
+    # Only keep the benchmarked instance
+    with use_ipopo(context) as ipopo:
+        ipopo.kill('mqtt-connector')
+
+    try:
+        for nb_subscriptions, wildcards, nb_listeners, overlap, mode \
+                in itertools.product(SUBSCRIPTIONS, WILDCARDS, LISTENERS,
+                                     OVERLAPS, modes):
+            result = run_scenario(context, nb_subscriptions, wildcards,
+                                  nb_listeners, overlap, mode, nb_messages)
+            output.write(json.dumps(result, sort_keys=True))
+            output.write('\n')
+            output.flush()
+    finally:
+        framework.stop()
+        pelix.framework.FrameworkFactory.delete_framework(framework)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    # Parse arguments
+    parser = OptionParser()
+    parser.add_option(
+        "--messages", dest="messages", type=int,
+        help="Number of messages injected per scenario")
+    parser.add_option(
+        "--mode", dest="modes", action="append", choices=MODES,
+        help="Notification mode to test (can be repeated)")
+    parser.add_option(
+        "--output", dest="output",
+        help="File where to write the results (default: standard output)")
+    parser.set_defaults(messages=2000, modes=None, output=None)
+
+    (opts, args_) = parser.parse_args()
+
+    # Run the benchmark
+    if opts.output:
+        with open(opts.output, 'w') as output_file:
+            main(opts.messages, output_file, opts.modes or MODES)
+    else:
+        main(opts.messages, sys.stdout, opts.modes or MODES)
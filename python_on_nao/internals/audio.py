@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Arbitration of Nao's audio devices: Nao must not listen while it speaks
+"""
+
+# Local module
+import internals.constants as constants
+
+# Pelix
+from pelix.ipopo.decorators import ComponentFactory, Instantiate, Provides, \
+    Invalidate
+
+# Standard library
+import logging
+import threading
+import time
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+
+
+@ComponentFactory('nao-audio')
+@Provides(constants.SERVICE_AUDIO)
+@Instantiate('nao-audio')
+class AudioArbiter(object):
+    """
+    Audio arbitration state machine.
+
+    The speaker and the microphone have at most one owner each, and can't be
+    owned at the same time. Microphone requests have precedence: while one is
+    waiting, the speaker can't be acquired, so that the current sentence is
+    the last one said before listening.
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # Device -> owner
+        self._owners = {constants.AUDIO_SPEAKER: None,
+                        constants.AUDIO_MICROPHONE: None}
+
+        # Number of threads waiting for the microphone
+        self._waiting_microphone = 0
+
+        # Device -> [acquisitions, timeouts, total wait, max wait]
+        self._metrics = dict((device, [0, 0, 0., 0.])
+                             for device in self._owners)
+
+        self.__condition = threading.Condition()
+
+    @Invalidate
+    def _invalidate(self, context):
+        """
+        Component invalidated
+        """
+        # Release the devices
+        with self.__condition:
+            for device in self._owners:
+                self._owners[device] = None
+            self.__condition.notify_all()
+
+    def get_owner(self, device):
+        """
+        Returns the current owner of a device
+
+        :param device: AUDIO_SPEAKER or AUDIO_MICROPHONE
+        :return: The owner of the device, or None
+        :raise KeyError: Unknown device
+        """
+        return self._owners[device]
+
+    def get_statistics(self):
+        """
+        Returns the acquisitions statistics of the devices
+
+        :return: A dictionary of counters
+        """
+        stats = {}
+        with self.__condition:
+            for device, metrics in self._metrics.items():
+                acquired, timeouts, total_wait, max_wait = metrics
+                stats['{0}.acquired'.format(device)] = acquired
+                stats['{0}.timeouts'.format(device)] = timeouts
+                stats['{0}.wait.total'.format(device)] = total_wait
+                stats['{0}.wait.max'.format(device)] = max_wait
+
+        return stats
+
+    def __can_acquire(self, device, owner):
+        """
+        Checks if the given owner can acquire the device. Must be called while
+        holding the lock.
+        """
+        if self._owners[device] not in (None, owner):
+            # Owned by someone else
+            return False
+
+        for other, other_owner in self._owners.items():
+            if other != device and other_owner is not None:
+                # The other device is in use
+                return False
+
+        # Let the microphone requests pass first
+        return device != constants.AUDIO_SPEAKER \
+            or not self._waiting_microphone
+
+    def acquire(self, device, owner, timeout=None):
+        """
+        Waits for a device to be available, then acquires it
+
+        :param device: AUDIO_SPEAKER or AUDIO_MICROPHONE
+        :param owner: Owner of the device
+        :param timeout: Maximum time to wait (in seconds), None to wait
+                        forever
+        :return: True if the device has been acquired, False on timeout
+        :raise KeyError: Unknown device
+        """
+        metrics = self._metrics[device]
+        start = time.time()
+        with self.__condition:
+            if device == constants.AUDIO_MICROPHONE:
+                self._waiting_microphone += 1
+
+            try:
+                while not self.__can_acquire(device, owner):
+                    if timeout is None:
+                        self.__condition.wait()
+                    else:
+                        remaining = start + timeout - time.time()
+                        if remaining <= 0:
+                            metrics[1] += 1
+                            _logger.debug("Timeout acquiring %s for %s "
+                                          "(owners: %s)",
+                                          device, owner, self._owners)
+                            return False
+
+                        self.__condition.wait(remaining)
+
+                self._owners[device] = owner
+            finally:
+                if device == constants.AUDIO_MICROPHONE:
+                    self._waiting_microphone -= 1
+                    # Speaker requests may be able to pass now
+                    self.__condition.notify_all()
+
+            # Update metrics
+            waited = time.time() - start
+            metrics[0] += 1
+            metrics[2] += waited
+            metrics[3] = max(metrics[3], waited)
+            return True
+
+    def release(self, device, owner):
+        """
+        Releases a device
+
+        :param device: AUDIO_SPEAKER or AUDIO_MICROPHONE
+        :param owner: Owner of the device
+        :return: True if the device has been released, False if it wasn't
+                 owned by the given owner
+        :raise KeyError: Unknown device
+        """
+        with self.__condition:
+            if self._owners[device] != owner:
+                return False
+
+            self._owners[device] = None
+            self.__condition.notify_all()
+            return True
@@ -38,13 +38,114 @@ SERVICE_TTS = "nao.internals.tts"
 """
 Specification of the Text-To-Speech service:
 
-- say(sentence): Nao says the given sentence. Blocks until the robot is
-  authorized to speak.
-- resume(): Authorize Nao to say something (resume the waiting say() calls)
-- pause(): Let the next TTS calls wait for the next call to resume()
+- say(sentence, priority=TTS_PRIORITY_NORMAL, max_age=None): Enqueues the
+  given sentence, which Nao says once authorized to speak. Returns a future
+  resolved with True once said, or with False if it has been dropped.
+- prepare(sentences): Renders the given sentences ahead of time, to say them
+  without synthesis latency
+- resume(): Authorize Nao to say something (resume the pending sentences)
+- pause(timeout=30): Let the next sentences wait for the next call to
+  resume(). Waits for the current sentence to be said, and returns False if
+  it isn't over after the timeout (in seconds, None to wait forever). Prefer
+  to acquire the microphone from the audio arbitration service.
+"""
+
+TTS_PRIORITY_LOW = 0
+""" Priority of chatter, dropped by any more important sentence """
+
+TTS_PRIORITY_NORMAL = 1
+""" Default priority of sentences """
+
+TTS_PRIORITY_HIGH = 2
+""" Priority of interaction prompts """
+
+SERVICE_AUDIO = "nao.internals.audio"
+"""
+Specification of the audio arbitration service:
+
+- acquire(device, owner, timeout=None): Waits for the device to be available
+  and acquires it. Returns False on timeout.
+- release(device, owner): Releases the device
+- get_owner(device): Returns the current owner of the device
+- get_statistics(): Returns the acquisitions and wait times metrics
+"""
+
+AUDIO_SPEAKER = "speaker"
+""" Audio device: the speakers, used by the TTS """
+
+AUDIO_MICROPHONE = "microphone"
+""" Audio device: the microphones, used by the speech recognition """
+
+SERVICE_NAOQI_PROXIES = "nao.internals.naoqi.proxies"
+"""
+Specification of the NAOqi proxies pool, registered while the parent broker
+can be reached:
+
+- get_proxy(module): Returns the shared proxy to the given NAOqi module
+- discard(module): Forgets a broken proxy, to create it again on next use
+- get_statistics(): Returns the pool counters
+"""
+
+SERVICE_NAOQI_CALLS = "nao.internals.naoqi.calls"
+"""
+Specification of the NAOqi call service:
+
+- call(module, method, *args, timeout=None): Calls the method of a NAOqi module
+  in a worker thread. Returns a future resolved with the result of the method.
+- post(module, method, *args, timeout=None): Calls the method with ``post``.
+  Returns a future resolved with True at the end of the NAOqi task, or with
+  False if it has been cancelled: cancelling the future stops the task.
+- get_statistics(): Returns the calls counters
+
+Futures are resolved with an OSError on timeout.
 """
 
 SERVICE_SPEECH = "nao.internals.speech"
 """
 Specification of the Speech Recognition service
 """
+
+
+class _NoResult(object):
+    """
+    Type of the SPEECH_NO_RESULT constant
+    """
+    __slots__ = ()
+
+    def __bool__(self):
+        """
+        No result is False
+        """
+        return False
+
+    # Python 2
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        """
+        String representation
+        """
+        return "SPEECH_NO_RESULT"
+
+    __str__ = __repr__
+
+
+SPEECH_NO_RESULT = _NoResult()
+"""
+Result of a speech recognition which timed out or has been cancelled
+"""
+
+PROP_MQTT_CONFLATE = "nao.mqtt.conflate"
+"""
+MQTT listener service property: filters of the topics carrying a state. When
+several messages on such a topic are waiting to be notified to the listener,
+only the latest one is delivered.
+"""
+
+PROP_MQTT_MESSAGE = "nao.mqtt.message"
+"""
+MQTT listener service property: if True, the listener receives an
+``internals.mqtt_message.MqttMessage`` object as payload instead of the raw
+bytes. Its text, float and JSON forms are decoded once per message and shared
+by all listeners.
+"""
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Notifications delivery: a bounded thread pool with an overflow policy. Used
+by the MQTT connector and by the NAOqi events bridges.
+"""
+
+# Standard library
+import collections
+import logging
+import threading
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+
+POLICY_BLOCK = "block"
+""" Full queue: the caller waits for a free slot """
+
+POLICY_DROP_OLDEST = "drop-oldest"
+""" Full queue: the oldest pending notification is dropped """
+
+POLICY_COALESCE = "coalesce-per-topic"
+"""
+Full queue: the pending notification of the same topic is replaced by the new
+one. If there is none, the oldest pending notification is dropped.
+"""
+
+POLICIES = (POLICY_BLOCK, POLICY_DROP_OLDEST, POLICY_COALESCE)
+""" Known overflow policies """
+
+MODE_POOL = "pool"
+""" Delivery mode: all listeners are notified by a shared thread pool """
+
+MODE_LANES = "lanes"
+"""
+Delivery mode: each listener is notified by its own thread, in the order the
+messages have been received
+"""
+
+MODES = (MODE_POOL, MODE_LANES)
+""" Known delivery modes """
+
+# ------------------------------------------------------------------------------
+
+
+class NotificationPool(object):
+    """
+    Executes notification tasks stored in a bounded FIFO, in a thread pool.
+    Each task is associated to a key (the MQTT topic, the name of a sensor,
+    ...), used to coalesce the pending tasks.
+    """
+    def __init__(self, nb_threads=2, queue_size=0, policy=POLICY_BLOCK,
+                 logname=None):
+        """
+        Sets up the pool
+
+        :param nb_threads: Number of threads
+        :param queue_size: Maximum number of pending tasks (0 for infinite)
+        :param policy: Policy to apply when the queue is full
+        :param logname: Name of the logger
+        :raise ValueError: Invalid parameter
+        """
+        if nb_threads < 1:
+            raise ValueError("Pool size must be greater than 0")
+
+        if queue_size < 0:
+            raise ValueError("Queue size can't be negative")
+
+        if policy not in POLICIES:
+            raise ValueError("Unknown overflow policy: {0}".format(policy))
+
+        self._logger = logging.getLogger(logname or __name__)
+        self._nb_threads = nb_threads
+        self._queue_size = queue_size
+        self._policy = policy
+
+        # Pending tasks: deque of [key, method, args]
+        self._queue = collections.deque()
+
+        # Pending tasks per key (key -> task), normal and "latest" ones
+        self._pending = {}
+        self._latest = {}
+        self.__condition = threading.Condition()
+
+        # Statistics
+        self.dropped = 0
+        self.coalesced = 0
+        self.conflated = 0
+
+        # Worker threads
+        self._threads = []
+        self._running = False
+
+    @property
+    def configuration(self):
+        """
+        The (number of threads, queue size, policy) tuple of this pool
+        """
+        return self._nb_threads, self._queue_size, self._policy
+
+    @property
+    def depth(self):
+        """
+        The number of pending tasks
+        """
+        return len(self._queue)
+
+    def start(self):
+        """
+        Starts the worker threads. Does nothing if the pool is already started.
+        """
+        with self.__condition:
+            if self._running:
+                return
+
+            self._running = True
+            for idx in range(self._nb_threads):
+                thread = threading.Thread(
+                    target=self.__run,
+                    name="{0}-{1}".format(self._logger.name, idx + 1))
+                thread.daemon = True
+                self._threads.append(thread)
+                thread.start()
+
+    def stop(self):
+        """
+        Stops the worker threads, once they have finished their current task.
+        Pending tasks are discarded.
+        """
+        with self.__condition:
+            if not self._running:
+                return
+
+            self._running = False
+            self._queue.clear()
+            self._pending.clear()
+            self._latest.clear()
+            self.__condition.notify_all()
+
+        current = threading.current_thread()
+        for thread in self._threads:
+            if thread is not current:
+                thread.join()
+
+        del self._threads[:]
+
+    def enqueue(self, key, method, *args):
+        """
+        Enqueues a task, applying the overflow policy if the queue is full
+
+        :param key: Key of the task, used to coalesce pending tasks
+        :param method: Method to call
+        :param args: Method arguments
+        :return: False if the pool is stopped, else True
+        """
+        return self.__put(key, method, args, False)
+
+    def enqueue_latest(self, key, method, *args):
+        """
+        Enqueues a task which replaces the pending task enqueued with the same
+        key by this method, if any: only the latest task of a key is executed.
+
+        :param key: Key of the task
+        :param method: Method to call
+        :param args: Method arguments
+        :return: False if the pool is stopped, else True
+        """
+        return self.__put(key, method, args, True)
+
+    def __put(self, key, method, args, latest):
+        """
+        Enqueues a task
+
+        :param key: Key of the task
+        :param method: Method to call
+        :param args: Method arguments
+        :param latest: If True, replace the pending "latest" task of this key
+        :return: False if the pool is stopped, else True
+        """
+        with self.__condition:
+            if not self._running:
+                return False
+
+            if latest and key in self._latest:
+                # Conflate with the pending task of the same key
+                task = self._latest[key]
+                task[1] = method
+                task[2] = args
+                self.conflated += 1
+                return True
+
+            if self._queue_size and len(self._queue) >= self._queue_size:
+                if self._policy == POLICY_BLOCK:
+                    # Back pressure: wait for a worker to free a slot
+                    while self._running \
+                            and len(self._queue) >= self._queue_size:
+                        self.__condition.wait()
+
+                    if not self._running:
+                        return False
+
+                elif self._policy == POLICY_COALESCE and not latest \
+                        and key in self._pending:
+                    # Replace the pending task, keeping its position
+                    task = self._pending[key]
+                    task[1] = method
+                    task[2] = args
+                    self.coalesced += 1
+                    return True
+
+                else:
+                    # Make room by dropping the oldest task
+                    dropped = self._queue.popleft()
+                    self.__forget(dropped)
+                    self.dropped += 1
+                    self._logger.debug("Notification queue full: dropped a "
+                                       "message on %s", dropped[0])
+
+            task = [key, method, args]
+            self._queue.append(task)
+            if latest:
+                self._latest[key] = task
+            else:
+                self._pending[key] = task
+
+            self.__condition.notify_all()
+            return True
+
+    def __forget(self, task):
+        """
+        Removes a task from the pending tasks indexes
+
+        :param task: A task which has been removed from the queue
+        """
+        key = task[0]
+        if self._pending.get(key) is task:
+            del self._pending[key]
+        elif self._latest.get(key) is task:
+            del self._latest[key]
+
+    def __run(self):
+        """
+        Worker thread loop
+        """
+        while True:
+            with self.__condition:
+                while self._running and not self._queue:
+                    self.__condition.wait()
+
+                if not self._running:
+                    return
+
+                task = self._queue.popleft()
+                self.__forget(task)
+
+                # Wake up blocked producers
+                self.__condition.notify_all()
+
+            key, method, args = task
+            try:
+                method(*args)
+            except Exception as ex:
+                self._logger.exception("Error notifying %s: %s", key, ex)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tracks the EventAdmin handlers interested in the events of a source, to
+subscribe to this source only while it is useful
+"""
+
+# Pelix
+from pelix.utilities import to_iterable
+
+# Standard library
+import fnmatch
+import logging
+import threading
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+
+
+class DemandTracker(object):
+    """
+    Subscribes to a source key (an ALMemory event, ...) while at least one
+    EventAdmin handler listens to one of the topics sent for this key.
+    Topic patterns are matched like the EventAdmin does.
+    """
+    def __init__(self, topics, subscribe, unsubscribe):
+        """
+        Sets up members
+
+        :param topics: A key -> list of sent topics dictionary
+        :param subscribe: Method called with a key to subscribe to
+        :param unsubscribe: Method called with a key to unsubscribe from
+        """
+        self._topics = dict((key, tuple(to_iterable(key_topics, False)))
+                            for key, key_topics in topics.items())
+        self._subscribe = subscribe
+        self._unsubscribe = unsubscribe
+
+        # Handler -> frozenset(keys)
+        self._handlers = {}
+
+        # Key -> number of handlers
+        self._counts = {}
+
+        # Subscribed keys (when active)
+        self._subscribed = set()
+        self._active = False
+        self.__lock = threading.RLock()
+
+    @property
+    def subscribed(self):
+        """
+        The keys currently subscribed to
+        """
+        return frozenset(self._subscribed)
+
+    def __match(self, patterns):
+        """
+        Returns the keys whose topics match the given patterns
+
+        :param patterns: Value of the PROP_EVENT_TOPICS property of a handler
+        :return: A frozenset of keys
+        """
+        patterns = to_iterable(patterns, False)
+        return frozenset(
+            key for key, topics in self._topics.items()
+            if any(fnmatch.fnmatch(topic, pattern)
+                   for topic in topics for pattern in patterns))
+
+    def start(self):
+        """
+        Subscribes to the keys with a handler
+        """
+        with self.__lock:
+            self._active = True
+            self.__apply()
+
+    def stop(self):
+        """
+        Unsubscribes from all keys
+        """
+        with self.__lock:
+            self._active = False
+            self.__apply()
+
+    def set_handler(self, handler, patterns):
+        """
+        Adds or updates an EventAdmin handler
+
+        :param handler: The handler service
+        :param patterns: Value of its PROP_EVENT_TOPICS property
+        """
+        with self.__lock:
+            old_keys = self._handlers.get(handler, frozenset())
+            new_keys = self.__match(patterns)
+            if new_keys:
+                self._handlers[handler] = new_keys
+            else:
+                self._handlers.pop(handler, None)
+
+            self.__update(old_keys, new_keys)
+
+    def remove_handler(self, handler):
+        """
+        Removes an EventAdmin handler
+
+        :param handler: The handler service
+        """
+        with self.__lock:
+            self.__update(self._handlers.pop(handler, frozenset()),
+                          frozenset())
+
+    def __update(self, old_keys, new_keys):
+        """
+        Updates the handlers count of the keys. Must be called while holding
+        the lock.
+
+        :param old_keys: Keys previously matched by a handler
+        :param new_keys: Keys now matched by the handler
+        """
+        for key in new_keys.difference(old_keys):
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+        for key in old_keys.difference(new_keys):
+            count = self._counts[key] - 1
+            if count:
+                self._counts[key] = count
+            else:
+                del self._counts[key]
+
+        self.__apply()
+
+    def __apply(self):
+        """
+        (Un)subscribes the keys according to the handlers. Must be called
+        while holding the lock.
+        """
+        if self._active:
+            wanted = set(self._counts)
+        else:
+            wanted = set()
+
+        for key in wanted.difference(self._subscribed):
+            try:
+                self._subscribe(key)
+                self._subscribed.add(key)
+            except Exception as ex:
+                _logger.exception("Error subscribing to %s: %s", key, ex)
+
+        for key in self._subscribed.difference(wanted):
+            self._subscribed.discard(key)
+            try:
+                self._unsubscribe(key)
+            except Exception as ex:
+                _logger.exception("Error unsubscribing from %s: %s", key, ex)
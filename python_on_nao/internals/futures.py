@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Future results of asynchronous operations
+"""
+
+# Pelix
+import pelix.utilities
+
+# Standard library
+import logging
+import threading
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+
+
+class Future(object):
+    """
+    The result of an asynchronous operation, set by the component executing
+    it. Follows the API of ``pelix.threadpool.FutureResult``.
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        self._done_event = pelix.utilities.EventData()
+        self.__lock = threading.Lock()
+        self.__callback = None
+        self.__extra = None
+        self.__canceller = None
+
+    def __notify(self):
+        """
+        Notifies the callback about the result of the operation
+        """
+        if self.__callback is not None:
+            try:
+                self.__callback(self._done_event.data,
+                                self._done_event.exception,
+                                self.__extra)
+            except Exception as ex:
+                _logger.exception("Error calling back method: %s", ex)
+
+    def set_callback(self, method, extra=None):
+        """
+        Sets a callback method, called once the result has been set or in case
+        of exception.
+
+        The callback method must have the following signature:
+        ``callback(result, exception, extra)``.
+
+        :param method: The method to call back at the end of the operation
+        :param extra: Extra parameter to be given to the callback method
+        """
+        with self.__lock:
+            self.__callback = method
+            self.__extra = extra
+            done = self._done_event.is_set()
+
+        if done:
+            # The operation has already finished
+            self.__notify()
+
+    def set_result(self, result):
+        """
+        Sets the result of the operation. Does nothing if the operation has
+        already finished.
+
+        :param result: The result of the operation
+        :return: True if the result has been stored
+        """
+        with self.__lock:
+            if self._done_event.is_set():
+                return False
+
+            self._done_event.set(result)
+
+        self.__notify()
+        return True
+
+    def set_exception(self, exception):
+        """
+        Sets the exception raised by the operation. Does nothing if the
+        operation has already finished.
+
+        :param exception: An Exception object
+        :return: True if the exception has been stored
+        """
+        with self.__lock:
+            if self._done_event.is_set():
+                return False
+
+            self._done_event.raise_exception(exception)
+
+        self.__notify()
+        return True
+
+    def set_canceller(self, method):
+        """
+        Sets the method called by cancel(), which must stop the operation and
+        set its result or exception. It can return False if the operation
+        can't be cancelled.
+
+        :param method: A method without argument
+        """
+        self.__canceller = method
+
+    def cancel(self):
+        """
+        Cancels the operation, if it hasn't finished yet
+
+        :return: True if the operation has been cancelled
+        """
+        if self._done_event.is_set() or self.__canceller is None:
+            return False
+
+        return self.__canceller() is not False
+
+    def done(self):
+        """
+        Returns True if the operation has finished, else False
+        """
+        return self._done_event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Waits up to timeout for the result of the operation.
+        Returns immediately if the operation has already finished.
+
+        :param timeout: The maximum time to wait for a result (in seconds)
+        :raise OSError: The timeout raised before the operation finished
+        :raise: The exception raised by the operation, if any
+        """
+        if self._done_event.wait(timeout):
+            return self._done_event.data
+        else:
+            raise OSError("Timeout raised")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Executes user interactions (speech, recognition, ...) triggered by events,
+outside of the EventAdmin delivery thread
+"""
+
+# Standard library
+import collections
+import logging
+import threading
+import time
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+# ------------------------------------------------------------------------------
+
+POLICY_QUEUE = "queue"
+""" Busy executor: the interaction is executed after the current ones """
+
+POLICY_DROP = "drop"
+""" Busy executor: the interaction is ignored """
+
+POLICY_PREEMPT = "preempt"
+""" Busy executor: the current interaction is cancelled and replaced """
+
+POLICIES = (POLICY_QUEUE, POLICY_DROP, POLICY_PREEMPT)
+""" Known policies """
+
+DEFAULT_DEBOUNCE = .5
+""" Default minimal delay between two interactions of the same key """
+
+# ------------------------------------------------------------------------------
+
+
+class Interaction(object):
+    """
+    Handle given to a running interaction, to check if it has been cancelled
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        self.cancelled = False
+        self._futures = []
+        self.__lock = threading.Lock()
+
+    def track(self, future):
+        """
+        Associates a future to the interaction: it is cancelled with the
+        interaction.
+
+        :param future: A Future object with a cancel() method
+        :return: The given future
+        """
+        with self.__lock:
+            if not self.cancelled:
+                self._futures.append(future)
+                return future
+
+        # Already cancelled
+        future.cancel()
+        return future
+
+    def cancel(self):
+        """
+        Cancels the interaction and its futures
+        """
+        with self.__lock:
+            self.cancelled = True
+            futures = self._futures[:]
+            del self._futures[:]
+
+        for future in futures:
+            future.cancel()
+
+
+class InteractionExecutor(object):
+    """
+    Executes interactions one at a time, in a dedicated thread.
+
+    Interactions are associated to a key (the touched button): an interaction
+    submitted less than the debounce delay after the previous one of the same
+    key is ignored.
+    """
+    def __init__(self, policy=POLICY_QUEUE, debounce=DEFAULT_DEBOUNCE,
+                 queue_size=4, logname=None):
+        """
+        Sets up the executor
+
+        :param policy: Policy to apply when an interaction is running
+        :param debounce: Minimal delay between two interactions of the same
+                         key (in seconds)
+        :param queue_size: Maximum number of pending interactions
+        :param logname: Name of the logger and of the thread
+        :raise ValueError: Invalid parameter
+        """
+        if policy not in POLICIES:
+            raise ValueError("Unknown interaction policy: {0}".format(policy))
+
+        self._policy = policy
+        self._debounce = debounce
+        self._queue_size = max(1, queue_size)
+        self._logname = logname or __name__
+        self._logger = logging.getLogger(self._logname)
+
+        # Pending (interaction, method, args) tuples and current interaction
+        self._pending = collections.deque()
+        self._current = None
+
+        # Key -> time of its last interaction
+        self._last = {}
+
+        # Counters
+        self.debounced = 0
+        self.dropped = 0
+        self.preempted = 0
+
+        self._running = False
+        self._thread = None
+        self.__condition = threading.Condition()
+
+    @property
+    def busy(self):
+        """
+        True if an interaction is running or waiting
+        """
+        return self._current is not None or bool(self._pending)
+
+    def start(self):
+        """
+        Starts the executor thread
+        """
+        with self.__condition:
+            if self._running:
+                return
+
+            self._running = True
+            self._thread = threading.Thread(target=self.__run,
+                                            name=self._logname)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """
+        Stops the executor, cancelling the current and pending interactions
+        """
+        with self.__condition:
+            if not self._running:
+                return
+
+            self._running = False
+            cancelled = [item[0] for item in self._pending]
+            self._pending.clear()
+            if self._current is not None:
+                cancelled.append(self._current)
+
+            self.__condition.notify_all()
+            thread = self._thread
+            self._thread = None
+
+        for interaction in cancelled:
+            interaction.cancel()
+
+        if thread is not threading.current_thread():
+            thread.join(1)
+
+    def submit(self, key, method, *args):
+        """
+        Submits an interaction, applying debouncing and the busy policy.
+
+        The method is called with an Interaction object as first argument,
+        followed by the given arguments.
+
+        :param key: Key of the interaction (touched button, ...)
+        :param method: Method to call
+        :param args: Method arguments
+        :return: True if the interaction has been accepted
+        """
+        now = time.time()
+        cancelled = []
+        with self.__condition:
+            if not self._running:
+                return False
+
+            last = self._last.get(key)
+            if last is not None and 0 <= now - last < self._debounce:
+                # Bounce
+                self.debounced += 1
+                return False
+
+            if self.busy:
+                if self._policy == POLICY_DROP:
+                    self.dropped += 1
+                    self._logger.debug("Busy: interaction %s dropped", key)
+                    return False
+                elif self._policy == POLICY_PREEMPT:
+                    # Replace the current and pending interactions
+                    cancelled = [item[0] for item in self._pending]
+                    self._pending.clear()
+                    if self._current is not None:
+                        cancelled.append(self._current)
+                    self.preempted += len(cancelled)
+                elif len(self._pending) >= self._queue_size:
+                    self.dropped += 1
+                    self._logger.debug("Full queue: interaction %s dropped",
+                                       key)
+                    return False
+
+            self._last[key] = now
+            self._pending.append((Interaction(), method, args))
+            self.__condition.notify()
+
+        for interaction in cancelled:
+            interaction.cancel()
+
+        return True
+
+    def __run(self):
+        """
+        Executes the interactions
+        """
+        while True:
+            with self.__condition:
+                while self._running and not self._pending:
+                    self.__condition.wait()
+
+                if not self._running:
+                    return
+
+                interaction, method, args = self._pending.popleft()
+                self._current = interaction
+
+            try:
+                method(interaction, *args)
+            except Exception as ex:
+                self._logger.exception("Error running interaction: %s", ex)
+            finally:
+                with self.__condition:
+                    self._current = None
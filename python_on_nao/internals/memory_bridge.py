@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Converts ALMemory events into EventAdmin events, subscribing to them only
+while an EventAdmin handler listens to their topic
+"""
+
+# Utilities
+from internals.event_demand import DemandTracker
+from internals.delivery import NotificationPool, POLICY_DROP_OLDEST
+import internals.constants as constants
+
+# Nao API
+from naoqi import ALModule
+
+# Pelix
+from pelix.ipopo.decorators import ComponentFactory, Property, Requires, \
+    Instantiate, Validate, Invalidate, BindField, UpdateField, UnbindField
+import pelix.services
+
+# Standard library
+import logging
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_EVENTS = {  # Feet
+                  'LeftBumperPressed': '/nao/sensor/bumper/left',
+                  'RightBumperPressed': '/nao/sensor/bumper/right',
+                  # Sonars
+                  'SonarLeftDetected': '/nao/sensor/sonar/left',
+                  'SonarRightDetected': '/nao/sensor/sonar/right',
+                  'SonarLeftNothingDetected': '/nao/sensor/sonar/left/nothing',
+                  'SonarRightNothingDetected': '/nao/sensor/sonar/right/'
+                                               'nothing',
+                  # Battery
+                  'BatteryChargeChanged': '/nao/sensor/battery/charge',
+                  'BatteryLowDetected': '/nao/sensor/battery/low',
+                  'BatteryPowerPluggedChanged': '/nao/sensor/battery/plugged'}
+"""
+Default ALMemory event -> EventAdmin topic association
+
+See: https://community.aldebaran-robotics.com/doc/1-14/naoqi/sensors/
+     alsensors-api.html#event-list
+"""
+
+DEFAULT_QUEUE_SIZE = 32
+""" Default maximum number of pending events """
+
+# ------------------------------------------------------------------------------
+
+
+@ComponentFactory('nao-memory-bridge')
+@Requires('_event', pelix.services.SERVICE_EVENT_ADMIN)
+@Requires('_pool', constants.SERVICE_NAOQI_PROXIES)
+@Requires('_handlers', pelix.services.SERVICE_EVENT_HANDLER,
+          aggregate=True, optional=True)
+@Property('_name', 'module.name', __name__.replace('.', '_'))
+@Property('_events', 'memory.events', DEFAULT_EVENTS)
+@Property('_queue_size', 'memory.queue_size', DEFAULT_QUEUE_SIZE)
+@Instantiate('nao-memory-bridge')
+class NaoMemoryBridge(ALModule):
+    """
+    Sends an EventAdmin event for each ALMemory event of the configured keys.
+    The properties of the EventAdmin events are the name of the ALMemory
+    event ('event') and its value ('value').
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # Injected services
+        self._event = None
+        self._handlers = []
+        self._pool = None
+
+        # Properties
+        self._name = None
+        self._events = None
+        self._queue_size = DEFAULT_QUEUE_SIZE
+
+        # Subscribes to the events with a handler
+        self._tracker = None
+
+        # Events are sent in order, out of the NAOqi callback thread
+        self._lane = None
+
+        # Proxy to Nao's memory
+        self._memory = None
+
+    def __get_tracker(self):
+        """
+        Returns the demand tracker, creating it on first call: the events
+        property must have been injected.
+        """
+        if self._tracker is None:
+            self._tracker = DemandTracker(self._events or {},
+                                          self.__subscribe,
+                                          self.__unsubscribe)
+        return self._tracker
+
+    @Validate
+    def _validate(self, context):
+        """
+        Component validated
+        """
+        # Register the global in the main script
+        constants.register_almodule(self._name, self)
+
+        # Prepare the events lane
+        self._lane = NotificationPool(1, max(1, int(self._queue_size)),
+                                      POLICY_DROP_OLDEST,
+                                      logname="memory-bridge")
+        self._lane.start()
+
+        # Initialize the module
+        ALModule.__init__(self, self._name)
+
+        # Get the shared "memory" proxy, to register to callbacks
+        self._memory = self._pool.get_proxy("ALMemory")
+
+        # Register to the events with a handler
+        self.__get_tracker().start()
+
+    @Invalidate
+    def _invalidate(self, context):
+        """
+        Component invalidated
+        """
+        # Unregister from the events
+        self.__get_tracker().stop()
+
+        # Unregister the global
+        constants.unregister_almodule(self._name)
+
+        # Stop the lane
+        self._lane.stop()
+
+        # Clean up
+        self._lane = None
+        self._memory = None
+
+    def __subscribe(self, event):
+        """
+        Subscribes to an ALMemory event
+
+        :param event: Name of the event
+        """
+        _logger.debug("Subscribing to %s", event)
+        self._memory.subscribeToEvent(event, self._name,
+                                      self.on_memory_event.__name__)
+
+    def __unsubscribe(self, event):
+        """
+        Unsubscribes from an ALMemory event
+
+        :param event: Name of the event
+        """
+        _logger.debug("Unsubscribing from %s", event)
+        self._memory.unsubscribeToEvent(event, self._name)
+
+    @BindField('_handlers')
+    def _bind_handler(self, field, handler, svc_ref):
+        """
+        An EventAdmin handler has been bound
+        """
+        self.__get_tracker().set_handler(
+            handler, svc_ref.get_property(pelix.services.PROP_EVENT_TOPICS))
+
+    @UpdateField('_handlers')
+    def _update_handler(self, field, handler, svc_ref, old_props):
+        """
+        An EventAdmin handler has been updated
+        """
+        self.__get_tracker().set_handler(
+            handler, svc_ref.get_property(pelix.services.PROP_EVENT_TOPICS))
+
+    @UnbindField('_handlers')
+    def _unbind_handler(self, field, handler, svc_ref):
+        """
+        An EventAdmin handler is gone
+        """
+        self.__get_tracker().remove_handler(handler)
+
+    def on_memory_event(self, event, value, identifier):
+        """
+        An ALMemory event has been raised
+
+        :param event: Name of the event
+        :param value: Value of the event
+        :param identifier: Name of our module
+        """
+        try:
+            topic = self._events[event]
+        except (KeyError, TypeError):
+            # Unknown event, ignore
+            return
+
+        lane = self._lane
+        if lane is not None:
+            lane.enqueue(event, self._event.send, topic,
+                         {'event': event, 'value': value})
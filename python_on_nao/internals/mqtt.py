@@ -4,8 +4,14 @@
 MQTT communications service
 """
 
-# MQTT client
-import pelix.misc.mqtt_client as mqtt
+# Local modules
+from internals.constants import PROP_MQTT_CONFLATE, PROP_MQTT_MESSAGE
+from internals.futures import Future
+from internals.mqtt_connection import MqttConnection, DEFAULT_BUFFER_SIZE
+from internals.delivery import NotificationPool, MODES, MODE_LANES, \
+    MODE_POOL, POLICIES, POLICY_BLOCK, POLICY_COALESCE
+from internals.mqtt_message import MqttMessage
+from internals.mqtt_topics import ListenersCache, TopicTree
 
 # Pelix
 from pelix.ipopo.decorators import ComponentFactory, Provides, Requires, \
@@ -14,10 +20,11 @@ from pelix.ipopo.decorators import ComponentFactory, Provides, Requires, \
 from pelix.utilities import to_iterable
 import pelix.constants as constants
 import pelix.services as services
-import pelix.threadpool
 
 # Standard library
+import collections
 import logging
+import threading
 
 # ------------------------------------------------------------------------------
 
@@ -30,6 +37,78 @@ __docformat__ = "restructuredtext en"
 
 _logger = logging.getLogger(__name__)
 
+DEFAULT_MODE = MODE_POOL
+""" Default notification mode """
+
+DEFAULT_POOL_SIZE = 2
+""" Default number of notification threads """
+
+DEFAULT_QUEUE_SIZE = 100
+""" Default maximum number of pending notifications """
+
+DEFAULT_POLICY = POLICY_BLOCK
+""" Default policy when the notification queue is full """
+
+DEFAULT_LANE_POLICY = POLICY_COALESCE
+"""
+Default policy when a lane is full. Lanes never block: the network thread
+would wait for the slowest listener, delaying all the others.
+"""
+
+# ------------------------------------------------------------------------------
+
+
+def _to_int(value, default):
+    """
+    Returns the integer value of a property
+
+    :param value: Value of the property
+    :param default: Value to return if the property is missing or invalid
+    :return: The integer value of the property
+    """
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return default
+
+
+def _to_pool_config(mode, nb_threads, queue_size, policy):
+    """
+    Returns the notification pool configuration described by the given
+    connector properties
+
+    :param mode: Notification mode
+    :param nb_threads: Number of notification threads
+    :param queue_size: Maximum number of pending notifications
+    :param policy: Policy when the notification queue is full
+    :return: A (mode, number of threads, queue size, policy) tuple
+    """
+    mode = mode or DEFAULT_MODE
+    if mode not in MODES:
+        _logger.warning("Unknown notification mode '%s', using '%s'",
+                        mode, DEFAULT_MODE)
+        mode = DEFAULT_MODE
+
+    if mode == MODE_LANES:
+        default_policy = DEFAULT_LANE_POLICY
+    else:
+        default_policy = DEFAULT_POLICY
+
+    policy = policy or default_policy
+    if policy not in POLICIES:
+        _logger.warning("Unknown notification policy '%s', using '%s'",
+                        policy, default_policy)
+        policy = default_policy
+    elif mode == MODE_LANES and policy == POLICY_BLOCK:
+        _logger.warning("Notification lanes can't block the network "
+                        "thread, using '%s'", default_policy)
+        policy = default_policy
+
+    return (mode,
+            max(1, _to_int(nb_threads, DEFAULT_POOL_SIZE)),
+            max(0, _to_int(queue_size, DEFAULT_QUEUE_SIZE)),
+            policy)
+
 # ------------------------------------------------------------------------------
 
 
@@ -39,10 +118,20 @@ _logger = logging.getLogger(__name__)
 @Property('_pid', constants.SERVICE_PID, services.MQTT_CONNECTOR_FACTORY_PID)
 @Requires('_listeners', services.SERVICE_MQTT_LISTENER,
           aggregate=True, optional=True)
+@Property('_notification_mode', 'notification.mode', DEFAULT_MODE)
+@Property('_notification_threads', 'notification.threads', DEFAULT_POOL_SIZE)
+@Property('_notification_queue_size', 'notification.queue_size',
+          DEFAULT_QUEUE_SIZE)
+@Property('_notification_policy', 'notification.policy', None)
+@Property('_buffer_size', 'publish.buffer_size', DEFAULT_BUFFER_SIZE)
 @Instantiate('mqtt-connector')
 class MqttConnector(object):
     """
-    Handles connections to MQTT servers
+    Handles connections to MQTT servers.
+
+    The notification and publication buffer settings are properties of the
+    connector, shared by all connections: the configurations only describe
+    the connections.
     """
     def __init__(self):
         """
@@ -51,20 +140,46 @@ class MqttConnector(object):
         # ConfigAdmin PID
         self._pid = None
 
+        # Connector properties
+        self._notification_mode = DEFAULT_MODE
+        self._notification_threads = DEFAULT_POOL_SIZE
+        self._notification_queue_size = DEFAULT_QUEUE_SIZE
+        self._notification_policy = None
+        self._buffer_size = DEFAULT_BUFFER_SIZE
+
         # Injected topic listeners
         self._listeners = []
 
-        # Topics to subscribe to (topic -> nb_references)
-        self._topics = {}
+        # Subscriptions index (topic filter -> listeners)
+        self._topics = TopicTree()
+        self.__topics_lock = threading.Lock()
+
+        # Listeners of state topics (topic filter -> listeners)
+        self._conflated = TopicTree()
+
+        # Listeners receiving MqttMessage objects (replaced on update)
+        self._message_listeners = frozenset()
+
+        # Matched listeners cache
+        # (topic -> (frozenset(listeners), frozenset(conflated listeners)))
+        self._cache = ListenersCache()
 
         # Bundle context
         self._context = None
 
-        # Active connection
-        self._mqtt = None
+        # Configurations: PID -> (host, port), in configuration order
+        self._clients = collections.OrderedDict()
+
+        # Active connections, shared by configurations: (host, port) -> client
+        self._connections = {}
+        self.__clients_lock = threading.RLock()
 
-        # Notification pool
+        # Notification pool, lanes (listener -> pool) and their configuration
         self._pool = None
+        self._lanes = {}
+        self._pool_config = (DEFAULT_MODE, DEFAULT_POOL_SIZE,
+                             DEFAULT_QUEUE_SIZE, DEFAULT_POLICY)
+        self.__pool_lock = threading.Lock()
 
     def updated(self, conf_pid, properties):
         """
@@ -73,54 +188,188 @@ class MqttConnector(object):
         :param conf_pid: Configuration PID (because this is a managed factory)
         :param properties: Configuration properties
         """
-        if self._mqtt is not None:
-            # A client is still connected: disconnect first
-            self._mqtt.disconnect()
-            self._mqtt = None
-
         if properties is None:
-            # Configuration deleted. Stop here
+            # Configuration deleted: release its connection
+            with self.__clients_lock:
+                self.__release(self._clients.pop(conf_pid, None))
             return
 
         # Extract connection properties
         host = properties['host']
-        try:
-            port = int(properties['port'])
-        except (KeyError, ValueError, TypeError):
-            port = 1883
+        port = _to_int(properties.get('port'), 1883)
+        keepalive = _to_int(properties.get('keepalive'), 60)
+
+        ignored = sorted(key for key in properties
+                         if key.startswith('notification.')
+                         or key == 'publish.buffer_size')
+        if ignored:
+            _logger.warning("Properties %s of configuration %s are ignored: "
+                            "they must be set on the MQTT connector instance",
+                            ', '.join(ignored), conf_pid)
+
+        with self.__clients_lock:
+            key = (host, port)
+            old_key = self._clients.get(conf_pid)
+            self._clients[conf_pid] = key
+            if old_key != key:
+                # The server changed (or new configuration)
+                self.__release(old_key)
 
-        try:
-            keepalive = int(properties['keepalive'])
-        except (KeyError, ValueError, TypeError):
-            keepalive = 60
+            try:
+                # Share the connection to the same server
+                client = self._connections[key]
+            except KeyError:
+                client = None
+            else:
+                # Keep the connection
+                client.set_keepalive(keepalive)
+
+            if client is None:
+                # Debug
+                _logger.debug("Connecting to [%s]:%s ...", host, port)
+
+                # Setup the client
+                client = MqttConnection(buffer_size=max(
+                    0, _to_int(self._buffer_size, DEFAULT_BUFFER_SIZE)))
+                client.on_connect = self.__on_connect
+                client.on_message = self.__on_message
+                with self.__topics_lock:
+                    # Subscriptions are sent once connected
+                    for topic in self._topics:
+                        client.subscribe(topic, 0)
+
+                    self._connections[key] = client
+
+                client.connect(host, port, keepalive)
+
+    def __release(self, key):
+        """
+        Disconnects from the given server if no more configuration uses it.
+        Must be called while holding the clients lock.
 
-        # Debug
-        _logger.debug("Connecting to [%s]:%s ...", host, port)
+        :param key: A (host, port) tuple (can be None)
+        """
+        if key is None or key in self._clients.values():
+            # Unknown or still used
+            return
+
+        with self.__topics_lock:
+            client = self._connections.pop(key, None)
 
-        # Setup the client
-        self._mqtt = mqtt.MqttClient()
-        self._mqtt.on_connect = self.__on_connect
-        self._mqtt.on_message = self.__on_message
-        self._mqtt.connect(host, port, keepalive)
+        if client is not None:
+            _logger.debug("Disconnecting from [%s]:%s ...", *key)
+            client.disconnect()
+
+    def __get_client(self, pid):
+        """
+        Returns the connection used by the given configuration
+
+        :param pid: A configuration PID, or None for the first configuration
+        :return: The MQTT connection, or None
+        """
+        with self.__clients_lock:
+            try:
+                if pid is None:
+                    key = next(iter(self._clients.values()))
+                else:
+                    key = self._clients[pid]
+            except (StopIteration, KeyError):
+                return None
+
+            return self._connections.get(key)
+
+    def get_statistics(self):
+        """
+        Returns the statistics of the connector
+
+        :return: A dictionary of counters
+        """
+        with self.__topics_lock:
+            stats = {'cache.size': len(self._cache),
+                     'cache.hits': self._cache.hits,
+                     'cache.misses': self._cache.misses}
+
+        with self.__pool_lock:
+            pools = list(self._lanes.values())
+            if self._pool is not None:
+                pools.append(self._pool)
+
+        stats['lanes'] = len(self._lanes)
+        stats['queue.depth'] = sum(pool.depth for pool in pools)
+        stats['queue.dropped'] = sum(pool.dropped for pool in pools)
+        stats['queue.coalesced'] = sum(pool.coalesced for pool in pools)
+        stats['queue.conflated'] = sum(pool.conflated for pool in pools)
+
+        with self.__clients_lock:
+            clients = list(self._connections.values())
+
+        stats['connections'] = len(clients)
+        stats['publish.buffered'] = sum(client.buffered for client in clients)
+        stats['publish.dropped'] = sum(client.dropped for client in clients)
+        stats['publish.in_flight'] = sum(
+            client.in_flight for client in clients)
+        stats['connection.reconnections'] = sum(
+            client.reconnections for client in clients)
+        stats['connection.ready_delay'] = max(
+            [client.ready_delay for client in clients
+             if client.ready_delay is not None] or [None])
+
+        return stats
+
+    def publish(self, topic, payload, qos=0, retain=False, pid=None):
+        """
+        Publishes an MQTT message. If the client is not connected, the message
+        is sent on the next connection.
+        """
+        self.publish_async(topic, payload, qos, retain, pid)
 
-    def publish(self, topic, payload, qos=0, retain=False):
+    def publish_async(self, topic, payload, qos=0, retain=False, pid=None):
         """
-        Publishes an MQTT message if the client is connected
+        Publishes an MQTT message
+
+        :param topic: Message topic
+        :param payload: Message content
+        :param qos: Quality of Service
+        :param retain: Retain flag
+        :param pid: PID of the configuration of the server to use (default:
+                    the first configured server)
+        :return: A Future object, resolved once the message has been sent
+                 (QoS 0) or acknowledged by the server (QoS 1 and 2)
         """
-        if self._mqtt is not None:
-            self._mqtt.publish(topic, payload, qos, retain)
+        client = self.__get_client(pid)
+        if client is None:
+            return self.__no_client(pid)
+
+        return client.publish(topic, payload, qos, retain)
+
+    @staticmethod
+    def __no_client(pid):
+        """
+        Returns a failed Future, for messages published without client
+
+        :param pid: PID of the requested configuration
+        """
+        future = Future()
+        if pid is None:
+            future.set_exception(IOError("No MQTT server configured"))
+        else:
+            future.set_exception(
+                IOError("Unknown MQTT configuration: {0}".format(pid)))
+        return future
 
     @Validate
     def _validate(self, context):
         """
         Component validated
         """
-        self._context = context
+        # Start the notification pool with the connector properties
+        config = _to_pool_config(
+            self._notification_mode, self._notification_threads,
+            self._notification_queue_size, self._notification_policy)
+        with self.__pool_lock:
+            self._context = context
+            self.__start_pool(config)
 
-        # Start the notification pool
-        self._pool = pelix.threadpool.ThreadPool(
-            2, logname="mqtt-notifications")
-        self._pool.start()
         _logger.info("MQTT connector validated")
 
     @Invalidate
@@ -128,19 +377,67 @@ class MqttConnector(object):
         """
         Component invalidated
         """
-        # Stop the notification pool
-        self._pool.stop()
+        # Stop the notification pool and lanes
+        with self.__pool_lock:
+            if self._pool is not None:
+                self._pool.stop()
+                self._pool = None
 
-        # Disconnect from the server
-        if self._mqtt is not None:
-            self._mqtt.disconnect()
+            for lane in self._lanes.values():
+                lane.stop()
+
+            self._lanes.clear()
+            self._context = None
+
+        # Disconnect from the servers
+        with self.__clients_lock:
+            for client in self._connections.values():
+                client.disconnect()
 
         # Clean up
-        self._mqtt = None
-        self._pool = None
-        self._context = None
+        with self.__clients_lock:
+            self._clients.clear()
+            with self.__topics_lock:
+                self._connections.clear()
+
         _logger.info("MQTT connector invalidated")
 
+    def __start_pool(self, config):
+        """
+        Starts the notification pool or lanes with the given configuration.
+        Must be called while holding the pool lock.
+
+        :param config: A (mode, number of threads, queue size, policy) tuple
+        """
+        _logger.debug("Notification %s: %d threads, queue size: %d, "
+                      "policy: %s", *config)
+        self._pool_config = config
+        mode, nb_threads, queue_size, policy = config
+        if mode == MODE_LANES:
+            # One lane per listener
+            for listener in self._listeners or ():
+                if listener not in self._lanes:
+                    self._lanes[listener] = self.__make_lane(listener)
+        else:
+            # Shared pool
+            self._pool = NotificationPool(nb_threads, queue_size, policy,
+                                          logname="mqtt-notifications")
+            self._pool.start()
+
+    def __make_lane(self, listener):
+        """
+        Prepares and starts the notification lane of a listener
+
+        :param listener: An MQTT listener
+        :return: The started lane
+        """
+        queue_size, policy = self._pool_config[2:]
+        lane = NotificationPool(
+            1, queue_size, policy,
+            logname="mqtt-lane-{0}".format(type(listener).__name__))
+        lane.start()
+        return lane
+
     @BindField('_listeners')
     def _bind_listener(self, field, listener, svc_ref):
         """
@@ -151,6 +448,18 @@ class MqttConnector(object):
         for topic in topics:
             self.__add_listener(topic, listener)
 
+        self.__update_conflated(
+            listener, (), svc_ref.get_property(PROP_MQTT_CONFLATE))
+        self.__update_message_listener(
+            listener, svc_ref.get_property(PROP_MQTT_MESSAGE))
+
+        with self.__pool_lock:
+            if self._context is not None \
+                    and self._pool_config[0] == MODE_LANES \
+                    and listener not in self._lanes:
+                # Give the listener its own lane
+                self._lanes[listener] = self.__make_lane(listener)
+
     @UpdateField('_listeners')
     def _update_listener(self, field, listener, svc_ref, old_props):
         """
@@ -169,6 +478,11 @@ class MqttConnector(object):
         for topic in old_topics.difference(topics):
             self.__remove_listener(topic, listener)
 
+        self.__update_conflated(listener, old_props.get(PROP_MQTT_CONFLATE),
+                                svc_ref.get_property(PROP_MQTT_CONFLATE))
+        self.__update_message_listener(
+            listener, svc_ref.get_property(PROP_MQTT_MESSAGE))
+
     @UnbindField('_listeners')
     def _unbind_listener(self, field, listener, svc_ref):
         """
@@ -179,75 +493,152 @@ class MqttConnector(object):
         for topic in topics:
             self.__remove_listener(topic, listener)
 
+        self.__update_conflated(
+            listener, svc_ref.get_property(PROP_MQTT_CONFLATE), ())
+        self.__update_message_listener(listener, False)
+
+        with self.__pool_lock:
+            lane = self._lanes.pop(listener, None)
+            if lane is not None:
+                lane.stop()
+
     def __add_listener(self, topic, listener):
         """
         Adds a topic listener
         """
-        try:
-            # Get current listeners
-            listeners = self._topics[topic]
-        except KeyError:
-            # New topic: subscribe to it
-            listeners = self._topics[topic] = set()
-            self.__subscribe(topic)
-
-        # Store the listener
-        listeners.add(listener)
+        with self.__topics_lock:
+            # Matching listeners have changed
+            self._cache.clear()
+            if self._topics.add(topic, listener):
+                # New topic: subscribe to it
+                self.__subscribe(topic)
 
     def __remove_listener(self, topic, listener):
         """
         Removes a topic listener
         """
-        try:
-            listeners = self._topics[topic]
-            listeners.remove(listener)
-            if not listeners:
-                # No more reference to the topic, unsubscribe
-                del self._topics[topic]
-                self.__unsubscribe(topic)
-        except KeyError:
-            # Unused topic or listener not registered for it
-            pass
+        with self.__topics_lock:
+            self._cache.clear()
+            try:
+                if self._topics.remove(topic, listener):
+                    # No more reference to the topic, unsubscribe
+                    self.__unsubscribe(topic)
+            except KeyError:
+                # Unused topic or listener not registered for it
+                pass
+
+    def __update_conflated(self, listener, old_filters, new_filters):
+        """
+        Updates the state topics filters of a listener
+
+        :param listener: An MQTT listener
+        :param old_filters: Previous value of the conflation property
+        :param new_filters: New value of the conflation property
+        """
+        old_filters = set(to_iterable(old_filters, False))
+        new_filters = set(to_iterable(new_filters, False))
+        if old_filters == new_filters:
+            # Nothing to do
+            return
+
+        with self.__topics_lock:
+            self._cache.clear()
+            for topic in new_filters.difference(old_filters):
+                self._conflated.add(topic, listener)
+
+            for topic in old_filters.difference(new_filters):
+                try:
+                    self._conflated.remove(topic, listener)
+                except KeyError:
+                    pass
+
+    def __update_message_listener(self, listener, enabled):
+        """
+        Sets whether a listener receives MqttMessage objects or raw payloads
+
+        :param listener: An MQTT listener
+        :param enabled: Value of the message property
+        """
+        with self.__topics_lock:
+            if enabled:
+                self._message_listeners = \
+                    self._message_listeners.union((listener,))
+            elif listener in self._message_listeners:
+                self._message_listeners = \
+                    self._message_listeners.difference((listener,))
 
     def __on_connect(self, client, result_code):
         """
         MQTT Client connected to the server
         """
         if result_code == 0:
-            # Success !
+            # Success ! (the client renews the subscriptions)
             _logger.info("Connected to the MQTT server")
 
-            # Subscribe to topics
-            for topic in self._topics:
-                client.subscribe(topic, 0)
-
     def __on_message(self, client, msg):
         """
         A message has been received from a server
         """
-        try:
-            # Get the topic
-            topic = msg.topic
+        # Get the topic
+        topic = msg.topic
 
-            # Get all listeners matching this topic
-            all_listeners = set()
-            for subscription, listeners in self._topics.items():
-                if mqtt.MqttClient.topic_matches(subscription, topic):
-                    all_listeners.update(listeners)
+        # Wrap the payload once for all listeners: it is decoded on demand
+        message = MqttMessage(topic, msg.payload, msg.qos,
+                              getattr(msg, 'retain', False))
 
+        # Get all listeners matching this topic
+        with self.__topics_lock:
+            try:
+                listeners, conflated = self._cache.get(topic)
+            except KeyError:
+                listeners = self._topics.match(topic)
+                conflated = listeners.intersection(
+                    self._conflated.match(topic))
+                listeners = frozenset(listeners.difference(conflated))
+                conflated = frozenset(conflated)
+                self._cache.put(topic, (listeners, conflated))
+
+        pool = self._pool
+        if pool is not None:
             # Notify them using the pool
-            self._pool.enqueue(self.__notify_listeners, all_listeners,
-                               topic, msg.payload, msg.qos)
-        except KeyError:
-            # No listener for this topic
-            pass
-
-    @staticmethod
-    def __notify_listeners(listeners, topic, payload, qos):
+            if listeners:
+                pool.enqueue(topic, self.__notify_listeners, listeners,
+                             message)
+
+            if conflated:
+                pool.enqueue_latest(topic, self.__notify_listeners, conflated,
+                                    message)
+        else:
+            # Notify each of them in its own lane
+            lanes = self._lanes
+            for listener in listeners:
+                lane = lanes.get(listener)
+                if lane is not None:
+                    lane.enqueue(topic, self.__notify_listeners,
+                                 (listener,), message)
+
+            for listener in conflated:
+                lane = lanes.get(listener)
+                if lane is not None:
+                    lane.enqueue_latest(topic, self.__notify_listeners,
+                                        (listener,), message)
+
+    def __notify_listeners(self, listeners, message):
         """
         Notifies listeners of an MQTT message
+
+        :param listeners: Listeners to notify
+        :param message: The received MqttMessage
         """
+        message_listeners = self._message_listeners
+        topic = message.topic
+        qos = message.qos
         for listener in listeners:
+            if listener in message_listeners:
+                payload = message
+            else:
+                payload = message.raw
+
             try:
                 listener.handle_mqtt_message(topic, payload, qos)
             except Exception as ex:
@@ -255,14 +646,14 @@ class MqttConnector(object):
 
     def __subscribe(self, topic):
         """
-        Subscribes to a topic
+        Subscribes to a topic in all servers
         """
-        if self._mqtt is not None:
-            self._mqtt.subscribe(topic, 0)
+        for client in self._connections.values():
+            client.subscribe(topic, 0)
 
     def __unsubscribe(self, topic):
         """
-        Unsubscribes from a topic
+        Unsubscribes from the topic from all servers
         """
-        if self._mqtt is not None:
-            self._mqtt.unsubscribe(topic)
+        for client in self._connections.values():
+            client.unsubscribe(topic)
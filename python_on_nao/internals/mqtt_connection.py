@@ -0,0 +1,579 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Connection to an MQTT server, with acknowledged and buffered publications
+"""
+
+# MQTT client
+import paho.mqtt.client as paho
+
+# Local module
+from internals.futures import Future
+
+# Pelix
+import pelix.misc.mqtt_client
+
+# Standard library
+import collections
+import logging
+import random
+import threading
+import time
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_BUFFER_SIZE = 100
+""" Default maximum number of messages kept while disconnected """
+
+LOOP_TIMEOUT = 1.
+""" Maximum time (in seconds) spent waiting for network activity per loop """
+
+# ------------------------------------------------------------------------------
+
+
+class Backoff(object):
+    """
+    Computes jittered and exponentially growing delays between reconnection
+    attempts
+    """
+    def __init__(self, min_delay=.5, max_delay=30., factor=2., jitter=.5):
+        """
+        Sets up members
+
+        :param min_delay: Delay before the first attempt (in seconds)
+        :param max_delay: Maximum delay between two attempts (in seconds)
+        :param factor: Growth factor of the delay after each failed attempt
+        :param jitter: Part of the delay which is randomized (between 0 and 1)
+        """
+        self._min_delay = min_delay
+        self._max_delay = max_delay
+        self._factor = factor
+        self._jitter = jitter
+        self.attempts = 0
+
+    def next_delay(self):
+        """
+        Returns the delay to wait before the next attempt
+
+        :return: A delay in seconds
+        """
+        delay = min(self._max_delay,
+                    self._min_delay * (self._factor ** self.attempts))
+        self.attempts += 1
+        return delay * (1. - self._jitter * random.random())
+
+    def reset(self):
+        """
+        Resets the delay to its minimum, after a successful attempt
+        """
+        self.attempts = 0
+
+# ------------------------------------------------------------------------------
+
+
+class MqttConnection(object):
+    """
+    Connection to an MQTT server, based on the Paho client.
+
+    Publications return a Future, which is resolved once the server has
+    acknowledged the message (QoS 1 and 2) or once it has been sent (QoS 0).
+    Messages published while disconnected are kept in a bounded buffer and
+    sent on the next connection, before the messages published meanwhile.
+    QoS 1 and 2 messages published while the
+    connection is being lost are left to Paho, which sends them again after
+    reconnection.
+
+    The connection is handled by a loop thread, which reconnects to the server
+    with a jittered exponential backoff. Subscriptions are stored and replayed
+    in a single SUBSCRIBE packet on each connection.
+    """
+    def __init__(self, client_id=None, buffer_size=DEFAULT_BUFFER_SIZE):
+        """
+        Sets up members
+
+        :param client_id: ID of the MQTT client (generated if None)
+        :param buffer_size: Maximum number of messages kept while disconnected
+        """
+        self._client_id = client_id \
+            or pelix.misc.mqtt_client.MqttClient.generate_id()
+        self._buffer_size = max(0, buffer_size)
+
+        # Connection state
+        self.__lock = threading.Lock()
+        self.__connected = False
+
+        # Publications waiting for their acknowledgement (mid -> Future)
+        self.__in_flight = {}
+
+        # Acknowledgements received before the publication was stored
+        self.__early_acks = set()
+
+        # Messages waiting for a connection:
+        # (topic, payload, qos, retain, Future)
+        self.__buffer = collections.deque()
+
+        # New publications wait behind the buffered ones while it is sent
+        self.__flushing = False
+
+        # Subscriptions to replay on connection (topic -> qos)
+        self.__subscriptions = {}
+
+        # ID of the replay subscription packet
+        self.__replay_mid = None
+
+        # Server address
+        self.__host = None
+        self.__port = None
+
+        # Keep alive period to use on the next connection, if changed
+        self.__keepalive = None
+        self.__pending_keepalive = None
+
+        # Loop thread
+        self.__thread = None
+        self.__stop_event = threading.Event()
+        self.__backoff = Backoff()
+
+        # Time of the beginning of the (re)connection
+        self.__lost_time = None
+
+        # Statistics
+        self.dropped = 0
+        self.reconnections = 0
+        self.ready_delay = None
+
+        # MQTT client
+        self.__mqtt = paho.Client(self._client_id)
+
+        # Paho callbacks
+        self.__mqtt.on_connect = self.__on_connect
+        self.__mqtt.on_disconnect = self.__on_disconnect
+        self.__mqtt.on_message = self.__on_message
+        self.__mqtt.on_publish = self.__on_publish
+        self.__mqtt.on_subscribe = self.__on_subscribe
+
+        # User callbacks
+        self.on_connect = None
+        self.on_disconnect = None
+        self.on_message = None
+
+    @property
+    def client_id(self):
+        """
+        The MQTT client ID
+        """
+        return self._client_id
+
+    @property
+    def connected(self):
+        """
+        True if the client is connected to the server
+        """
+        return self.__connected
+
+    @property
+    def buffered(self):
+        """
+        The number of messages waiting for a connection
+        """
+        return len(self.__buffer)
+
+    @property
+    def in_flight(self):
+        """
+        The number of publications waiting for their acknowledgement
+        """
+        return len(self.__in_flight)
+
+    def connect(self, host="localhost", port=1883, keepalive=60):
+        """
+        Connects to the MQTT server. The client will automatically try to
+        reconnect to this server when the connection is lost.
+
+        :param host: MQTT server host
+        :param port: MQTT server port
+        :param keepalive: Maximum period in seconds between communications with
+                          the broker
+        :raise ValueError: Invalid host or port
+        """
+        # Prepare the connection
+        self.__mqtt.connect_async(host, port, keepalive)
+        self.__host = host
+        self.__port = port
+        self.__keepalive = keepalive
+        self.__pending_keepalive = None
+
+        # Start the loop thread, which connects to the server
+        self.__lost_time = time.time()
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(
+            target=self.__loop, name="mqtt-loop-{0}".format(self._client_id))
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def set_keepalive(self, keepalive):
+        """
+        Changes the keep alive period without closing the current connection.
+        The new value is stored and only applied when the loop thread has to
+        reconnect to the server.
+
+        :param keepalive: Maximum period in seconds between communications with
+                          the broker
+        """
+        with self.__lock:
+            if keepalive == self.__keepalive:
+                # Back to the current value
+                self.__pending_keepalive = None
+            else:
+                self.__pending_keepalive = keepalive
+
+    def __apply_keepalive(self):
+        """
+        Applies the pending keep alive period, if any, before a reconnection.
+        Changing the connection parameters of a connected Paho client would
+        make it close the connection.
+        """
+        with self.__lock:
+            keepalive = self.__pending_keepalive
+            self.__pending_keepalive = None
+
+        if keepalive is not None:
+            self.__mqtt.connect_async(self.__host, self.__port, keepalive)
+            self.__keepalive = keepalive
+
+    def disconnect(self):
+        """
+        Disconnects from the MQTT server. Pending publications fail.
+        """
+        # Stop the loop thread
+        self.__stop_event.set()
+
+        # Disconnect from the server
+        self.__mqtt.disconnect()
+
+        if self.__thread is not None \
+                and self.__thread is not threading.current_thread():
+            self.__thread.join()
+        self.__thread = None
+
+        with self.__lock:
+            self.__connected = False
+            futures = list(self.__in_flight.values())
+            futures.extend(message[4] for message in self.__buffer)
+            self.__in_flight.clear()
+            self.__early_acks.clear()
+            self.__buffer.clear()
+
+        for future in futures:
+            future.set_exception(IOError("Disconnected from the MQTT server"))
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        """
+        Sends a message through the MQTT connection, or stores it until the
+        connection is established
+
+        :param topic: Message topic
+        :param payload: Message content
+        :param qos: Quality of Service
+        :param retain: Retain flag
+        :return: A Future object, resolved with the local message ID once the
+                 message has been published
+        """
+        future = Future()
+        self.__publish(topic, payload, qos, retain, future)
+        return future
+
+    def subscribe(self, topic, qos=0):
+        """
+        Subscribes to a topic on the server. The subscription is renewed on
+        each connection.
+
+        :param topic: Topic filter string
+        :param qos: Desired quality of service
+        :raise ValueError: Invalid topic or QoS
+        """
+        with self.__lock:
+            self.__subscriptions[topic] = qos
+
+        if self.__connected:
+            self.__mqtt.subscribe(topic, qos)
+
+    def unsubscribe(self, topic):
+        """
+        Unsubscribes from a topic on the server
+
+        :param topic: Topic filter string
+        :raise ValueError: Invalid topic parameter
+        """
+        with self.__lock:
+            self.__subscriptions.pop(topic, None)
+
+        if self.__connected:
+            self.__mqtt.unsubscribe(topic)
+
+    def __loop(self):
+        """
+        Loop thread: handles network events and (re)connections
+        """
+        connect = True
+        while not self.__stop_event.is_set():
+            if connect:
+                try:
+                    self.__apply_keepalive()
+                    result_code = self.__mqtt.reconnect()
+                    if result_code:
+                        _logger.error("Error connecting the MQTT server: "
+                                      "%s (%s)", result_code,
+                                      paho.error_string(result_code))
+                except Exception as ex:
+                    _logger.error("Exception connecting server: %s", ex)
+                    result_code = paho.MQTT_ERR_NO_CONN
+
+                connect = bool(result_code)
+            else:
+                # Handle network events
+                result_code = self.__mqtt.loop(LOOP_TIMEOUT)
+                if result_code and not self.__stop_event.is_set():
+                    # Connection lost
+                    _logger.warning("MQTT connection lost: %s",
+                                    paho.error_string(result_code))
+                    with self.__lock:
+                        self.__connected = False
+
+                    self.reconnections += 1
+                    self.__lost_time = time.time()
+                    connect = True
+
+            if connect:
+                # Wait before the next attempt
+                delay = self.__backoff.next_delay()
+                _logger.debug("Reconnecting in %.2fs", delay)
+                self.__stop_event.wait(delay)
+
+    def __publish(self, topic, payload, qos, retain, future):
+        """
+        Sends a message, or buffers it if the client is not connected or if
+        the buffered messages are being sent
+
+        :param topic: Message topic
+        :param payload: Message content
+        :param qos: Quality of Service
+        :param retain: Retain flag
+        :param future: Future object associated to the message
+        """
+        self.__store((topic, payload, qos, retain, future))
+
+    def __send(self, message):
+        """
+        Sends a message through the Paho client
+
+        :param message: A (topic, payload, qos, retain, future) tuple
+        """
+        topic, payload, qos, retain, future = message
+
+        # Don't hold the lock while calling Paho: it holds its own locks when
+        # calling __on_publish
+        result = self.__mqtt.publish(topic, payload, qos, retain)
+        result_code, mid = result[0], result[1]
+        if result_code == paho.MQTT_ERR_NO_CONN and not qos:
+            # Connection lost in the meantime: send it first on reconnection
+            self.__store(message, True)
+        elif result_code and result_code != paho.MQTT_ERR_NO_CONN:
+            future.set_exception(
+                IOError("Error publishing on {0}: {1}"
+                        .format(topic, paho.error_string(result_code))))
+        else:
+            # Sent, or queued by Paho for QoS 1 and 2 messages: it will send
+            # them again after reconnection
+            with self.__lock:
+                try:
+                    # Already acknowledged
+                    self.__early_acks.remove(mid)
+                except KeyError:
+                    self.__in_flight[mid] = future
+                    return
+
+            future.set_result(mid)
+
+    def __store(self, message, retry=False):
+        """
+        Sends a message if possible, else stores it until the next connection,
+        dropping the oldest buffered message if the buffer is full
+
+        :param message: A (topic, payload, qos, retain, future) tuple
+        :param retry: If True, the message couldn't be sent: it is stored
+                      before the other buffered messages
+        """
+        dropped = None
+        flush = False
+        with self.__lock:
+            send = self.__connected and not self.__flushing and not retry
+            if not send:
+                if retry:
+                    self.__buffer.appendleft(message)
+
+                    if self.__connected and not self.__flushing:
+                        # Reconnected in the meantime: send the buffer again
+                        flush = self.__flushing = True
+                else:
+                    self.__buffer.append(message)
+
+                if len(self.__buffer) > self._buffer_size:
+                    dropped = self.__buffer.popleft()
+
+        if send:
+            self.__send(message)
+        elif dropped is not None:
+            self.dropped += 1
+            dropped[4].set_exception(
+                IOError("Not connected: message on {0} dropped"
+                        .format(dropped[0])))
+
+        if flush:
+            self.__flush()
+
+    def __flush(self):
+        """
+        Sends the messages stored while disconnected, in order. Messages
+        published meanwhile are stored after them.
+        """
+        count = 0
+        while True:
+            with self.__lock:
+                if not self.__buffer or not self.__connected:
+                    # Done, or connection lost again
+                    self.__flushing = False
+                    break
+
+                message = self.__buffer.popleft()
+
+            self.__send(message)
+            count += 1
+
+        if count:
+            _logger.debug("Sent %d buffered messages", count)
+
+    def __on_connect(self, client, userdata, flags, result_code):
+        """
+        Client connected to the server
+
+        :param client: Connected Paho client
+        :param userdata: User data (unused)
+        :param flags: Response flags sent by the server
+        :param result_code: Connection result code (0: success, others: error)
+        """
+        if result_code:
+            # result_code != 0: something wrong happened
+            _logger.error("Error connecting the MQTT server: %s",
+                          paho.connack_string(result_code))
+        else:
+            self.__backoff.reset()
+            with self.__lock:
+                self.__connected = True
+                self.__flushing = bool(self.__buffer)
+                topics = list(self.__subscriptions.items())
+
+            if topics:
+                # Renew all subscriptions at once
+                self.__replay_mid = self.__mqtt.subscribe(topics)[1]
+            else:
+                self.__set_ready()
+
+        # Notify the caller, if any
+        if self.on_connect is not None:
+            try:
+                self.on_connect(self, result_code)
+            except Exception as ex:
+                _logger.exception("Error notifying MQTT listener: %s", ex)
+
+        if not result_code:
+            # Send the messages published while disconnected
+            self.__flush()
+
+    def __on_subscribe(self, client, userdata, mid, granted_qos):
+        """
+        The server acknowledged a subscription
+
+        :param client: Client which subscribed
+        :param userdata: User data (unused)
+        :param mid: Local message ID
+        :param granted_qos: QoS granted for each topic of the subscription
+        """
+        if mid == self.__replay_mid:
+            # All subscriptions have been renewed
+            self.__replay_mid = None
+            self.__set_ready()
+
+    def __set_ready(self):
+        """
+        The connection is established and subscriptions are renewed
+        """
+        if self.__lost_time is not None:
+            self.ready_delay = time.time() - self.__lost_time
+            self.__lost_time = None
+            _logger.info("MQTT connection ready after %.3fs",
+                         self.ready_delay)
+
+    def __on_disconnect(self, client, userdata, result_code):
+        """
+        Client has been disconnected from the server
+
+        :param client: Client that received the message
+        :param userdata: User data (unused)
+        :param result_code: Disconnection reason (0: expected, 1: error)
+        """
+        with self.__lock:
+            self.__connected = False
+
+        if result_code:
+            # rc != 0: unexpected disconnection
+            _logger.error("Unexpected disconnection from the MQTT server")
+
+        # Notify the caller, if any
+        if self.on_disconnect is not None:
+            try:
+                self.on_disconnect(self, result_code)
+            except Exception as ex:
+                _logger.exception("Error notifying MQTT listener: %s", ex)
+
+    def __on_message(self, client, userdata, msg):
+        """
+        A message has been received from a server
+
+        :param client: Client that received the message
+        :param userdata: User data (unused)
+        :param msg: A MQTTMessage bean
+        """
+        # Notify the caller, if any
+        if self.on_message is not None:
+            try:
+                self.on_message(self, msg)
+            except Exception as ex:
+                _logger.exception("Error notifying MQTT listener: %s", ex)
+
+    def __on_publish(self, client, userdata, mid):
+        """
+        A message has been sent (QoS 0) or acknowledged by the server
+
+        :param client: Client that sent the message
+        :param userdata: User data (unused)
+        :param mid: Local message ID
+        """
+        with self.__lock:
+            try:
+                future = self.__in_flight.pop(mid)
+            except KeyError:
+                # publish() didn't store the message yet
+                self.__early_acks.add(mid)
+                return
+
+        future.set_result(mid)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+MQTT message given to the listeners, decoding its payload on demand
+"""
+
+# Standard library
+import json
+import threading
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+_MISSING = object()
+""" Marker of a form which hasn't been decoded yet """
+
+# ------------------------------------------------------------------------------
+
+
+class MqttMessage(object):
+    """
+    A received MQTT message, shared by all its listeners.
+
+    The payload is given as a read-only memoryview, without copy. Its decoded
+    forms (text, float, JSON) are computed on first access, then cached: each
+    form is decoded at most once, whatever the number of listeners.
+    """
+    __slots__ = ('topic', 'qos', 'retain', '_raw', '_text', '_float', '_json',
+                 '_lock')
+
+    def __init__(self, topic, payload, qos=0, retain=False):
+        """
+        Sets up members
+
+        :param topic: Message topic
+        :param payload: Raw message content (bytes)
+        :param qos: Quality of Service
+        :param retain: Retain flag
+        """
+        self.topic = topic
+        self.qos = qos
+        self.retain = retain
+        self._raw = payload
+
+        # Decoded forms
+        self._text = _MISSING
+        self._float = _MISSING
+        self._json = _MISSING
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Returns the size of the payload, in bytes
+        """
+        return len(self._raw)
+
+    def __repr__(self):
+        """
+        String representation
+        """
+        return "MqttMessage({0!r}, {1!r}, qos={2})" \
+            .format(self.topic, self._raw, self.qos)
+
+    @property
+    def payload(self):
+        """
+        A read-only view on the raw payload
+        """
+        return memoryview(self._raw)
+
+    @property
+    def raw(self):
+        """
+        The raw payload, as received
+        """
+        return self._raw
+
+    @property
+    def text(self):
+        """
+        The payload decoded as UTF-8 text
+
+        :raise UnicodeDecodeError: Invalid UTF-8 payload
+        """
+        if self._text is _MISSING:
+            with self._lock:
+                if self._text is _MISSING:
+                    try:
+                        self._text = self._raw.decode('utf-8')
+                    except UnicodeDecodeError as ex:
+                        self._text = ex
+
+        return self.__value(self._text)
+
+    @property
+    def float(self):
+        """
+        The payload parsed as a floating point number
+
+        :raise ValueError: The payload is not a number
+        """
+        if self._float is _MISSING:
+            text = self.text
+            with self._lock:
+                if self._float is _MISSING:
+                    try:
+                        self._float = float(text)
+                    except ValueError as ex:
+                        self._float = ex
+
+        return self.__value(self._float)
+
+    @property
+    def json(self):
+        """
+        The payload parsed as JSON. The returned object is shared with the
+        other listeners: it must not be modified.
+
+        :raise ValueError: The payload is not valid JSON
+        """
+        if self._json is _MISSING:
+            text = self.text
+            with self._lock:
+                if self._json is _MISSING:
+                    try:
+                        self._json = json.loads(text)
+                    except ValueError as ex:
+                        self._json = ex
+
+        return self.__value(self._json)
+
+    @staticmethod
+    def __value(value):
+        """
+        Returns a cached decoded value, or raises the cached decoding error
+
+        :param value: A cached value or exception
+        :return: The value
+        :raise ValueError: The decoding error
+        """
+        if isinstance(value, ValueError):
+            raise value
+
+        return value
@@ -0,0 +1,254 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+MQTT topics subscription index
+"""
+
+# Standard library
+import collections
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+WILDCARD_SINGLE = '+'
+""" Single-level wildcard """
+
+WILDCARD_MULTI = '#'
+""" Multi-level wildcard """
+
+DEFAULT_CACHE_SIZE = 64
+""" Default number of topics kept in the listeners cache """
+
+# ------------------------------------------------------------------------------
+
+
+class _TopicNode(object):
+    """
+    A level in the topics tree
+    """
+    __slots__ = ('children', 'listeners')
+
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # Sub-levels: level name -> _TopicNode
+        self.children = {}
+
+        # Listeners of the subscription ending at this level
+        self.listeners = set()
+
+
+class TopicTree(object):
+    """
+    Subscription index: a tree of topic levels, handling the MQTT wildcards.
+    Looking for the listeners of a topic costs O(topic depth), whatever the
+    number of subscriptions.
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # Root of the tree
+        self._root = _TopicNode()
+
+        # Subscriptions filters (filter -> node)
+        self._subscriptions = {}
+
+    def __contains__(self, subscription):
+        """
+        Checks if the given subscription filter is known
+        """
+        return subscription in self._subscriptions
+
+    def __iter__(self):
+        """
+        Iterates over the known subscription filters
+        """
+        return iter(list(self._subscriptions))
+
+    def __len__(self):
+        """
+        Returns the number of known subscription filters
+        """
+        return len(self._subscriptions)
+
+    def add(self, subscription, listener):
+        """
+        Adds a listener to a subscription filter
+
+        :param subscription: A MQTT subscription filter
+        :param listener: The listener of this subscription
+        :return: True if the subscription filter is new
+        """
+        try:
+            node = self._subscriptions[subscription]
+            new = False
+        except KeyError:
+            # New subscription: create its branch
+            node = self._root
+            for level in subscription.split('/'):
+                try:
+                    node = node.children[level]
+                except KeyError:
+                    child = _TopicNode()
+                    node.children[level] = child
+                    node = child
+
+            self._subscriptions[subscription] = node
+            new = True
+
+        node.listeners.add(listener)
+        return new
+
+    def remove(self, subscription, listener):
+        """
+        Removes a listener of a subscription filter
+
+        :param subscription: A MQTT subscription filter
+        :param listener: The listener of this subscription
+        :return: True if the subscription filter has no more listener
+        :raise KeyError: Unknown subscription or listener
+        """
+        node = self._subscriptions[subscription]
+        node.listeners.remove(listener)
+        if node.listeners:
+            # Still in use
+            return False
+
+        # Forget the subscription and prune its empty levels
+        del self._subscriptions[subscription]
+
+        path = [self._root]
+        levels = subscription.split('/')
+        for level in levels[:-1]:
+            path.append(path[-1].children[level])
+
+        for parent, level in zip(reversed(path), reversed(levels)):
+            child = parent.children[level]
+            if child.children or child.listeners:
+                # Level still used by another subscription
+                break
+
+            del parent.children[level]
+
+        return True
+
+    def match(self, topic):
+        """
+        Returns the listeners of all the subscriptions matching the given topic
+
+        :param topic: A MQTT topic (without wildcard)
+        :return: A set of listeners
+        """
+        result = set()
+
+        # Topics starting with '$' are not matched by root wildcards
+        system = topic.startswith('$')
+
+        nodes = [self._root]
+        for level in topic.split('/'):
+            next_nodes = []
+            for node in nodes:
+                children = node.children
+                if not system or node is not self._root:
+                    wildcard = children.get(WILDCARD_MULTI)
+                    if wildcard is not None:
+                        # '#' matches all the remaining levels
+                        result.update(wildcard.listeners)
+
+                    wildcard = children.get(WILDCARD_SINGLE)
+                    if wildcard is not None:
+                        next_nodes.append(wildcard)
+
+                child = children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+
+            nodes = next_nodes
+            if not nodes:
+                # No more candidates
+                return result
+
+        for node in nodes:
+            # Subscriptions ending at this level
+            result.update(node.listeners)
+
+            # "a/#" also matches "a"
+            wildcard = node.children.get(WILDCARD_MULTI)
+            if wildcard is not None:
+                result.update(wildcard.listeners)
+
+        return result
+
+
+class ListenersCache(object):
+    """
+    LRU cache associating a concrete topic to the frozen set of its listeners
+    """
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        """
+        Sets up members
+
+        :param max_size: Maximum number of topics kept in cache
+        """
+        self._max_size = max(1, max_size)
+
+        # Topic -> frozenset(listeners), in usage order
+        self._entries = collections.OrderedDict()
+
+        # Statistics
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """
+        Returns the number of cached topics
+        """
+        return len(self._entries)
+
+    def get(self, topic):
+        """
+        Returns the cached listeners of the given topic
+
+        :param topic: A MQTT topic
+        :return: The frozen set of listeners of the topic
+        :raise KeyError: Topic not in cache
+        """
+        try:
+            # Pop then store the entry, to mark it as the most recent one
+            listeners = self._entries.pop(topic)
+        except KeyError:
+            self.misses += 1
+            raise
+
+        self._entries[topic] = listeners
+        self.hits += 1
+        return listeners
+
+    def put(self, topic, listeners):
+        """
+        Stores the listeners of a topic, evicting the least recently used
+        entry if necessary
+
+        :param topic: A MQTT topic
+        :param listeners: The frozen set of listeners of the topic
+        """
+        self._entries.pop(topic, None)
+        self._entries[topic] = listeners
+        if len(self._entries) > self._max_size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Invalidates the whole cache
+        """
+        self._entries.clear()
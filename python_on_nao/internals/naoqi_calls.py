@@ -0,0 +1,526 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Shared NAOqi call service: executes the calls to the NAOqi modules in a
+worker pool, limiting the number of concurrent calls per module
+"""
+
+# Local module
+from internals.futures import Future
+import internals.constants as constants
+
+# Pelix
+from pelix.ipopo.decorators import ComponentFactory, Instantiate, Provides, \
+    Requires, Property, Validate, Invalidate
+
+# Standard library
+import collections
+import functools
+import logging
+import threading
+import time
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_THREADS = 4
+""" Default number of worker threads """
+
+DEFAULT_MODULE_LIMIT = 2
+""" Default maximum number of concurrent calls per NAOqi module """
+
+DEFAULT_LIMITS = {'ALBehaviorManager': 4,
+                  'ALTextToSpeech': 4}
+"""
+Maximum number of concurrent calls of specific modules. Long behaviours (face
+tracking, ...) can run in background, and the voice parameters are queried
+while a sentence is said.
+"""
+
+WAIT_TIMEOUT = 3.
+"""
+Maximum time a worker waits for the end of a posted task (in seconds). Longer
+tasks are then checked by the monitor thread.
+"""
+
+POLL_MIN = .1
+""" Initial interval between two checks of a long posted task (in seconds) """
+
+POLL_MAX = 1.
+""" Maximum interval between two checks of a long posted task (in seconds) """
+
+# ------------------------------------------------------------------------------
+
+
+class _Call(object):
+    """
+    A call to a NAOqi module
+    """
+    __slots__ = ('module', 'method', 'args', 'posted', 'deadline', 'future',
+                 'task_id', 'stopped', 'next_check', 'interval')
+
+    def __init__(self, module, method, args, posted, timeout):
+        """
+        Sets up members
+
+        :param module: Name of the NAOqi module
+        :param method: Name of the method to call
+        :param args: Arguments of the method
+        :param posted: If True, the method is called with ``post``
+        :param timeout: Maximum duration of the call, since its submission
+                        (in seconds, None for no limit)
+        """
+        self.module = module
+        self.method = method
+        self.args = args
+        self.posted = posted
+        if timeout is None:
+            self.deadline = None
+        else:
+            self.deadline = time.time() + timeout
+        self.future = Future()
+
+        # ID of the posted task, and stop() flag
+        self.task_id = None
+        self.stopped = False
+
+        # Next check of a long posted task by the monitor
+        self.next_check = None
+        self.interval = POLL_MIN
+
+    def __str__(self):
+        """
+        String representation
+        """
+        return "{0}.{1}".format(self.module, self.method)
+
+
+@ComponentFactory('nao-naoqi-calls')
+@Provides(constants.SERVICE_NAOQI_CALLS)
+@Requires('_pool', constants.SERVICE_NAOQI_PROXIES)
+@Property('_nb_threads', 'calls.threads', DEFAULT_THREADS)
+@Property('_module_limit', 'calls.module_limit', DEFAULT_MODULE_LIMIT)
+@Property('_limits', 'calls.limits', DEFAULT_LIMITS)
+@Instantiate('nao-naoqi-calls')
+class NaoCalls(object):
+    """
+    Executes NAOqi calls out of the threads of the callers.
+
+    Synchronous calls are executed by the workers. Posted calls are waited
+    for by a worker with ``wait()``, up to WAIT_TIMEOUT: longer tasks are then
+    checked by a monitor thread, less and less often, and stopped on timeout.
+
+    A call uses a slot of its module from its start to its end. A synchronous
+    call can't be interrupted: on timeout, its future is resolved with an
+    error, but it keeps its slot until the NAOqi method returns.
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # Injected proxies pool
+        self._pool = None
+
+        # Properties
+        self._nb_threads = DEFAULT_THREADS
+        self._module_limit = DEFAULT_MODULE_LIMIT
+        self._limits = DEFAULT_LIMITS
+
+        # Waiting calls
+        self._queue = collections.deque()
+
+        # Module -> number of running calls
+        self._running = {}
+
+        # Running calls (synchronous and posted ones)
+        self._calls = set()
+
+        # Long posted tasks, checked by the monitor
+        self._watched = set()
+
+        # Counters
+        self._stats = {'calls': 0, 'posted': 0, 'timeouts': 0, 'errors': 0}
+
+        # Workers and monitor threads
+        self._threads = []
+        self._active = False
+        self.__condition = threading.Condition()
+
+    @Validate
+    def _validate(self, context):
+        """
+        Component validated
+        """
+        with self.__condition:
+            self._active = True
+
+        targets = [self.__run] * max(1, int(self._nb_threads))
+        targets.append(self.__monitor)
+        for idx, target in enumerate(targets):
+            thread = threading.Thread(target=target,
+                                      name="naoqi-calls-{0}".format(idx + 1))
+            thread.daemon = True
+            self._threads.append(thread)
+            thread.start()
+
+    @Invalidate
+    def _invalidate(self, context):
+        """
+        Component invalidated
+        """
+        with self.__condition:
+            self._active = False
+            pending = list(self._queue)
+            posted = [call for call in self._calls
+                      if call.task_id is not None]
+            self._queue.clear()
+            self.__condition.notify_all()
+
+        # Fail the waiting calls
+        for call in pending:
+            call.future.set_exception(IOError("NAOqi call service stopped"))
+
+        # Stop the posted tasks: the monitor has stopped
+        for call in posted:
+            self.__stop_task(call)
+            call.future.set_result(False)
+
+        for thread in self._threads:
+            thread.join(1)
+
+        # Clean up
+        del self._threads[:]
+        self._calls.clear()
+        self._watched.clear()
+        self._running.clear()
+
+    def get_statistics(self):
+        """
+        Returns the calls statistics
+
+        :return: A dictionary of counters
+        """
+        with self.__condition:
+            stats = self._stats.copy()
+            stats['pending'] = len(self._queue)
+            stats['running'] = len(self._calls)
+
+        return stats
+
+    def call(self, module, method, *args, **kwargs):
+        """
+        Calls a method of a NAOqi module in a worker thread
+
+        :param module: Name of the NAOqi module
+        :param method: Name of the method
+        :param args: Arguments of the method
+        :param timeout: Maximum duration of the call, since now (keyword
+                        argument, in seconds, None for no limit)
+        :return: A Future object, resolved with the result of the method. On
+                 timeout, it is resolved with an OSError, but the call keeps
+                 its module slot until the method returns. Only waiting calls
+                 can be cancelled: their future is resolved with None.
+        """
+        return self.__submit(module, method, args, False, kwargs)
+
+    def post(self, module, method, *args, **kwargs):
+        """
+        Calls a method of a NAOqi module with ``post``, which returns the ID
+        of the NAOqi task executing it
+
+        :param module: Name of the NAOqi module
+        :param method: Name of the method
+        :param args: Arguments of the method
+        :param timeout: Maximum duration of the task, since now (keyword
+                        argument, in seconds, None for no limit). The task is
+                        stopped on timeout.
+        :return: A Future object, resolved with True at the end of the task,
+                 or with False if it has been cancelled. On timeout, it is
+                 resolved with an OSError.
+        """
+        return self.__submit(module, method, args, True, kwargs)
+
+    def __submit(self, module, method, args, posted, kwargs):
+        """
+        Enqueues a call
+
+        :return: The Future object of the call
+        :raise TypeError: Unknown keyword argument
+        """
+        timeout = kwargs.pop('timeout', None)
+        if kwargs:
+            raise TypeError("Unexpected keyword arguments: {0}"
+                            .format(', '.join(kwargs)))
+
+        call = _Call(module, method, args, posted, timeout)
+        call.future.set_canceller(functools.partial(self.__cancel, call))
+        with self.__condition:
+            if self._active:
+                self._queue.append(call)
+                self.__condition.notify_all()
+                return call.future
+
+        call.future.set_exception(IOError("NAOqi call service stopped"))
+        return call.future
+
+    def __cancel(self, call):
+        """
+        Cancels a call: removes it from the queue or stops its task
+
+        :param call: The call to cancel
+        :return: False if the call can't be cancelled
+        """
+        with self.__condition:
+            try:
+                self._queue.remove(call)
+            except ValueError:
+                # Running call
+                if not call.posted:
+                    # Synchronous calls can't be interrupted
+                    return False
+
+                call.stopped = True
+                if call.task_id is None:
+                    # Being posted: the worker will stop it
+                    return True
+            else:
+                # Not yet started
+                call.future.set_result(False if call.posted else None)
+                return True
+
+        self.__stop_task(call)
+        return True
+
+    def __get_limit(self, module):
+        """
+        Returns the maximum number of concurrent calls of a module
+        """
+        try:
+            return max(1, int(self._limits[module]))
+        except (KeyError, TypeError):
+            return max(1, int(self._module_limit))
+
+    def __next_call(self):
+        """
+        Waits for a call whose module has a free slot, and reserves this slot
+
+        :return: The call to execute, or None if the service is stopped
+        """
+        with self.__condition:
+            while self._active:
+                for call in self._queue:
+                    running = self._running.get(call.module, 0)
+                    if running < self.__get_limit(call.module):
+                        self._queue.remove(call)
+                        self._running[call.module] = running + 1
+                        self._calls.add(call)
+                        return call
+
+                self.__condition.wait()
+
+    def __release(self, call):
+        """
+        Releases the module slot of a call. Must be called while holding the
+        lock.
+        """
+        if call in self._calls:
+            self._calls.remove(call)
+            self._running[call.module] -= 1
+            self.__condition.notify_all()
+
+    def __run(self):
+        """
+        Worker: executes the calls
+        """
+        while True:
+            call = self.__next_call()
+            if call is None:
+                return
+
+            try:
+                proxy = self._pool.get_proxy(call.module)
+                if call.posted:
+                    task_id = getattr(proxy.post, call.method)(*call.args)
+                    with self.__condition:
+                        call.task_id = task_id
+                        self._stats['posted'] += 1
+                        stop = call.stopped or not self._active
+
+                    if stop:
+                        # Cancelled or service stopped while posting
+                        call.stopped = True
+                        self.__stop_task(call)
+
+                    self.__wait_task(proxy, call)
+                    continue
+
+                result = getattr(proxy, call.method)(*call.args)
+            except Exception as ex:
+                _logger.warning("Error calling %s: %s", call, ex)
+                self.__discard(call, ex)
+                with self.__condition:
+                    self._stats['errors'] += 1
+                    self.__release(call)
+                call.future.set_exception(ex)
+            else:
+                with self.__condition:
+                    self._stats['calls'] += 1
+                    self.__release(call)
+                call.future.set_result(result)
+
+    def __discard(self, call, error):
+        """
+        Forgets the proxy used by a call which failed with a NAOqi error
+        (RuntimeError): it might have lost its connection to the module.
+
+        :param call: The failed call
+        :param error: The exception raised by the call
+        """
+        if isinstance(error, RuntimeError):
+            self._pool.discard(call.module)
+
+    def __stop_task(self, call):
+        """
+        Stops the posted task of a call
+        """
+        try:
+            self._pool.get_proxy(call.module).stop(call.task_id)
+        except Exception as ex:
+            _logger.debug("Error stopping %s: %s", call, ex)
+
+    def __finish_task(self, call):
+        """
+        Releases the slot of a posted call whose task has ended, and resolves
+        its future
+        """
+        with self.__condition:
+            self._watched.discard(call)
+            self.__release(call)
+
+        call.future.set_result(not call.stopped)
+
+    def __expire_task(self, call):
+        """
+        Stops the posted task of a call which timed out
+        """
+        self.__stop_task(call)
+        with self.__condition:
+            self._watched.discard(call)
+            self.__release(call)
+
+        self.__timeout(call)
+
+    def __wait_task(self, proxy, call):
+        """
+        Waits for the end of a posted task, up to WAIT_TIMEOUT, then lets the
+        monitor check it
+
+        :param proxy: Proxy to the module executing the task
+        :param call: The posted call
+        """
+        timeout = WAIT_TIMEOUT
+        if call.deadline is not None:
+            timeout = min(timeout, call.deadline - time.time())
+
+        # wait() returns True if the task is still running after the timeout
+        # (in milliseconds, 0 meaning forever)
+        if timeout <= 0 \
+                or proxy.wait(call.task_id, max(1, int(timeout * 1000))):
+            if call.deadline is not None and call.deadline <= time.time():
+                self.__expire_task(call)
+                return
+
+            with self.__condition:
+                if self._active:
+                    # Long task: let the monitor check it
+                    call.interval = POLL_MIN
+                    call.next_check = time.time() + POLL_MIN
+                    self._watched.add(call)
+                    self.__condition.notify_all()
+        else:
+            self.__finish_task(call)
+
+    def __monitor(self):
+        """
+        Monitor: checks the end of the long posted tasks and the timeouts
+        """
+        while True:
+            with self.__condition:
+                if not self._active:
+                    return
+
+                now = time.time()
+
+                # Waiting calls out of time
+                expired = [call for call in self._queue
+                           if call.deadline is not None
+                           and call.deadline <= now]
+                for call in expired:
+                    self._queue.remove(call)
+
+                # Synchronous calls out of time (their worker will ignore the
+                # result)
+                late = [call for call in self._calls
+                        if not call.posted and call.deadline is not None
+                        and call.deadline <= now]
+                for call in late:
+                    call.deadline = None
+
+                # Long tasks to check
+                checks = [call for call in self._watched
+                          if call.next_check <= now
+                          or (call.deadline is not None
+                              and call.deadline <= now)]
+
+                if not expired and not late and not checks:
+                    # Sleep until the next check or deadline
+                    times = [call.deadline for call in self._queue
+                             if call.deadline is not None]
+                    times.extend(call.deadline for call in self._calls
+                                 if not call.posted
+                                 and call.deadline is not None)
+                    times.extend(call.next_check for call in self._watched)
+                    if times:
+                        self.__condition.wait(max(0., min(times) - now))
+                    else:
+                        self.__condition.wait()
+                    continue
+
+            # Resolve the futures out of the lock
+            for call in expired + late:
+                self.__timeout(call)
+
+            for call in checks:
+                try:
+                    finished = not self._pool.get_proxy(call.module) \
+                        .isRunning(call.task_id)
+                except Exception as ex:
+                    _logger.warning("Error checking %s: %s", call, ex)
+                    self.__discard(call, ex)
+                    finished = True
+
+                if finished:
+                    self.__finish_task(call)
+                elif call.deadline is not None and call.deadline <= now:
+                    self.__expire_task(call)
+                else:
+                    # Check it less and less often
+                    call.interval = min(POLL_MAX, call.interval * 2)
+                    call.next_check = time.time() + call.interval
+
+    def __timeout(self, call):
+        """
+        Resolves a call with a timeout error
+        """
+        if call.future.set_exception(OSError("Timeout calling {0}"
+                                             .format(call))):
+            with self.__condition:
+                self._stats['timeouts'] += 1
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Shared pool of NAOqi proxies
+"""
+
+# Nao API
+from naoqi import ALProxy
+
+# Local module
+import internals.constants as constants
+
+# Pelix
+from pelix.ipopo.decorators import ComponentFactory, Instantiate, Provides, \
+    Property, Validate, Invalidate
+
+# Standard library
+import logging
+import threading
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_CHECK_INTERVAL = 5
+""" Default interval between two checks of the parent broker (in seconds) """
+
+HEALTH_MODULE = "ALMemory"
+""" Module pinged to check if the parent broker is alive """
+
+# ------------------------------------------------------------------------------
+
+
+@ComponentFactory('nao-proxies')
+@Provides(constants.SERVICE_NAOQI_PROXIES, controller='_connected')
+@Property('_check_interval', 'proxies.check_interval', DEFAULT_CHECK_INTERVAL)
+@Instantiate('nao-proxies')
+class NaoProxies(object):
+    """
+    Creates the proxies to the NAOqi modules on first use, and shares them.
+
+    The parent broker is regularly pinged: the service is unregistered while
+    it can't be reached, and registered again with new proxies once it is
+    back. This way, the components using the proxies are invalidated while
+    NAOqi restarts, and set up their module again on validation.
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # Service controller
+        self._connected = False
+
+        # Property
+        self._check_interval = DEFAULT_CHECK_INTERVAL
+
+        # Module -> proxy
+        self._proxies = {}
+        self.__lock = threading.Lock()
+
+        # Counters
+        self._reconnections = 0
+
+        # Health check thread
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @Validate
+    def _validate(self, context):
+        """
+        Component validated
+        """
+        self._connected = self.__check()
+        if not self._connected:
+            _logger.warning("Parent broker not reachable, waiting for it")
+
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.__run,
+                                        name="naoqi-proxies-check")
+        self._thread.daemon = True
+        self._thread.start()
+
+    @Invalidate
+    def _invalidate(self, context):
+        """
+        Component invalidated
+        """
+        self._stop_event.set()
+        self._thread.join(1)
+        self._thread = None
+
+        with self.__lock:
+            self._proxies.clear()
+
+    def get_proxy(self, module):
+        """
+        Returns the shared proxy to the given module, creating it on first call
+
+        :param module: Name of the NAOqi module
+        :return: The proxy to the module
+        :raise RuntimeError: Error creating the proxy
+        """
+        with self.__lock:
+            try:
+                return self._proxies[module]
+            except KeyError:
+                pass
+
+        # Create the proxy out of the lock: it connects to the broker
+        proxy = ALProxy(module)
+        with self.__lock:
+            # Keep the proxy created by a concurrent call, if any
+            return self._proxies.setdefault(module, proxy)
+
+    def discard(self, module):
+        """
+        Forgets the proxy to the given module, which will be created again on
+        next call to get_proxy(). Used by the NAOqi call service when a call
+        fails with a NAOqi error.
+
+        :param module: Name of the NAOqi module
+        """
+        with self.__lock:
+            self._proxies.pop(module, None)
+
+    def get_statistics(self):
+        """
+        Returns the pool statistics
+
+        :return: A dictionary of counters
+        """
+        with self.__lock:
+            return {'proxies': len(self._proxies),
+                    'reconnections': self._reconnections}
+
+    def __check(self):
+        """
+        Pings the parent broker
+
+        :return: True if the parent broker answered
+        """
+        try:
+            return bool(self.get_proxy(HEALTH_MODULE).ping())
+        except Exception as ex:
+            _logger.debug("Error pinging the parent broker: %s", ex)
+            return False
+
+    def __run(self):
+        """
+        Health check: follows the state of the parent broker
+        """
+        while not self._stop_event.wait(self._check_interval):
+            if self.__check():
+                if not self._connected:
+                    _logger.info("Parent broker is back")
+                    with self.__lock:
+                        self._reconnections += 1
+
+                    # Register the service again
+                    self._connected = True
+            else:
+                # Proxies of the previous broker can't be reused
+                with self.__lock:
+                    self._proxies.clear()
+
+                if self._connected:
+                    _logger.warning("Parent broker lost")
+
+                    # Invalidate the components using the proxies
+                    self._connected = False
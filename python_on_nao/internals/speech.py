@@ -5,17 +5,23 @@ Nao speech controller
 """
 
 # Nao API
-from naoqi import ALProxy, ALModule
+from naoqi import ALModule
 
 # Local module
+from internals.delivery import NotificationPool
+from internals.interactions import InteractionExecutor, POLICY_DROP, \
+    DEFAULT_DEBOUNCE
+from internals.speech_sessions import RecognitionSession, SessionQueue
+from internals.vocabulary import VocabularyIndex, parse_recognized
 import internals.constants as constants
 
 # Pelix
 from pelix.ipopo.decorators import ComponentFactory, Property, Instantiate, \
-    Provides, Requires, Validate, Invalidate
+    Provides, Requires, Validate, Invalidate, BindField
 import pelix.services
 
 # Standard library
+import functools
 import logging
 import threading
 
@@ -30,6 +36,18 @@ __docformat__ = "restructuredtext en"
 
 _logger = logging.getLogger(__name__)
 
+DEFAULT_TIMEOUT = 10
+""" Default time to wait for a recognized word (in seconds) """
+
+MICROPHONE_TIMEOUT = 15
+""" Maximum time to wait for the end of the current sentence (in seconds) """
+
+ENGINE_TIMEOUT = 10
+""" Maximum duration of a call to the NAOqi modules (in seconds) """
+
+PROMPT_LISTENING = 'Je vous écoute'
+""" Said before listening to the words of the listeners """
+
 # ------------------------------------------------------------------------------
 
 
@@ -37,9 +55,13 @@ _logger = logging.getLogger(__name__)
 @Provides(constants.SERVICE_SPEECH)
 @Provides(pelix.services.SERVICE_EVENT_HANDLER)
 @Requires('_tts', constants.SERVICE_TTS, optional=True)
+@Requires('_audio', constants.SERVICE_AUDIO)
+@Requires('_naoqi', constants.SERVICE_NAOQI_CALLS)
 @Property('_name', 'module.name', __name__.replace('.', '_'))
 @Property('_events_topics', pelix.services.PROP_EVENT_TOPICS,
           ['/nao/touch/middle/*'])
+@Property('_policy', 'interaction.policy', POLICY_DROP)
+@Property('_debounce', 'interaction.debounce', DEFAULT_DEBOUNCE)
 @Instantiate('nao-speech')
 class NaoSpeechRecognition(ALModule):
     """
@@ -52,22 +74,33 @@ class NaoSpeechRecognition(ALModule):
         # Component properties
         self._name = None
         self._events_topics = None
+        self._policy = POLICY_DROP
+        self._debounce = DEFAULT_DEBOUNCE
+
+        # Executes the touch interactions out of the EventAdmin thread
+        self._executor = None
 
-        # Injected TTS
+        # Injected TTS, audio arbitration and NAOqi call services
         self._tts = None
+        self._audio = None
+        self._naoqi = None
 
-        # Listeners listener -> [words]
-        self._listeners = {}
+        # Listeners vocabulary (listener -> words)
+        self._listeners = VocabularyIndex()
 
-        # ALProxies
-        self._memory = None
-        self._recog = None
+        # Words currently compiled by the speech recognition engine, and the
+        # version of the listeners vocabulary they come from (if any)
+        self._compiled = None
+        self._compiled_version = None
 
-        # Flags
-        self.__lock = threading.RLock()
-        self._can_recog = threading.Event()
-        self._single_recognized = threading.Event()
-        self._single_result = ""
+        # Recognition sessions
+        self._sessions = SessionQueue()
+
+        # Starts the batches of sessions out of the callers threads
+        self._scheduler = None
+
+        # Lock
+        self.__engine_lock = threading.RLock()
 
     @Validate
     def _validate(self, context):
@@ -82,21 +115,26 @@ class NaoSpeechRecognition(ALModule):
         # Initialize the module
         ALModule.__init__(self, self._name)
 
-        # Get the "memory" proxy, to register to callbacks
-        self._memory = ALProxy("ALMemory")
-
         # Just to be sure...
         try:
-            self._memory.unsubscribeToEvent("WordRecognized", self._name)
+            self.__call("ALMemory", "unsubscribeToEvent", "WordRecognized",
+                        self._name)
         except:
             _logger.debug("Speech wasn't yet registered")
 
-        # Create the proxy
-        self._recog = ALProxy("ALSpeechRecognition")
-        self._recog.setLanguage("French")
+        # Set up the engine
+        self.__call("ALSpeechRecognition", "setLanguage", "French")
+        self._compiled = None
+        self._compiled_version = None
+
+        # Start the interactions executor
+        self._executor = InteractionExecutor(self._policy, self._debounce,
+                                             logname="speech-interactions")
+        self._executor.start()
 
-        # We're ready
-        self._can_recog.set()
+        # Start the sessions scheduler
+        self._scheduler = NotificationPool(1, logname="speech-scheduler")
+        self._scheduler.start()
 
         _logger.debug("Speech ready")
 
@@ -105,35 +143,184 @@ class NaoSpeechRecognition(ALModule):
         """
         Component invalidated
         """
+        # Stop the interactions and the scheduler
+        self._executor.stop()
+        self._executor = None
+        self._scheduler.stop()
+        self._scheduler = None
+
         # Clear vocabulary
         self._listeners.clear()
 
         # Unsubscribe from the speech recognition
-        self.__unsubscribe()
+        with self.__engine_lock:
+            sessions = self._sessions.clear()
+            self.__unsubscribe()
+
+        # Release the waiting sessions
+        for session in sessions:
+            session.fail(IOError("Speech recognition stopped"))
 
         # Unregister the module
         constants.unregister_almodule(self._name)
 
         # Clear references
-        self._memory = None
-        self._recog = None
+        self._compiled = None
+        self._compiled_version = None
+
+    def __call(self, module, method, *args):
+        """
+        Calls a method of a NAOqi module and waits for its result
+
+        :param module: Name of the NAOqi module
+        :param method: Name of the method
+        :param args: Arguments of the method
+        :return: The result of the method
+        :raise OSError: Timeout calling the method
+        """
+        return self._naoqi.call(module, method, *args,
+                                timeout=ENGINE_TIMEOUT).result()
+
+    def __set_vocabulary(self, words, version=None):
+        """
+        Sets the vocabulary of the speech recognition engine, unless it has
+        already been compiled
+
+        :param words: The vocabulary to use
+        :param version: Version of the listeners vocabulary, if the words come
+                        from it
+        """
+        if version is not None and version == self._compiled_version:
+            # Listeners vocabulary already compiled
+            return
+
+        words = frozenset(words)
+        if words != self._compiled:
+            # Compile the new vocabulary
+            self._compiled = None
+            self.__call("ALSpeechRecognition", "setVocabulary", list(words),
+                        True)
+            self._compiled = words
+
+        self._compiled_version = version
 
     def __unsubscribe(self):
         """
         Unsubscribe from events
         """
         try:
-            self._memory.unsubscribeToEvent("WordRecognized", self._name)
+            self.__call("ALMemory", "unsubscribeToEvent", "WordRecognized",
+                        self._name)
         except:
             # Ignore errors
             _logger.debug("Error unsubscribing speech recognition")
         finally:
-            # In any case, resume the TTS service
-            if self._tts is not None:
-                self._tts.resume()
+            # In any case, let the TTS service speak again
+            self._audio.release(constants.AUDIO_MICROPHONE, self)
+
+    def __start(self, batch):
+        """
+        Starts the recognition for a batch of sessions
+
+        :param batch: The sessions sharing the engine
+        :raise IOError: The microphone is still in use
+        """
+        # Wait for the TTS service to finish the current sentence, and forbid
+        # it to start a new one
+        if not self._audio.acquire(constants.AUDIO_MICROPHONE, self,
+                                   MICROPHONE_TIMEOUT):
+            raise IOError("Timeout waiting for the microphone (speaker: {0})"
+                          .format(self._audio.get_owner(
+                              constants.AUDIO_SPEAKER)))
+
+        if len(batch) == 1:
+            # Keep the listeners vocabulary version, if any
+            self.__set_vocabulary(batch[0].words, batch[0].version)
+        else:
+            self.__set_vocabulary(
+                frozenset().union(*(session.words for session in batch)))
+
+        # Subscribe the word recognition event
+        self.__call("ALMemory", "subscribeToEvent", "WordRecognized",
+                    self._name, self.on_word_recognized.__name__)
+
+    def __schedule(self):
+        """
+        Starts the next batch of sessions, if the engine is free
+        """
+        with self.__engine_lock:
+            while True:
+                batch = self._sessions.next_batch()
+                if not batch:
+                    # Engine busy, or nothing to do
+                    return
+
+                _logger.debug("Starting recognition: %s", batch)
+                try:
+                    self.__start(batch)
+                    return
+                except Exception as ex:
+                    _logger.exception("Error starting recognition: %s", ex)
+                    self._sessions.finish(batch)
+                    self.__unsubscribe()
+                    for session in batch:
+                        session.fail(ex)
+
+    def __request_schedule(self):
+        """
+        Asks the scheduler thread to start the next batch of sessions. Pending
+        requests are coalesced.
+        """
+        scheduler = self._scheduler
+        if scheduler is not None:
+            scheduler.enqueue_latest(None, self.__schedule)
 
-            # Authorize again
-            self._can_recog.set()
+    def __submit(self, session, timeout):
+        """
+        Enqueues a recognition session
+
+        :param session: A RecognitionSession
+        :param timeout: Maximum time to wait for a word (in seconds), None to
+                        wait forever
+        :return: The future result of the session
+        """
+        session.future.set_canceller(functools.partial(self.__abort, session))
+        if timeout is not None:
+            session.set_timeout(timeout, self.__abort)
+
+        self._sessions.put(session)
+        self.__request_schedule()
+        return session.future
+
+    def __abort(self, session):
+        """
+        Stops a session which timed out or has been cancelled. Its result is
+        SPEECH_NO_RESULT. Does nothing if the session is already finished.
+
+        :param session: A RecognitionSession
+        :return: False if the session was already finished
+        """
+        with self.__engine_lock:
+            last = self._sessions.remove(session)
+            if last is None:
+                # A word has been recognized in the meantime
+                return False
+            elif last:
+                # Last session of the batch: stop recognizing speech
+                self.__unsubscribe()
+
+        if session.resolve(constants.SPEECH_NO_RESULT):
+            _logger.debug("Recognition aborted: %s", session)
+
+        # Start the next sessions
+        self.__request_schedule()
+
+    @BindField('_tts')
+    def _bind_tts(self, field, service, svc_ref):
+        """
+        Text-to-speech service bound
+        """
+        service.prepare([PROMPT_LISTENING])
 
     def handle_event(self, topic, properties):
         """
@@ -142,31 +329,43 @@ class NaoSpeechRecognition(ALModule):
         :param topic: Event topic
         :param properties: Event properties
         """
-        if not self._can_recog.is_set():
-            # Already recognizing
-            _logger.debug('Already recognizing')
-            return
+        pressed = bool(properties['value'])
+        executor = self._executor
+        if pressed and executor is not None:
+            # Button pressed/touched: start recognition, out of the
+            # EventAdmin thread
+            executor.submit(properties['name'], self.__listen)
+
+    def __listen(self, interaction):
+        """
+        Touch interaction: listens to the words of the listeners
 
-        with self.__lock:
-            pressed = bool(properties['value'])
-            if pressed:
-                # Button pressed/touched: start recognition
-                if self._tts is not None:
-                    # Tell the user we're ready
-                    self._tts.say('Je vous écoute')
+        :param interaction: The Interaction handle
+        """
+        if self._tts is not None:
+            # Tell the user we're ready
+            self._tts.say(PROMPT_LISTENING,
+                          constants.TTS_PRIORITY_HIGH).result()
 
-                # Start recognition
-                self.recognize()
+        # Start recognition, and wait for its end
+        interaction.track(self.recognize()).result()
 
-    def add_listener(self, listener, words):
+    def add_listener(self, listener, words, threshold=0.):
         """
-        Adds a speech listener
+        Adds a speech listener.
+
+        The listener is notified with its word_recognized(word, all_words)
+        method. It can return False to let the next listener of the word
+        handle it.
 
         :param listener: Listener to add
         :param words: Words recognized by the listener
+        :param threshold: Minimal confidence (between 0 and 1) of a word to be
+                          given to this listener
         """
-        self._listeners[listener] = words
-        _logger.info("Adding words: %s (%s)", words, type(words).__name__)
+        self._listeners.add(listener, words, threshold)
+        _logger.info("Adding words: %s (%s), threshold: %s",
+                     words, type(words).__name__, threshold)
 
     def remove_listener(self, listener):
         """
@@ -175,96 +374,126 @@ class NaoSpeechRecognition(ALModule):
         :param listener: Listener to remove
         :raise KeyError: Unknown listener
         """
-        del self._listeners[listener]
+        self._listeners.remove(listener)
 
-    def recognize(self, words=None):
+    def recognize(self, words=None, timeout=DEFAULT_TIMEOUT):
         """
-        Starts the recognition
-
-        :param words: The vocabulary to use (optional)
+        Starts a recognition, whose result is given to the speech listeners.
+        It waits for the end of the incompatible recognitions, if any.
+
+        :param words: The vocabulary to use (default: the listeners words)
+        :param timeout: Maximum time to wait for a word (in seconds), None to
+                        wait forever
+        :return: A Future object, resolved with the word accepted by a
+                 listener, None if no listener accepted it, or
+                 SPEECH_NO_RESULT on timeout or cancellation
         """
-        self._can_recog.clear()
-
-        # Start the speech recognition
-        if not words:
-            words = set()
-            for listener_words in self._listeners.values():
-                words.update(listener_words)
-
-        self._recog.setVocabulary(list(words), True)
+        if words:
+            session = RecognitionSession(words, True)
+        else:
+            version, words = self._listeners.snapshot()
+            session = RecognitionSession(words, True, version)
 
-        # Pause the TTS service, if any
-        if self._tts is not None:
-            self._tts.pause()
-
-        # Subscribe the word recognition event
-        self._memory.subscribeToEvent("WordRecognized",
-                                      self._name,
-                                      self.on_word_recognized.__name__)
+        return self.__submit(session, timeout)
 
-    def simple_recognize(self, words):
+    def simple_recognize_async(self, words, timeout=DEFAULT_TIMEOUT):
         """
-        One-shot recognition
-        """
-        # Wait to be able to recognize
-        self._can_recog.wait()
-        self._can_recog.clear()
-
-        # Prepare the recognition
-        self._recog.setVocabulary(list(words), True)
-        self._single_recognized.clear()
-
-        # Pause the TTS service, if any
-        if self._tts is not None:
-            self._tts.pause()
-
-        # Subscribe the word recognition event
-        self._memory.subscribeToEvent("WordRecognized",
-                                      self._name,
-                                      self.on_single_recognized.__name__)
+        One-shot recognition. Concurrent calls share the speech recognition
+        engine when their vocabularies are the same or don't overlap.
 
-        # Wait for the word to be recognized
-        self._single_recognized.wait()
+        The recognition can be aborted with the cancel() method of the
+        returned future.
 
-        # Store the word
-        result = self._single_result
-
-        # Return the found word
-        return result
-
-    def on_single_recognized(self, event, raw_words, identifier):
+        :param words: The vocabulary to use
+        :param timeout: Maximum time to wait for a word (in seconds), None to
+                        wait forever
+        :return: A Future object, resolved with the recognized word, or
+                 SPEECH_NO_RESULT on timeout or cancellation
         """
-        A word has been recognized
+        return self.__submit(RecognitionSession(words), timeout)
+
+    def simple_recognize(self, words, timeout=DEFAULT_TIMEOUT):
         """
-        # Set up the "single" result
-        self._single_result = raw_words[0]
-        self._single_recognized.set()
+        One-shot recognition, waiting for its result
 
-        # Prepare next run
-        self.__unsubscribe()
+        :param words: The vocabulary to use
+        :param timeout: Maximum time to wait for a word (in seconds), None to
+                        wait forever
+        :return: The recognized word, or SPEECH_NO_RESULT on timeout
+        """
+        return self.simple_recognize_async(words, timeout).result()
 
     def on_word_recognized(self, event, raw_words, identifier):
         """
         A word has been recognized
         """
-        # Stop recognizing speech
-        self.__unsubscribe()
-
         _logger.debug("Recognized: %s", raw_words)
+        results = parse_recognized(raw_words)
+
+        with self.__engine_lock:
+            # Find the sessions concerned by the recognized words
+            matched = []
+            for session in self._sessions.active():
+                session_results = session.match(results)
+                if session_results:
+                    matched.append((session, session_results))
+
+            if not matched:
+                _logger.debug("No session for %s", raw_words)
+                return
+
+            if self._sessions.finish([session for session, _ in matched]):
+                # Stop recognizing speech
+                self.__unsubscribe()
+
+        # Give the words to the listeners only once, even if several merged
+        # sessions dispatch them
+        accepted = None
+        dispatching = [session for session, _ in matched if session.dispatch]
+        if dispatching:
+            candidates = [result for result in results
+                          if any(result[0] in session.words
+                                 for session in dispatching)]
+            accepted = self.__dispatch(candidates, raw_words)
+
+        # Notify the sessions
+        for session, session_results in matched:
+            if not session.dispatch:
+                session.resolve(session_results[0][0])
+            elif accepted in session.words:
+                session.resolve(accepted)
+            else:
+                session.resolve(None)
+
+        # Start the next sessions out of the NAOqi callback thread: it can
+        # wait for the microphone and compile a vocabulary
+        self.__request_schedule()
+
+    def __dispatch(self, results, raw_words):
+        """
+        Gives the recognized words to the first listener accepting them.
+        Candidates are tried from the best confidence to the worst one.
 
-        # Get the first recognized word
-        word = raw_words[0]
-        _logger.debug("Using word: %s", word)
+        :param results: The (word, confidence) tuples, best first
+        :param raw_words: Value of the WordRecognized event
+        :return: The word accepted by a listener, or None
+        """
+        for word, confidence in results:
+            for listener in self._listeners.match(word):
+                if confidence < self._listeners.threshold(listener):
+                    # Not confident enough for this listener
+                    continue
 
-        # Call listeners
-        for listener, listener_words in self._listeners.items():
-            # Compute recognized words
-            if word in listener_words:
-                # Notify the listener only if it is one of its words that
-                # have been heard
+                _logger.debug("Using word: %s (%.2f)", word, confidence)
                 try:
                     # Call the listener
-                    listener.word_recognized(word, raw_words[:])
+                    if listener.word_recognized(word, raw_words[:]) \
+                            is not False:
+                        # Word accepted
+                        return word
                 except Exception as ex:
                     # Something went wrong
                     _logger.exception("Error calling word listener: %s", ex)
+
+        _logger.debug("No listener accepted %s", raw_words)
+        return None
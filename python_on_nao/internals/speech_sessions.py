@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Speech recognition sessions, sharing the speech recognition engine
+"""
+
+# Local modules
+from internals.futures import Future
+
+# Standard library
+import collections
+import threading
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class RecognitionSession(object):
+    """
+    A request for speech recognition, resolved by its future
+    """
+    def __init__(self, words, dispatch=False, version=None):
+        """
+        Sets up members
+
+        :param words: The vocabulary of the session
+        :param dispatch: If True, the recognized word is given to the speech
+                         listeners
+        :param version: Version of the listeners vocabulary, if the words
+                        come from it
+        """
+        self.words = frozenset(words)
+        self.dispatch = dispatch
+        self.version = version
+        self.future = Future()
+        self._timer = None
+
+    def __repr__(self):
+        """
+        String representation
+        """
+        return "RecognitionSession({0}, dispatch={1})" \
+            .format(sorted(self.words), self.dispatch)
+
+    def set_timeout(self, timeout, method):
+        """
+        Calls the given method if the session is not over after the given
+        time
+
+        :param timeout: Time to wait (in seconds)
+        :param method: Method to call, with the session as argument
+        """
+        self._timer = threading.Timer(timeout, method, (self,))
+        self._timer.daemon = True
+        self._timer.start()
+
+    def cancel_timeout(self):
+        """
+        Cancels the timeout of the session, if any
+        """
+        if self._timer is not None:
+            self._timer.cancel()
+
+    def resolve(self, result):
+        """
+        Sets the result of the session
+
+        :param result: The recognized word
+        :return: True if the result has been stored
+        """
+        self.cancel_timeout()
+        return self.future.set_result(result)
+
+    def fail(self, exception):
+        """
+        Sets the error of the session
+
+        :param exception: An Exception object
+        :return: True if the exception has been stored
+        """
+        self.cancel_timeout()
+        return self.future.set_exception(exception)
+
+    def compatible(self, other):
+        """
+        Checks if this session can share the engine with another one: a
+        recognized word must either belong to a single session, or be
+        expected by both sessions.
+
+        :param other: Another session
+        :return: True if both sessions can be merged
+        """
+        return self.words == other.words or self.words.isdisjoint(other.words)
+
+    def match(self, results):
+        """
+        Filters the recognition results concerning this session
+
+        :param results: A list of (word, confidence) tuples
+        :return: The results whose word belongs to this session
+        """
+        return [result for result in results if result[0] in self.words]
+
+
+class SessionQueue(object):
+    """
+    Queues the recognition sessions, and merges the compatible pending ones in
+    batches sharing a vocabulary
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # Pending sessions
+        self._pending = collections.deque()
+
+        # Sessions of the running batch
+        self._active = []
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Returns the number of pending and active sessions
+        """
+        return len(self._pending) + len(self._active)
+
+    def put(self, session):
+        """
+        Enqueues a session
+
+        :param session: A RecognitionSession
+        """
+        with self.__lock:
+            self._pending.append(session)
+
+    def next_batch(self):
+        """
+        If no batch is running, starts the next one. It contains the oldest
+        pending session and the pending sessions compatible with it.
+
+        :return: The list of the sessions of the batch, or None
+        """
+        with self.__lock:
+            if self._active or not self._pending:
+                # Already running, or nothing to do
+                return None
+
+            batch = [self._pending.popleft()]
+            remaining = collections.deque()
+            for session in self._pending:
+                if all(session.compatible(other) for other in batch):
+                    batch.append(session)
+                else:
+                    remaining.append(session)
+
+            self._pending = remaining
+            self._active = batch
+            return batch[:]
+
+    def active(self):
+        """
+        Returns the sessions of the running batch
+
+        :return: A list of sessions
+        """
+        with self.__lock:
+            return self._active[:]
+
+    def remove(self, session):
+        """
+        Removes a pending or running session
+
+        :param session: A session
+        :return: True if the session was the last one of the running batch,
+                 None if it wasn't queued anymore
+        """
+        with self.__lock:
+            if session in self._active:
+                self._active.remove(session)
+                return not self._active
+
+            try:
+                self._pending.remove(session)
+            except ValueError:
+                # Unknown or finished session
+                return None
+            return False
+
+    def finish(self, sessions):
+        """
+        Removes sessions from the running batch and cancels their timeout:
+        their result is being computed.
+
+        :param sessions: The finished sessions
+        :return: True if the batch is now over
+        """
+        with self.__lock:
+            for session in sessions:
+                session.cancel_timeout()
+
+            self._active = [session for session in self._active
+                            if session not in sessions]
+            return not self._active
+
+    def clear(self):
+        """
+        Removes all sessions
+
+        :return: The list of the removed sessions
+        """
+        with self.__lock:
+            sessions = self._active + list(self._pending)
+            del self._active[:]
+            self._pending.clear()
+            return sessions
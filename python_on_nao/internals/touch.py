@@ -5,14 +5,18 @@ Handles buttons on Nao and converts them into events
 """
 
 # Utilities
+from internals.event_demand import DemandTracker
+from internals.delivery import NotificationPool
+from internals.touch_filter import TouchFilter, DEFAULT_DEBOUNCE, \
+    DEFAULT_MIN_INTERVAL
 import internals.constants as constants
 
 # Nao API
-from naoqi import ALProxy, ALModule
+from naoqi import ALModule
 
 # Pelix
 from pelix.ipopo.decorators import ComponentFactory, Property, Requires, \
-    Instantiate, Validate, Invalidate
+    Instantiate, Validate, Invalidate, BindField, UpdateField, UnbindField
 import pelix.services
 
 # Standard library
@@ -42,12 +46,69 @@ See: https://community.aldebaran-robotics.com/doc/1-14/naoqi/sensors/
      alsensors-api.html#event-list
 """
 
+DEFAULT_QUEUE_SIZE = 16
+"""
+Default maximum number of pending events per sensor: above it, new presses
+are dropped with their release
+"""
+
+# ------------------------------------------------------------------------------
+
+
+class TouchEvent(object):
+    """
+    Precomputed topic and properties of a (sensor, press/release) couple
+    """
+    __slots__ = ('name', 'topic', 'properties', 'value')
+
+    def __init__(self, event, name, pressed):
+        """
+        Sets up members
+
+        :param event: Name of the ALMemory event
+        :param name: Name of the sensor
+        :param pressed: True for the press event, False for the release one
+        """
+        if pressed:
+            event_type = "touch"
+            self.value = 1.0
+        else:
+            event_type = "release"
+            self.value = 0.0
+
+        self.name = name
+        self.topic = '/nao/touch/{0}/{1}'.format(name, event_type)
+        self.properties = {'event': event, 'value': self.value,
+                           'name': name, 'type': event_type}
+
+    def get_properties(self, value):
+        """
+        Returns the properties of the event for the given sensor value.
+        The base properties are shared: they must not be modified (the
+        EventAdmin gives a copy to the handlers).
+
+        :param value: Value of the sensor
+        :return: The event properties
+        """
+        if value == self.value:
+            return self.properties
+
+        properties = self.properties.copy()
+        properties['value'] = value
+        return properties
+
 # ------------------------------------------------------------------------------
 
 
 @ComponentFactory('nao-touch')
 @Requires('_event', pelix.services.SERVICE_EVENT_ADMIN)
+@Requires('_pool', constants.SERVICE_NAOQI_PROXIES)
+@Requires('_handlers', pelix.services.SERVICE_EVENT_HANDLER,
+          aggregate=True, optional=True)
 @Property('_name', 'module.name', __name__.replace('.', '_'))
+@Property('_debounce', 'touch.debounce', DEFAULT_DEBOUNCE)
+@Property('_min_interval', 'touch.min_interval', DEFAULT_MIN_INTERVAL)
+@Property('_queue_size', 'touch.queue_size', DEFAULT_QUEUE_SIZE)
 @Instantiate('nao-touch')
 class NaoTouch(ALModule):
     """
@@ -57,15 +118,52 @@ class NaoTouch(ALModule):
         """
         Sets up members
         """
-        # Injected service
+        # Injected services
         self._event = None
+        self._handlers = []
+        self._pool = None
 
         # Name property
         self._name = None
 
+        # Filter properties
+        self._debounce = DEFAULT_DEBOUNCE
+        self._min_interval = DEFAULT_MIN_INTERVAL
+        self._queue_size = DEFAULT_QUEUE_SIZE
+
+        # Filters the noisy events
+        self._filter = None
+
+        # Sensor name -> events lane
+        self._lanes = {}
+
+        # (ALMemory event, pressed) -> TouchEvent
+        self._touch_events = {}
+
         # Proxy to Nao's memory
         self._memory = None
 
+        # Subscribes to the events with a handler
+        self._tracker = DemandTracker(
+            dict((event, ['/nao/touch/{0}/touch'.format(name),
+                          '/nao/touch/{0}/release'.format(name)])
+                 for event, name in TOUCH_event_MAP.items()),
+            self.__subscribe, self.__unsubscribe)
+
+    def get_statistics(self):
+        """
+        Returns the number of suppressed and dropped events per sensor
+
+        :return: A dictionary: {'suppressed': {sensor: count},
+                 'dropped': {sensor: count}}
+        """
+        stats = {'suppressed': {}, 'dropped': {}}
+        if self._filter is not None:
+            stats['suppressed'] = self._filter.suppressed.copy()
+            stats['dropped'] = self._filter.dropped.copy()
+
+        return stats
+
     @Validate
     def _validate(self, context):
         """
@@ -74,16 +172,33 @@ class NaoTouch(ALModule):
         # Register the global in the main script
         constants.register_almodule(self._name, self)
 
+        # Prepare the filter
+        self._filter = TouchFilter(float(self._debounce),
+                                   float(self._min_interval))
+
+        # Precompute the topics and properties of the events
+        for event, name in TOUCH_event_MAP.items():
+            for pressed in (True, False):
+                self._touch_events[event, pressed] = \
+                    TouchEvent(event, name, pressed)
+
+        # Events are sent in order by one lane per sensor, out of the NAOqi
+        # callback thread. The lanes are unbounded: the filter drops the
+        # presses (and their release) when a lane is full, so that the
+        # press/release couples are kept.
+        for name in TOUCH_event_MAP.values():
+            lane = NotificationPool(1, logname="touch-{0}".format(name))
+            lane.start()
+            self._lanes[name] = lane
+
         # Initialize the module
         ALModule.__init__(self, self._name)
 
-        # Get the "memory" proxy, to register to callbacks
-        self._memory = ALProxy("ALMemory")
+        # Get the shared "memory" proxy, to register to callbacks
+        self._memory = self._pool.get_proxy("ALMemory")
 
-        # Register to button events
-        for event in TOUCH_event_MAP:
-            self._memory.subscribeToEvent(event, self._name,
-                                          self.on_touch_sensed.__name__)
+        # Register to the button events with a handler
+        self._tracker.start()
 
     @Invalidate
     def _invalidate(self, context):
@@ -91,14 +206,64 @@ class NaoTouch(ALModule):
         Component invalidated
         """
         # Unregister from button events
-        for event in TOUCH_event_MAP:
-            self._memory.unsubscribeToEvent(event, self._name)
+        self._tracker.stop()
 
         # Unregister the global
         constants.unregister_almodule(self._name)
 
+        # Stop the lanes
+        for lane in self._lanes.values():
+            lane.stop()
+
+        _logger.debug("Touch events statistics: %s", self.get_statistics())
+        self._lanes.clear()
+        self._touch_events.clear()
+
         # Clean up
         self._memory = None
+        self._filter = None
+
+    def __subscribe(self, event):
+        """
+        Subscribes to an ALMemory event
+
+        :param event: Name of the event
+        """
+        _logger.debug("Subscribing to %s", event)
+        self._memory.subscribeToEvent(event, self._name,
+                                      self.on_touch_sensed.__name__)
+
+    def __unsubscribe(self, event):
+        """
+        Unsubscribes from an ALMemory event
+
+        :param event: Name of the event
+        """
+        _logger.debug("Unsubscribing from %s", event)
+        self._memory.unsubscribeToEvent(event, self._name)
+
+    @BindField('_handlers')
+    def _bind_handler(self, field, handler, svc_ref):
+        """
+        An EventAdmin handler has been bound
+        """
+        self._tracker.set_handler(
+            handler, svc_ref.get_property(pelix.services.PROP_EVENT_TOPICS))
+
+    @UpdateField('_handlers')
+    def _update_handler(self, field, handler, svc_ref, old_props):
+        """
+        An EventAdmin handler has been updated
+        """
+        self._tracker.set_handler(
+            handler, svc_ref.get_property(pelix.services.PROP_EVENT_TOPICS))
+
+    @UnbindField('_handlers')
+    def _unbind_handler(self, field, handler, svc_ref):
+        """
+        An EventAdmin handler is gone
+        """
+        self._tracker.remove_handler(handler)
 
     def on_touch_sensed(self, event, value, identifier):
         """
@@ -110,21 +275,35 @@ class NaoTouch(ALModule):
         """
         _logger.debug("Touch sensed: %s - %s", event, value)
 
+        pressed = bool(value)
         try:
-            # Get the local name
-            event_name = TOUCH_event_MAP[event]
+            # Get the precomputed event
+            touch_event = self._touch_events[event, pressed]
         except KeyError:
-            # Unknown name, ignore
+            # Unknown name (or component invalidated), ignore
             return
 
-        if value:
-            # On press
-            event_type = "touch"
-        else:
-            # On release
-            event_type = "release"
+        touch_filter = self._filter
+        lane = self._lanes.get(touch_event.name)
+        if touch_filter is None or lane is None:
+            # Component invalidated
+            return
+
+        full = lane.depth >= max(1, int(self._queue_size))
+        if not touch_filter.accept(touch_event.name, pressed, full):
+            # Bounce, too frequent or queue full
+            _logger.debug("Touch event suppressed: %s - %s", event, value)
+            return
 
-        # Send the event
-        self._event.send('/nao/touch/{0}/{1}'.format(event_name, event_type),
-                         {'event': event, 'value': value,
-                          'name': event_name, 'type': event_type})
+        # Post the event
+        lane.enqueue(touch_event.name, self.__send, touch_event, value)
+
+    def __send(self, touch_event, value):
+        """
+        Sends a touch event to the EventAdmin
+
+        :param touch_event: The precomputed TouchEvent
+        :param value: Value of the sensor
+        """
+        self._event.send(touch_event.topic,
+                         touch_event.get_properties(value))
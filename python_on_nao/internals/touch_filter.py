@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Filters the noisy events of the Nao touch sensors
+"""
+
+# Standard library
+import threading
+import time
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+DEFAULT_DEBOUNCE = .1
+"""
+Default debounce window: a press sensed less than this delay (in seconds)
+after a release is a bounce
+"""
+
+DEFAULT_MIN_INTERVAL = .3
+""" Default minimal delay between two presses of a sensor (in seconds) """
+
+# ------------------------------------------------------------------------------
+
+
+class TouchFilter(object):
+    """
+    Filters the noisy touch/release bursts of the sensors.
+
+    A press is ignored if it comes less than the debounce delay after the
+    previous release of the sensor, or less than the minimal interval after
+    the previous forwarded press. A press is dropped if the events queue of
+    the sensor is full. The release of an ignored press is ignored too, so
+    that listeners always see press/release couples.
+    """
+    def __init__(self, debounce=DEFAULT_DEBOUNCE,
+                 min_interval=DEFAULT_MIN_INTERVAL):
+        """
+        Sets up members
+
+        :param debounce: Debounce window (in seconds)
+        :param min_interval: Minimal delay between two presses (in seconds)
+        """
+        self._debounce = max(0, debounce)
+        self._min_interval = max(0, min_interval)
+
+        # Sensor -> [pressed, time of the last forwarded press,
+        #            time of the last release, press dropped]
+        self._states = {}
+
+        # Sensor -> number of suppressed and dropped events
+        self.suppressed = {}
+        self.dropped = {}
+        self.__lock = threading.Lock()
+
+    def accept(self, sensor, pressed, full=False):
+        """
+        Checks if an event must be forwarded
+
+        :param sensor: Name of the sensor
+        :param pressed: True on press, False on release
+        :param full: True if the events queue of the sensor is full
+        :return: True if the event must be forwarded
+        """
+        now = time.time()
+        with self.__lock:
+            try:
+                state = self._states[sensor]
+            except KeyError:
+                state = self._states[sensor] = [False, None, None, False]
+
+            dropped = False
+            if pressed:
+                last_press, last_release = state[1:3]
+                accepted = not state[0] \
+                    and (last_release is None
+                         or not 0 <= now - last_release < self._debounce) \
+                    and (last_press is None
+                         or not 0 <= now - last_press < self._min_interval)
+                if accepted and full:
+                    # Drop the whole press/release couple
+                    accepted = False
+                    dropped = state[3] = True
+
+                if accepted:
+                    state[0] = True
+                    state[1] = now
+            else:
+                # Forward the release of a forwarded press only
+                accepted = state[0]
+                dropped = state[3]
+                state[0] = state[3] = False
+                state[2] = now
+
+            if dropped:
+                self.dropped[sensor] = self.dropped.get(sensor, 0) + 1
+            elif not accepted:
+                self.suppressed[sensor] = self.suppressed.get(sensor, 0) + 1
+
+            return accepted
@@ -4,19 +4,22 @@
 Nao text-to-speech service
 """
 
-# Nao API
-from naoqi import ALProxy
-
 # Local module
+from internals.futures import Future
+from internals.tts_cache import UtteranceCache
+from internals.tts_queue import SpeechQueue
 import internals.constants as constants
 
 # Pelix
 from pelix.ipopo.decorators import ComponentFactory, Instantiate, Provides, \
-    Validate, Invalidate
+    Requires, Property, Validate, Invalidate
 
 # Standard library
 import logging
+import os
+import tempfile
 import threading
+import time
 
 # ------------------------------------------------------------------------------
 
@@ -29,69 +32,346 @@ __docformat__ = "restructuredtext en"
 
 _logger = logging.getLogger(__name__)
 
+PAUSE_OWNER = "tts.pause"
+""" Owner of the microphone when the TTS is paused """
+
+DEFAULT_CACHE_DIRECTORY = os.path.join(tempfile.gettempdir(), "nao-tts-cache")
+""" Default directory of the pre-synthesized sentences """
+
+DEFAULT_CACHE_SIZE = 32
+""" Default maximum number of pre-synthesized sentences """
+
+VOICE_PARAMETERS = ('pitchShift', 'doubleVoice', 'doubleVoiceLevel',
+                    'doubleVoiceTimeShift')
+""" ALTextToSpeech parameters which change the rendered sentences """
+
+TTS_MODULE = "ALTextToSpeech"
+""" Name of the NAOqi text-to-speech module """
+
+PLAYER_MODULE = "ALAudioPlayer"
+""" Name of the NAOqi module playing the pre-synthesized sentences """
+
+VOICE_TIMEOUT = 2
+""" Maximum time to wait for the description of the voice (in seconds) """
+
+PAUSE_TIMEOUT = 30
+""" Default maximum time to wait for the speaker to pause (in seconds) """
+
 # ------------------------------------------------------------------------------
 
 
 @ComponentFactory('nao-tts')
 @Provides(constants.SERVICE_TTS)
+@Requires('_audio', constants.SERVICE_AUDIO)
+@Requires('_naoqi', constants.SERVICE_NAOQI_CALLS)
+@Property('_cache_directory', 'tts.cache.directory', DEFAULT_CACHE_DIRECTORY)
+@Property('_cache_size', 'tts.cache.size', DEFAULT_CACHE_SIZE)
 @Instantiate('nao-tts')
 class NaoTTS(object):
     """
-    Nao text-to-speech service
+    Nao text-to-speech service.
+
+    The sentences given to prepare() are rendered to audio files, which are
+    played instead of synthesizing the sentence each time it is said.
     """
     def __init__(self):
         """
         Sets up members
         """
-        self._tts = None
+        # Injected NAOqi call service
+        self._naoqi = None
+
+        # Future of the sentence being said
+        self._current = None
+
+        # Properties
+        self._cache_directory = DEFAULT_CACHE_DIRECTORY
+        self._cache_size = DEFAULT_CACHE_SIZE
+
+        # Pre-synthesized sentences
+        self._cache = None
+        self._prepared = set()
+        self.__prepared_lock = threading.Lock()
+        self.__render_lock = threading.Lock()
 
-        # Authorization to speak
-        self._can_speak = threading.Event()
-        self._can_speak.set()
-        self.__speaking_lock = threading.Lock()
+        # Description of the voice, updated when rendering sentences
+        self._voice = None
+
+        # Injected audio arbitration
+        self._audio = None
+
+        # Sentences to say, and the thread saying them
+        self._queue = None
+        self._thread = None
 
     @Validate
     def validate(self, context):
         """
         Component validated
         """
-        # Set up the TTS proxy
-        self._tts = ALProxy("ALTextToSpeech")
+        # Load the pre-synthesized sentences
+        cache = UtteranceCache(self._cache_directory, int(self._cache_size))
+        try:
+            cache.load()
+        except (IOError, OSError) as ex:
+            _logger.error("Can't use the TTS cache in %s: %s",
+                          self._cache_directory, ex)
+        else:
+            self._cache = cache
+
+        # Start the scheduler
+        self._queue = SpeechQueue()
+        self._thread = threading.Thread(target=self.__run, args=(self._queue,),
+                                        name="tts-scheduler")
+        self._thread.daemon = True
+        self._thread.start()
 
     @Invalidate
     def invalidate(self, context):
         """
         Component invalidated
         """
-        # Stop using the proxy
-        self._tts = None
+        # Stop the scheduler, dropping the pending sentences
+        self._queue.stop()
+
+        # Interrupt the current sentence
+        current = self._current
+        if current is not None:
+            current.cancel()
+
+        self._thread.join(1)
+
+        # Release the pause, if any
+        self._audio.release(constants.AUDIO_MICROPHONE, PAUSE_OWNER)
+
+        # Clean up
+        self._queue = None
+        self._thread = None
+        self._cache = None
+        with self.__prepared_lock:
+            self._prepared.clear()
+        self._voice = None
+
+    def __get_voice(self):
+        """
+        Returns the description of the current voice, used as cache key
+
+        :return: A (language, voice, parameters) tuple
+        """
+        # Query everything at once
+        language = self._naoqi.call(TTS_MODULE, 'getLanguage',
+                                    timeout=VOICE_TIMEOUT)
+        voice = self._naoqi.call(TTS_MODULE, 'getVoice',
+                                 timeout=VOICE_TIMEOUT)
+        futures = [self._naoqi.call(TTS_MODULE, 'getParameter', name,
+                                    timeout=VOICE_TIMEOUT)
+                   for name in VOICE_PARAMETERS]
+
+        parameters = []
+        for future in futures:
+            try:
+                parameters.append(future.result())
+            except Exception:
+                # Unsupported parameter
+                parameters.append(None)
+
+        return language.result(), voice.result(), tuple(parameters)
+
+    def __say_to_file(self, text, path):
+        """
+        Renders a sentence to an audio file
+        """
+        self._naoqi.call(TTS_MODULE, 'sayToFile', text, path).result()
+
+    def __wait(self, future):
+        """
+        Waits for the end of the sentence being said
+
+        :param future: The Future object of the NAOqi task saying it
+        :return: True if the sentence has been said, False if interrupted
+        """
+        self._current = future
+        try:
+            return future.result()
+        finally:
+            self._current = None
 
-        # Unlock everything
-        self._can_speak.set()
+    def __render(self, sentences):
+        """
+        Renders the given sentences to the cache
 
-    def say(self, sentence):
+        :param sentences: Sentences to render
         """
-        Says the given sentence
+        with self.__render_lock:
+            cache = self._cache
+            if cache is None:
+                # Invalidated
+                return
+
+            try:
+                # Refresh the description of the voice
+                voice = self._voice = self.__get_voice()
+                for sentence in sentences:
+                    cache.render(self.__say_to_file, sentence, voice)
+            except Exception as ex:
+                _logger.warning("Error rendering sentences: %s", ex)
+
+    def __play_cached(self, text):
+        """
+        Plays the pre-synthesized version of a sentence, if any. The voice
+        is described by the last rendering, to avoid querying it before each
+        sentence.
+
+        :param text: Sentence to say
+        :return: The result of __wait(), or None if the sentence hasn't been
+                 played and must be synthesized
+        """
+        cache = self._cache
+        voice = self._voice
+        with self.__prepared_lock:
+            prepared = text in self._prepared
+
+        if cache is None or not prepared:
+            return None
+
+        try:
+            path = None
+            if voice is not None:
+                path = cache.get(text, voice)
+
+            if path is None:
+                # Not yet rendered, voice changed or file removed: render it
+                # (refreshing the voice) for the next time
+                self.__start_render([text])
+                return None
+
+            return self.__wait(self._naoqi.post(PLAYER_MODULE, 'playFile',
+                                                path))
+        except Exception as ex:
+            _logger.warning("Error playing the cached version of %r: %s",
+                            text, ex)
+            return None
+
+    def __start_render(self, sentences):
+        """
+        Renders the given sentences in a background thread
+
+        :param sentences: Sentences to render
+        """
+        thread = threading.Thread(target=self.__render, args=(sentences,),
+                                  name="tts-render")
+        thread.daemon = True
+        thread.start()
+
+    def __run(self, speech_queue):
+        """
+        Scheduler: says the pending sentences, most important first
+
+        :param speech_queue: The SpeechQueue to read
+        """
+        while True:
+            utterance = speech_queue.get()
+            if utterance is None:
+                # Queue stopped
+                return
+
+            # Wait for the speaker (checking if the queue is still running)
+            while not self._audio.acquire(constants.AUDIO_SPEAKER,
+                                          self, 1):
+                if not speech_queue.running:
+                    utterance.future.set_result(False)
+                    return
+
+            try:
+                if utterance.is_stale(time.time()):
+                    # Waited too long
+                    utterance.future.set_result(False)
+                    continue
+
+                # Say what we have to
+                said = self.__play_cached(utterance.text)
+                if said is None:
+                    said = self.__wait(self._naoqi.post(TTS_MODULE, 'say',
+                                                        utterance.text))
+            except Exception as ex:
+                _logger.exception("Error saying %r: %s", utterance.text, ex)
+                utterance.future.set_exception(ex)
+            else:
+                utterance.future.set_result(said)
+            finally:
+                self._audio.release(constants.AUDIO_SPEAKER, self)
+
+    def say(self, sentence, priority=constants.TTS_PRIORITY_NORMAL,
+            max_age=None):
+        """
+        Enqueues the given sentence, without waiting for it to be said.
+        Pending sentences with a lower priority are dropped, and an identical
+        pending sentence is said only once.
 
         :param sentence: Text to say
+        :param priority: Priority of the sentence
+        :param max_age: Time after which the sentence is no more worth saying
+                        (in seconds, None for no limit)
+        :return: A Future object, resolved with True once the sentence has
+                 been said, or with False if it has been dropped
+        """
+        queue = self._queue
+        if queue is None:
+            # Component invalidated: drop the sentence
+            future = Future()
+            future.set_result(False)
+            return future
+
+        return queue.put(sentence, priority, max_age)
+
+    def prepare(self, sentences):
+        """
+        Renders the given sentences ahead of time, in background, so that they
+        can be said without synthesis latency
+
+        :param sentences: Sentences which will be said often
         """
-        with self.__speaking_lock:
-            # Wait to be authorized to speak
-            self._can_speak.wait()
+        if self._cache is None:
+            return
+
+        with self.__prepared_lock:
+            sentences = [sentence for sentence in sentences
+                         if sentence not in self._prepared]
+            self._prepared.update(sentences)
 
-            # Say what we have to
-            self._tts.say(sentence)
+        if sentences:
+            self.__start_render(sentences)
 
     def resume(self):
         """
         Allows Nao to speak
         """
-        self._can_speak.set()
+        self._audio.release(constants.AUDIO_MICROPHONE, PAUSE_OWNER)
 
-    def pause(self):
+    def pause(self, timeout=PAUSE_TIMEOUT):
         """
-        Forbids Nao to speak
+        Forbids Nao to speak, once the current sentence has been said
+
+        :param timeout: Maximum time to wait for the current sentence (in
+                        seconds, None to wait forever)
+        :return: True if the TTS is paused, False on timeout or if the
+                 service has been stopped
         """
-        if self._can_speak.is_set():
-            with self.__speaking_lock:
-                self._can_speak.clear()
+        deadline = None if timeout is None else time.time() + timeout
+
+        # Wait for the microphone (checking if the service is still running)
+        while True:
+            wait = 1
+            if deadline is not None:
+                wait = min(wait, deadline - time.time())
+                if wait <= 0:
+                    _logger.warning("Timeout pausing the TTS")
+                    return False
+
+            if self._audio.acquire(constants.AUDIO_MICROPHONE, PAUSE_OWNER,
+                                   wait):
+                return True
+
+            if self._queue is None:
+                # Component invalidated
+                return False
@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+On-disk cache of pre-synthesized sentences
+"""
+
+# Standard library
+import collections
+import hashlib
+import logging
+import os
+import threading
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+_logger = logging.getLogger(__name__)
+
+EXTENSION = ".wav"
+""" Extension of the cached files """
+
+# ------------------------------------------------------------------------------
+
+
+class UtteranceCache(object):
+    """
+    Least-recently used cache of audio files, rendered by
+    ALTextToSpeech.sayToFile(). Entries are keyed by the text and the voice
+    (language, voice name and parameters) used to render it.
+
+    The order of use is kept in the modification time of the files, so that
+    the cache survives restarts.
+    """
+    def __init__(self, directory, max_entries):
+        """
+        Sets up members
+
+        :param directory: Directory where to store the audio files
+        :param max_entries: Maximum number of files in the cache
+        """
+        self._directory = directory
+        self._max_entries = max(1, max_entries)
+
+        # File name -> path, least recently used first
+        self._entries = collections.OrderedDict()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Returns the number of cached files
+        """
+        return len(self._entries)
+
+    def load(self):
+        """
+        Creates the cache directory or loads the files it contains
+        """
+        if not os.path.isdir(self._directory):
+            os.makedirs(self._directory)
+
+        files = []
+        for name in os.listdir(self._directory):
+            if name.endswith(EXTENSION):
+                path = os.path.join(self._directory, name)
+                files.append((os.path.getmtime(path), name, path))
+
+        with self.__lock:
+            self._entries.clear()
+            for _, name, path in sorted(files):
+                self._entries[name] = path
+
+            self.__evict()
+
+    @staticmethod
+    def make_name(text, voice):
+        """
+        Returns the name of the file of a sentence. Byte and unicode strings
+        with the same content give the same name.
+
+        :param text: Sentence
+        :param voice: A tuple describing the voice (language, name, ...)
+        :return: A file name
+        """
+        parts = []
+        for part in (text,) + tuple(voice):
+            if isinstance(part, bytes):
+                # Python 2 string
+                part = part.decode('utf-8')
+            parts.append(u"{0}".format(part))
+
+        key = u"\0".join(parts).encode('utf-8')
+        return hashlib.sha1(key).hexdigest() + EXTENSION
+
+    def get(self, text, voice):
+        """
+        Returns the path to the audio file of a sentence, if it is cached
+
+        :param text: Sentence
+        :param voice: A tuple describing the voice
+        :return: The path to the audio file, or None
+        """
+        name = self.make_name(text, voice)
+        with self.__lock:
+            path = self._entries.pop(name, None)
+            if path is None:
+                self.misses += 1
+                return None
+
+            # Most recently used
+            self._entries[name] = path
+            self.hits += 1
+
+        try:
+            os.utime(path, None)
+        except OSError:
+            # File removed by someone else
+            with self.__lock:
+                self._entries.pop(name, None)
+            return None
+
+        return path
+
+    def render(self, say_to_file, text, voice):
+        """
+        Renders a sentence to an audio file, if it is not yet cached
+
+        :param say_to_file: Method rendering a sentence to a file, like
+                            ALTextToSpeech.sayToFile(text, path)
+        :param text: Sentence
+        :param voice: A tuple describing the voice
+        :return: The path to the audio file
+        """
+        name = self.make_name(text, voice)
+        with self.__lock:
+            path = self._entries.get(name)
+            if path is not None and os.path.exists(path):
+                return path
+
+        path = os.path.join(self._directory, name)
+        say_to_file(text, path)
+        _logger.debug("Rendered %r to %s", text, path)
+
+        with self.__lock:
+            self._entries.pop(name, None)
+            self._entries[name] = path
+            self.__evict()
+
+        return path
+
+    def __evict(self):
+        """
+        Removes the least recently used files above the cache size. Must be
+        called while holding the lock.
+        """
+        while len(self._entries) > self._max_entries:
+            _, path = self._entries.popitem(last=False)
+            try:
+                os.remove(path)
+            except OSError as ex:
+                _logger.debug("Error removing %s: %s", path, ex)
@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Priority queue of the sentences to say
+"""
+
+# Local modules
+from internals.futures import Future
+
+# Standard library
+import heapq
+import itertools
+import threading
+import time
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class Utterance(object):
+    """
+    A pending sentence
+    """
+    __slots__ = ('text', 'priority', 'deadline', 'future', 'dropped')
+
+    def __init__(self, text, priority, max_age=None):
+        """
+        Sets up members
+
+        :param text: Sentence to say
+        :param priority: Priority of the sentence (higher is more important)
+        :param max_age: Time after which the sentence is no more worth saying
+                        (in seconds, None for no limit)
+        """
+        self.text = text
+        self.priority = priority
+        if max_age is None:
+            self.deadline = None
+        else:
+            self.deadline = time.time() + max_age
+        self.future = Future()
+        self.dropped = False
+
+    def __repr__(self):
+        """
+        String representation
+        """
+        return "Utterance({0!r}, priority={1})".format(self.text,
+                                                       self.priority)
+
+    def is_stale(self, now):
+        """
+        Checks if the sentence is no more worth saying
+
+        :param now: Current time
+        """
+        return self.deadline is not None and now > self.deadline
+
+
+class SpeechQueue(object):
+    """
+    Priority queue of utterances. Sentences of the same priority are said in
+    order of arrival.
+
+    Identical pending sentences are coalesced: they share the same future.
+    When a sentence arrives, the stale and lower-priority pending sentences are
+    dropped: their future is resolved with False.
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # Heap of (-priority, sequence, utterance)
+        self._heap = []
+        self._sequence = itertools.count()
+
+        # Pending utterances: text -> utterance
+        self._pending = {}
+
+        # Counters
+        self.coalesced = 0
+        self.dropped = 0
+
+        self._running = True
+        self.__condition = threading.Condition()
+
+    def __len__(self):
+        """
+        Returns the number of pending sentences
+        """
+        return len(self._pending)
+
+    @property
+    def running(self):
+        """
+        False once the queue has been stopped
+        """
+        return self._running
+
+    def put(self, text, priority, max_age=None):
+        """
+        Enqueues a sentence
+
+        :param text: Sentence to say
+        :param priority: Priority of the sentence
+        :param max_age: Time after which the sentence is no more worth saying
+                        (in seconds, None for no limit)
+        :return: A Future object, resolved with True once the sentence has
+                 been said, or with False if it has been dropped
+        """
+        dropped = []
+        with self.__condition:
+            if not self._running:
+                future = Future()
+                future.set_result(False)
+                return future
+
+            utterance = self._pending.get(text)
+            if utterance is not None and utterance.priority >= priority:
+                # Same sentence already waiting
+                self.coalesced += 1
+                if max_age is None:
+                    utterance.deadline = None
+                elif utterance.deadline is not None:
+                    utterance.deadline = max(utterance.deadline,
+                                             time.time() + max_age)
+                return utterance.future
+
+            # Drop the stale and less important sentences
+            now = time.time()
+            for pending in list(self._pending.values()):
+                if pending.priority < priority or pending.is_stale(now):
+                    dropped.append(self.__drop(pending))
+
+            if utterance is not None and utterance.dropped:
+                # Same sentence with a lower priority: keep its future
+                new_utterance = Utterance(text, priority, max_age)
+                new_utterance.future = utterance.future
+                utterance = new_utterance
+                self.coalesced += 1
+                self.dropped -= 1
+                dropped.remove(utterance.future)
+            else:
+                utterance = Utterance(text, priority, max_age)
+
+            self._pending[text] = utterance
+            heapq.heappush(self._heap,
+                           (-priority, next(self._sequence), utterance))
+            self.__condition.notify()
+
+        for future in dropped:
+            future.set_result(False)
+
+        return utterance.future
+
+    def __drop(self, utterance):
+        """
+        Drops a pending utterance. Must be called while holding the lock; its
+        future must be resolved after the lock has been released.
+
+        :param utterance: The utterance to drop
+        :return: The future of the utterance
+        """
+        utterance.dropped = True
+        del self._pending[utterance.text]
+        self.dropped += 1
+        return utterance.future
+
+    def get(self, timeout=None):
+        """
+        Waits for the next sentence to say
+
+        :param timeout: Maximum time to wait (in seconds)
+        :return: The next Utterance, or None
+        """
+        end = None if timeout is None else time.time() + timeout
+        while True:
+            utterance = None
+            dropped = []
+            with self.__condition:
+                if not self._running:
+                    return None
+
+                now = time.time()
+                while self._heap:
+                    candidate = heapq.heappop(self._heap)[2]
+                    if candidate.dropped:
+                        # Already dropped
+                        continue
+                    elif candidate.is_stale(now):
+                        dropped.append(self.__drop(candidate))
+                        continue
+
+                    del self._pending[candidate.text]
+                    utterance = candidate
+                    break
+                else:
+                    if not dropped:
+                        # Nothing to do: wait
+                        if end is None:
+                            self.__condition.wait()
+                        elif now < end:
+                            self.__condition.wait(end - now)
+                        else:
+                            return None
+
+            # Resolve the futures out of the lock
+            for future in dropped:
+                future.set_result(False)
+
+            if utterance is not None:
+                return utterance
+
+    def stop(self):
+        """
+        Stops the queue, dropping the pending sentences
+        """
+        with self.__condition:
+            self._running = False
+            dropped = [self.__drop(utterance)
+                       for utterance in list(self._pending.values())]
+            del self._heap[:]
+            self.__condition.notify_all()
+
+        for future in dropped:
+            future.set_result(False)
@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Vocabulary of the speech recognition listeners
+"""
+
+# Standard library
+import threading
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+def parse_recognized(raw_words):
+    """
+    Parses the value of the WordRecognized ALMemory event, which interleaves
+    the recognized words and their confidence: [word, confidence, ...]
+
+    :param raw_words: Value of the WordRecognized event
+    :return: The list of (word, confidence) tuples, best confidence first
+    """
+    results = []
+    for idx in range(0, len(raw_words) - 1, 2):
+        word = raw_words[idx]
+        try:
+            confidence = float(raw_words[idx + 1])
+        except (TypeError, ValueError):
+            continue
+
+        if word:
+            results.append((word, confidence))
+
+    # Stable sort: keep the order of the engine for equal confidences
+    results.sort(key=lambda result: result[1], reverse=True)
+    return results
+
+# ------------------------------------------------------------------------------
+
+
+class VocabularyIndex(object):
+    """
+    Union of the words of the speech listeners, indexed by word.
+
+    The version number is incremented each time the union of the words
+    changes, which allows to know if a compiled vocabulary is still valid.
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # Listener -> frozenset(words)
+        self._listeners = {}
+
+        # Listener -> minimal confidence
+        self._thresholds = {}
+
+        # Word -> frozenset(listeners using it)
+        self._words_listeners = {}
+
+        # Version of the union of words, and its cached value
+        self._version = 0
+        self._words = frozenset()
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        """
+        Returns the number of distinct words
+        """
+        return len(self._words_listeners)
+
+    @property
+    def version(self):
+        """
+        The version of the union of words
+        """
+        return self._version
+
+    def add(self, listener, words, threshold=0.):
+        """
+        Adds or replaces the words of a listener
+
+        :param listener: A speech listener
+        :param words: The words recognized by the listener
+        :param threshold: Minimal confidence of the words for the listener
+        """
+        with self.__lock:
+            old_words = self._listeners.get(listener, frozenset())
+            new_words = frozenset(words)
+            self._listeners[listener] = new_words
+            self._thresholds[listener] = threshold
+            self.__update(listener, old_words, new_words)
+
+    def remove(self, listener):
+        """
+        Removes the words of a listener
+
+        :param listener: A speech listener
+        :raise KeyError: Unknown listener
+        """
+        with self.__lock:
+            self.__update(listener, self._listeners.pop(listener),
+                          frozenset())
+            del self._thresholds[listener]
+
+    def clear(self):
+        """
+        Removes all listeners
+        """
+        with self.__lock:
+            if self._words_listeners:
+                self._version += 1
+
+            self._listeners.clear()
+            self._thresholds.clear()
+            self._words_listeners.clear()
+            self._words = frozenset()
+
+    def match(self, word):
+        """
+        Returns the listeners of a word
+
+        :param word: A recognized word
+        :return: A frozenset of listeners (can be empty)
+        """
+        return self._words_listeners.get(word, frozenset())
+
+    def threshold(self, listener):
+        """
+        Returns the minimal confidence of the words for a listener
+
+        :param listener: A speech listener
+        :return: The threshold of the listener (0 if unknown)
+        """
+        return self._thresholds.get(listener, 0.)
+
+    def snapshot(self):
+        """
+        Returns the union of words and its version
+
+        :return: A (version, frozenset(words)) tuple
+        """
+        with self.__lock:
+            return self._version, self._words
+
+    def __update(self, listener, old_words, new_words):
+        """
+        Updates the words index. Must be called while holding the lock.
+
+        :param listener: The updated listener
+        :param old_words: Previous words of the listener
+        :param new_words: New words of the listener
+        """
+        changed = False
+        for word in new_words.difference(old_words):
+            listeners = self._words_listeners.get(word, frozenset())
+            self._words_listeners[word] = listeners.union((listener,))
+            changed = changed or not listeners
+
+        for word in old_words.difference(new_words):
+            listeners = self._words_listeners[word].difference((listener,))
+            if listeners:
+                self._words_listeners[word] = listeners
+            else:
+                del self._words_listeners[word]
+                changed = True
+
+        if changed:
+            # The union of words has changed
+            self._version += 1
+            self._words = frozenset(self._words_listeners)
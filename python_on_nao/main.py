@@ -71,6 +71,10 @@ def main(pip, pport):
         'pelix.shell.eventadmin',
 
         # Nao Internals
+        'internals.audio',
+        'internals.memory_bridge',
+        'internals.naoqi_calls',
+        'internals.proxies',
         'internals.mqtt',
         'internals.speech',
         'internals.touch',
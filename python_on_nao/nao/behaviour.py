@@ -7,9 +7,6 @@ Nao movements
 # Nao Internals
 import internals.constants
 
-# Nao SDK
-from naoqi import ALProxy
-
 # Pelix
 from pelix.ipopo.decorators import ComponentFactory, Provides, Requires, \
     Instantiate, Validate, Invalidate
@@ -49,6 +46,15 @@ Order -> Behaviour name association
 DEFAULT_BEHAVIOUR = "Neutral"
 """ Default behaviour """
 
+WORD_THRESHOLD = .5
+""" Minimal confidence of a recognized order """
+
+MANAGER = "ALBehaviorManager"
+""" Name of the NAOqi behaviour manager module """
+
+QUERY_TIMEOUT = 5
+""" Maximum time to wait for the answer of the behaviour manager """
+
 # ------------------------------------------------------------------------------
 
 
@@ -56,6 +62,7 @@ DEFAULT_BEHAVIOUR = "Neutral"
 @Provides('nao.behaviour')
 @Requires('_speech', internals.constants.SERVICE_SPEECH)
 @Requires('_mqtt', pelix.services.SERVICE_MQTT_CONNECTOR_FACTORY)
+@Requires('_naoqi', internals.constants.SERVICE_NAOQI_CALLS)
 @Instantiate('nao-behaviour-control')
 class NaoBehaviour(object):
     """
@@ -70,8 +77,20 @@ class NaoBehaviour(object):
 
         # inject mqtt
         self._mqtt = None
-        # Behaviour manager
-        self._manager = None
+        # NAOqi call service
+        self._naoqi = None
+
+    def __query(self, method, *args):
+        """
+        Calls a method of the behaviour manager and waits for its result
+
+        :param method: Name of the method
+        :param args: Arguments of the method
+        :return: The result of the method
+        :raise OSError: Timeout calling the method
+        """
+        return self._naoqi.call(MANAGER, method, *args,
+                                timeout=QUERY_TIMEOUT).result()
 
     def get_behaviours(self):
         """
@@ -79,28 +98,33 @@ class NaoBehaviour(object):
 
         :return: A tuple (list of known behaviours, list of running ones)
         """
-        return self._manager.getInstalledBehaviors(), \
-            self._manager.getRunningBehaviors()
+        # Both calls are executed at the same time
+        installed = self._naoqi.call(MANAGER, 'getInstalledBehaviors',
+                                     timeout=QUERY_TIMEOUT)
+        running = self._naoqi.call(MANAGER, 'getRunningBehaviors',
+                                   timeout=QUERY_TIMEOUT)
+        return installed.result(), running.result()
 
     def launch_behaviour(self, behaviour, blocking=False):
         """
         Launches the given behaviour, if possible
 
         :param behaviour: The name of a behaviour
+        :param blocking: If True, wait for the end of the behaviour
+        :return: The Future object of the running behaviour, resolved with
+                 True at its end, or None if it can't be launched
         """
         # Check if the behaviour exists
-        if self._manager.isBehaviorInstalled(behaviour):
+        if self.__query('isBehaviorInstalled', behaviour):
             # Check if it is not already running
-            if not self._manager.isBehaviorRunning(behaviour):
-                # Launch behavior. This is a blocking call,
-                # use post if you do not want to wait for the behavior to
-                # finish.
-                if not blocking:
-                    self._manager.post.runBehavior(behaviour)
-                else:
+            if not self.__query('isBehaviorRunning', behaviour):
+                # Launch behavior, without blocking the caller
+                future = self._naoqi.post(MANAGER, 'runBehavior', behaviour)
+                if blocking:
                     # Clean up after the blocking code
-                    self._manager.runBehavior(behaviour)
-                    self._manager.stopBehavior(behaviour)
+                    future.result()
+                    self.__query('stopBehavior', behaviour)
+                return future
             else:
                 _logger.warning("A behaviour is already running")
         else:
@@ -113,9 +137,9 @@ class NaoBehaviour(object):
         :param behaviour: The name of a behaviour
         """
         # Check if it is already running
-        if self._manager.isBehaviorRunning(behaviour):
+        if self.__query('isBehaviorRunning', behaviour):
             # Stop it, and wait a little
-            self._manager.stopBehavior(behaviour)
+            self.__query('stopBehavior', behaviour)
             time.sleep(.3)
         else:
             _logger.info("Behaviour %s is not running", behaviour)
@@ -127,7 +151,6 @@ class NaoBehaviour(object):
         :param word: The best-match word
         :param all_words: All the words that have been recognized
         """
-        # TODO: Add a threshold to handle the word only if possible
         self.launch_behaviour(BEHAVIOURS_MAP.get(word, DEFAULT_BEHAVIOUR))
         if word == 'lèftoi':
             # "lèftoi" instead of "lève toi" (to ease speech recognition)
@@ -141,12 +164,8 @@ class NaoBehaviour(object):
         """
         Component validated
         """
-        # Make the proxy to the behaviour manager
-        self._manager = ALProxy("ALBehaviorManager")
-
         # Setup the motion control
-        motion = ALProxy("ALMotion")
-        motion.setStiffnesses("Body", 1.0)
+        self._naoqi.call("ALMotion", "setStiffnesses", "Body", 1.0).result()
 
         # Print available behaviours
         self.get_behaviours()
@@ -159,7 +178,8 @@ class NaoBehaviour(object):
         self._mqtt.publish("/nao/openhab/radio", "8")
 
         # Register to some words
-        self._speech.add_listener(self, list(BEHAVIOURS_MAP.keys()))
+        self._speech.add_listener(self, list(BEHAVIOURS_MAP.keys()),
+                                  WORD_THRESHOLD)
 
     @Invalidate
     def _invalidate(self, context):
@@ -168,6 +188,3 @@ class NaoBehaviour(object):
         """
         # Unregister from speech recognition
         self._speech.remove_listener(self)
-
-        # Clean up
-        self._manager = None
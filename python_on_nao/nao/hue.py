@@ -5,11 +5,13 @@ MQTT Hue message sender
 """
 
 # Nao Internals
+from internals.interactions import InteractionExecutor, POLICY_QUEUE, \
+    DEFAULT_DEBOUNCE
 import internals.constants
 
 # Pelix
 from pelix.ipopo.decorators import ComponentFactory, Provides, Requires, \
-    Instantiate, Property
+    Instantiate, Property, Validate, Invalidate, BindField
 import pelix.services
 
 # Standard library
@@ -44,6 +46,9 @@ OpenHAB MQTT color map
 DEFAULT_COLOR = COLOR_MAP['blue']
 """ Default color: blue """
 
+PROMPT_READY = 'Je suis prêt à changer de couleur'
+""" Said before listening to a color """
+
 # ------------------------------------------------------------------------------
 
 
@@ -56,6 +61,8 @@ DEFAULT_COLOR = COLOR_MAP['blue']
 @Requires('_mqtt', pelix.services.SERVICE_MQTT_CONNECTOR_FACTORY)
 @Requires('_leds', 'nao.leds')
 @Property('_events_topics', pelix.services.PROP_EVENT_TOPICS, ['/nao/touch/*'])
+@Property('_policy', 'interaction.policy', POLICY_QUEUE)
+@Property('_debounce', 'interaction.debounce', DEFAULT_DEBOUNCE)
 @Instantiate('hue-control-mqtt')
 class HueMqttControll(object):
     """
@@ -72,6 +79,35 @@ class HueMqttControll(object):
         self._behaviour = None
         # Property
         self._events_topics = None
+        self._policy = POLICY_QUEUE
+        self._debounce = DEFAULT_DEBOUNCE
+
+        # Executes the interactions out of the EventAdmin thread
+        self._executor = None
+
+    @Validate
+    def _validate(self, context):
+        """
+        Component validated
+        """
+        self._executor = InteractionExecutor(self._policy, self._debounce,
+                                             logname="hue-interactions")
+        self._executor.start()
+
+    @Invalidate
+    def _invalidate(self, context):
+        """
+        Component invalidated
+        """
+        self._executor.stop()
+        self._executor = None
+
+    @BindField('_tts')
+    def _bind_tts(self, field, service, svc_ref):
+        """
+        Text-to-speech service bound
+        """
+        service.prepare([PROMPT_READY])
 
     @staticmethod
     def _make_topic(lamp, action):
@@ -133,15 +169,37 @@ class HueMqttControll(object):
             else:
                 return
 
-            if self._tts is not None:
-                # Tell the user we're ready
-                self._tts.say('Je suis prêt à changer de couleur')
+            executor = self._executor
+            if executor is None:
+                # Component invalidated
+                return
 
-            # Recognize the color
-            word = self._speech.simple_recognize(list(COLOR_MAP.keys()))
+            # Don't block the EventAdmin thread
+            executor.submit(button, self.__change_color, lamp)
 
-            # Change the color
-            self.color(lamp, word)
+    def __change_color(self, interaction, lamp):
+        """
+        Asks for a color and changes the color of the given lamp
 
-            # Change the LEDs (we have the same color names)
-            self._leds.change_leds(word)
+        :param interaction: The Interaction handle
+        :param lamp: Lamp ID
+        """
+        if self._tts is not None:
+            # Tell the user we're ready
+            self._tts.say(PROMPT_READY,
+                          internals.constants.TTS_PRIORITY_HIGH).result()
+
+        # Recognize the color
+        word = interaction.track(self._speech.simple_recognize_async(
+            list(COLOR_MAP.keys()))).result()
+        if word is internals.constants.SPEECH_NO_RESULT \
+                or interaction.cancelled:
+            # Nothing heard, or replaced by another interaction
+            _logger.debug("No color recognized")
+            return
+
+        # Change the color
+        self.color(lamp, word)
+
+        # Change the LEDs (we have the same color names)
+        self._leds.change_leds(word)
@@ -4,12 +4,12 @@
 Nao LEDs color changer
 """
 
-# Nao SDK
-from naoqi import ALProxy
+# Nao Internals
+import internals.constants
 
 # Pelix
-from pelix.ipopo.decorators import ComponentFactory, Provides, Instantiate, \
-    Validate, Invalidate
+from pelix.ipopo.decorators import ComponentFactory, Provides, Requires, \
+    Instantiate, Invalidate
 
 # Standard library
 import logging
@@ -43,11 +43,15 @@ Handled colors
 DEFAULT_COLOR = 0x00FFFFFF
 """ Default color: white """
 
+FADE_DURATION = 1.0
+""" Duration of a color transition (in seconds) """
+
 # ------------------------------------------------------------------------------
 
 
 @ComponentFactory('leds-control')
 @Provides('nao.leds')
+@Requires('_naoqi', internals.constants.SERVICE_NAOQI_CALLS)
 @Instantiate('leds-control')
 class LedsControl(object):
     """
@@ -57,25 +61,29 @@ class LedsControl(object):
         """
         Sets up members
         """
-        # LEDs proxy
-        self._leds = None
+        # Injected NAOqi call service
+        self._naoqi = None
+
+        # Future of the current transition
+        self._fade = None
 
     def change_leds(self, color):
         """
-        Changes the color of the LEDs on the robot
+        Changes the color of the LEDs on the robot, without waiting for the
+        end of the transition
 
         :param color: name of the color
+        :return: A Future object, resolved with True at the end of the
+                 transition, or with False if it has been replaced
         """
-        # Change color. Transition lasts 1 second
-        self._leds.fadeRGB('AllLeds', COLOR_MAP.get(color, DEFAULT_COLOR), 1.0)
+        if self._fade is not None:
+            # Replace the current transition
+            self._fade.cancel()
 
-    @Validate
-    def _validate(self, context):
-        """
-        Component validated
-        """
-        # Prepare the LED proxy
-        self._leds = ALProxy('ALLeds')
+        self._fade = self._naoqi.post('ALLeds', 'fadeRGB', 'AllLeds',
+                                      COLOR_MAP.get(color, DEFAULT_COLOR),
+                                      FADE_DURATION)
+        return self._fade
 
     @Invalidate
     def _invalidate(self, context):
@@ -83,4 +91,4 @@ class LedsControl(object):
         Component invalidated
         """
         # Clean up
-        self._leds = None
+        self._fade = None
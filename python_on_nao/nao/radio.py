@@ -37,6 +37,9 @@ OpenHAB MQTT radio map
 DEFAULT_RADIO = RADIO_MAP['radio']
 """ Default radio: radio (first radio channel found) """
 
+WORD_THRESHOLD = .5
+""" Minimal confidence of a recognized order """
+
 # ------------------------------------------------------------------------------
 
 
@@ -84,7 +87,6 @@ class RadioMqttControll(object):
         :param word: The best-match word
         :param all_words: All the words that have been recognized
         """
-        # TODO: Add a threshold to handle the word only if possible
         self.handle_order(word)
 
     @Validate
@@ -93,7 +95,8 @@ class RadioMqttControll(object):
         Component validated
         """
         # Register to some words
-        self._speech.add_listener(self, list(RADIO_MAP.keys()))
+        self._speech.add_listener(self, list(RADIO_MAP.keys()),
+                                  WORD_THRESHOLD)
 
     @Invalidate
     def _invalidate(self, context):
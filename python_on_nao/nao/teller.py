@@ -27,6 +27,16 @@ __docformat__ = "restructuredtext en"
 
 _logger = logging.getLogger(__name__)
 
+DOOR_STATES = {'CLOSED': "fermée",
+               'OPEN': "ouverte"}
+""" MQTT door state -> French description """
+
+DOOR_UNKNOWN = "dans un état que je ne connais pas"
+""" Description of an unknown door state """
+
+DOOR_SENTENCE = "La porte est {0}"
+""" Door state sentence format """
+
 # ------------------------------------------------------------------------------
 
 
@@ -37,6 +47,9 @@ _logger = logging.getLogger(__name__)
 @Provides('nao.teller')
 @Provides(services.SERVICE_MQTT_LISTENER)
 @Property('_topics', services.PROP_MQTT_TOPICS, '/openhab/nao/+')
+@Property('_conflated', internals.constants.PROP_MQTT_CONFLATE,
+          ['/openhab/nao/temperature', '/openhab/nao/weather'])
+@Property('_message', internals.constants.PROP_MQTT_MESSAGE, True)
 @Instantiate('nao-teller')
 class NaoStateTeller(object):
     """
@@ -48,6 +61,8 @@ class NaoStateTeller(object):
         """
         # Properties
         self._topics = None
+        self._conflated = None
+        self._message = True
         # inject mqtt
         self._mqtt = None
         # Nao services
@@ -71,21 +86,31 @@ class NaoStateTeller(object):
     def handle_mqtt_message(self, topic, payload, qos):
         """
         An MQTT message has been received
+
+        :param topic: Message topic
+        :param payload: An MqttMessage (see PROP_MQTT_MESSAGE)
+        :param qos: Quality of Service
         """
         # Topics: /openhab/nao/[door,temperature,weather]
         item = topic.split('/')[3]
+        try:
+            # Decoded once, shared with the other listeners
+            text = payload.text
+        except UnicodeDecodeError:
+            _logger.warning("Invalid payload on %s: %r", topic, payload)
+            return
 
         # Store state
         if item == "door":
-            self._door_state = payload
-            if payload == 'OPEN':
+            self._door_state = text
+            if text == 'OPEN':
                 self._mqtt.publish("/nao/openhab/radio", "7")
         elif item == "temperature":
             # Replace '.' by ',' in numbers (better TTS results)
-            self._last_temperature = payload.replace('.', ',')
+            self._last_temperature = text.replace('.', ',')
         elif item == "weather":
             # Replace '.' by ',' in numbers (better TTS results)
-            self._last_weather = payload.replace('.', ',')
+            self._last_weather = text.replace('.', ',')
 
     def say(self, sentence):
         """
@@ -97,15 +122,8 @@ class NaoStateTeller(object):
         """
         Says the last known state of the door
         """
-        payload = self._door_state
-        if payload == "CLOSED":
-            state = "fermée"
-        elif payload == "OPEN":
-            state = "ouverte"
-        else:
-            state = "dans un état que je ne connais pas"
-
-        self._tts.say("La porte est {0}".format(state))
+        state = DOOR_STATES.get(self._door_state, DOOR_UNKNOWN)
+        self._tts.say(DOOR_SENTENCE.format(state))
 
     def say_temperature(self):
         """
@@ -157,6 +175,10 @@ class NaoStateTeller(object):
         """
         Component validated
         """
+        # Render the door sentences ahead of time
+        self._tts.prepare([DOOR_SENTENCE.format(state) for state
+                           in list(DOOR_STATES.values()) + [DOOR_UNKNOWN]])
+
         # Register to some words
         self._speech.add_listener(self, list(self.__orders.keys()))
 
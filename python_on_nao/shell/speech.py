@@ -61,4 +61,8 @@ class TellerShell(object):
         """
         Speech recognition, with the given word list as vocabulary
         """
-        io_handler.write_line(self._speech.simple_recognize(args))
+        word = self._speech.simple_recognize(args)
+        if word is internals.constants.SPEECH_NO_RESULT:
+            io_handler.write_line("No word recognized")
+        else:
+            io_handler.write_line(word)
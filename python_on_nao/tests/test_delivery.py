@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the notification pool, its overflow policies and its conflation
+"""
+
+# Tested modules
+from internals.delivery import NotificationPool, POLICY_BLOCK, \
+    POLICY_COALESCE, POLICY_DROP_OLDEST
+
+# Standard library
+import threading
+import time
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class NotificationPoolTest(unittest.TestCase):
+    """
+    Tests the notification pool
+    """
+    def setUp(self):
+        """
+        Prepares the list of executed tasks
+        """
+        self.executed = []
+        self.pool = None
+
+    def tearDown(self):
+        """
+        Stops the pool
+        """
+        if self.pool is not None:
+            self.pool.stop()
+
+    def _start(self, queue_size, policy):
+        """
+        Starts a single-thread pool, and blocks its worker until the
+        returned event is set
+        """
+        self.pool = NotificationPool(1, queue_size, policy)
+        self.pool.start()
+
+        gate = threading.Event()
+        self.pool.enqueue('gate', gate.wait)
+        self._wait(lambda: self.pool.depth == 0)
+        return gate
+
+    def _task(self, name):
+        """
+        Task storing its name
+        """
+        self.executed.append(name)
+
+    @staticmethod
+    def _wait(condition, timeout=2):
+        """
+        Waits for a condition to be true
+        """
+        end = time.time() + timeout
+        while not condition() and time.time() < end:
+            time.sleep(.01)
+        return condition()
+
+    def test_arguments(self):
+        """
+        Invalid pool parameters are refused
+        """
+        self.assertRaises(ValueError, NotificationPool, 0)
+        self.assertRaises(ValueError, NotificationPool, 1, -1)
+        self.assertRaises(ValueError, NotificationPool, 1, 1, 'unknown')
+
+    def test_order(self):
+        """
+        A single-thread pool executes the tasks in order
+        """
+        gate = self._start(0, POLICY_BLOCK)
+        for idx in range(10):
+            self.assertTrue(self.pool.enqueue(idx % 3, self._task, idx))
+
+        gate.set()
+        self.assertTrue(self._wait(lambda: len(self.executed) == 10))
+        self.assertEqual(self.executed, list(range(10)))
+
+    def test_block(self):
+        """
+        With the block policy, producers wait for a free slot
+        """
+        gate = self._start(2, POLICY_BLOCK)
+        self.pool.enqueue('a', self._task, 'a')
+        self.pool.enqueue('b', self._task, 'b')
+
+        producer = threading.Thread(target=self.pool.enqueue,
+                                    args=('c', self._task, 'c'))
+        producer.start()
+        producer.join(.2)
+        self.assertTrue(producer.is_alive())
+
+        gate.set()
+        producer.join(2)
+        self.assertFalse(producer.is_alive())
+        self.assertTrue(self._wait(lambda: len(self.executed) == 3))
+        self.assertEqual(self.executed, ['a', 'b', 'c'])
+        self.assertEqual(self.pool.dropped, 0)
+
+    def test_drop_oldest(self):
+        """
+        With the drop-oldest policy, the oldest pending task is dropped
+        """
+        gate = self._start(2, POLICY_DROP_OLDEST)
+        for name in ('a', 'b', 'c', 'd'):
+            self.assertTrue(self.pool.enqueue(name, self._task, name))
+
+        gate.set()
+        self.assertTrue(self._wait(lambda: len(self.executed) == 2))
+        time.sleep(.05)
+        self.assertEqual(self.executed, ['c', 'd'])
+        self.assertEqual(self.pool.dropped, 2)
+
+    def test_coalesce(self):
+        """
+        With the coalesce policy, the pending task of the same key is
+        replaced, keeping its position
+        """
+        gate = self._start(2, POLICY_COALESCE)
+        self.pool.enqueue('x', self._task, 'x1')
+        self.pool.enqueue('y', self._task, 'y1')
+        self.pool.enqueue('x', self._task, 'x2')
+
+        # No pending task of this key: drop the oldest one
+        self.pool.enqueue('z', self._task, 'z1')
+
+        gate.set()
+        self.assertTrue(self._wait(lambda: len(self.executed) == 2))
+        time.sleep(.05)
+        self.assertEqual(self.executed, ['y1', 'z1'])
+        self.assertEqual(self.pool.coalesced, 1)
+        self.assertEqual(self.pool.dropped, 1)
+
+    def test_stop(self):
+        """
+        Stopping the pool discards the pending tasks
+        """
+        gate = self._start(0, POLICY_BLOCK)
+        self.pool.enqueue('a', self._task, 'a')
+        stopper = threading.Thread(target=self.pool.stop)
+        stopper.start()
+        stopper.join(.1)
+        gate.set()
+        stopper.join(2)
+
+        self.assertEqual(self.executed, [])
+        self.assertFalse(self.pool.enqueue('b', self._task, 'b'))
+
+    def test_errors(self):
+        """
+        Errors of a task don't stop the worker
+        """
+        gate = self._start(0, POLICY_BLOCK)
+        self.pool.enqueue('a', self._task)
+        self.pool.enqueue('b', self._task, 'b')
+
+        gate.set()
+        self.assertTrue(self._wait(lambda: self.executed == ['b']))
+
+    def test_latest(self):
+        """
+        Only the latest pending task of a key enqueued with enqueue_latest()
+        is executed, at the position of the first one
+        """
+        gate = self._start(0, POLICY_BLOCK)
+        self.pool.enqueue_latest('state', self._task, 's1')
+        self.pool.enqueue('event', self._task, 'e1')
+        self.pool.enqueue_latest('state', self._task, 's2')
+        self.pool.enqueue_latest('other', self._task, 'o1')
+
+        gate.set()
+        self.assertTrue(self._wait(lambda: len(self.executed) == 3))
+        time.sleep(.05)
+        self.assertEqual(self.executed, ['s2', 'e1', 'o1'])
+        self.assertEqual(self.pool.conflated, 1)
+
+    def test_latest_running(self):
+        """
+        A task enqueued while the previous one of its key is running is
+        executed too
+        """
+        self.pool = NotificationPool(1)
+        self.pool.start()
+
+        gate = threading.Event()
+        self.pool.enqueue_latest('state', gate.wait)
+        self._wait(lambda: self.pool.depth == 0)
+        self.pool.enqueue_latest('state', self._task, 's2')
+
+        gate.set()
+        self.assertTrue(self._wait(lambda: self.executed == ['s2']))
+        self.assertEqual(self.pool.conflated, 0)
+
+    def test_latest_separate(self):
+        """
+        Tasks enqueued with enqueue() are not conflated with the "latest"
+        ones
+        """
+        gate = self._start(0, POLICY_BLOCK)
+        self.pool.enqueue('state', self._task, 'e1')
+        self.pool.enqueue_latest('state', self._task, 's1')
+        self.pool.enqueue('state', self._task, 'e2')
+
+        gate.set()
+        self.assertTrue(self._wait(lambda: len(self.executed) == 3))
+        self.assertEqual(self.executed, ['e1', 's1', 'e2'])
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the tracking of the EventAdmin handlers of the events sources
+"""
+
+# Tested modules
+from internals.event_demand import DemandTracker
+
+# Standard library
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+TOPICS = {'FrontTactilTouched': ['/nao/touch/front/touch',
+                                 '/nao/touch/front/release'],
+          'RearTactilTouched': ['/nao/touch/rear/touch',
+                                '/nao/touch/rear/release'],
+          'WordRecognized': '/nao/speech/word'}
+""" Topics sent for each key """
+
+# ------------------------------------------------------------------------------
+
+
+class DemandTrackerTest(unittest.TestCase):
+    """
+    Tests the demand tracker
+    """
+    def setUp(self):
+        """
+        Prepares a tracker storing its calls
+        """
+        self.calls = []
+        self.failing = False
+        self.tracker = DemandTracker(TOPICS, self._subscribe,
+                                     self._unsubscribe)
+
+    def _subscribe(self, key):
+        """
+        Stores a subscription
+        """
+        if self.failing:
+            raise IOError("NAOqi error")
+
+        self.calls.append(('subscribe', key))
+
+    def _unsubscribe(self, key):
+        """
+        Stores an unsubscription
+        """
+        self.calls.append(('unsubscribe', key))
+
+    def test_patterns(self):
+        """
+        Keys are subscribed to when a handler pattern matches one of their
+        topics
+        """
+        self.tracker.start()
+        self.tracker.set_handler('a', '/nao/touch/front/*')
+        self.assertEqual(self.tracker.subscribed,
+                         frozenset(['FrontTactilTouched']))
+
+        self.tracker.set_handler('b', ['/nao/*/release', '/nao/speech/word'])
+        self.assertEqual(self.tracker.subscribed, frozenset(TOPICS))
+
+        # Unknown topics
+        self.tracker.set_handler('c', '/other/*')
+        self.assertEqual(len(self.calls), 3)
+
+    def test_shared(self):
+        """
+        A key is unsubscribed from when its last handler is gone
+        """
+        self.tracker.start()
+        self.tracker.set_handler('a', '/nao/touch/*')
+        self.tracker.set_handler('b', '/nao/touch/front/touch')
+        self.assertEqual(sorted(self.calls),
+                         [('subscribe', 'FrontTactilTouched'),
+                          ('subscribe', 'RearTactilTouched')])
+
+        del self.calls[:]
+        self.tracker.remove_handler('a')
+        self.assertEqual(self.calls, [('unsubscribe', 'RearTactilTouched')])
+
+        del self.calls[:]
+        self.tracker.remove_handler('b')
+        self.assertEqual(self.calls, [('unsubscribe', 'FrontTactilTouched')])
+
+        # Unknown handler
+        self.tracker.remove_handler('b')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_update(self):
+        """
+        Updating the topics of a handler updates the subscriptions
+        """
+        self.tracker.start()
+        self.tracker.set_handler('a', '/nao/touch/front/*')
+        del self.calls[:]
+
+        self.tracker.set_handler('a', '/nao/speech/*')
+        self.assertEqual(self.calls, [('subscribe', 'WordRecognized'),
+                                      ('unsubscribe', 'FrontTactilTouched')])
+
+        del self.calls[:]
+        self.tracker.set_handler('a', '/other/*')
+        self.assertEqual(self.calls, [('unsubscribe', 'WordRecognized')])
+        self.assertEqual(self.tracker.subscribed, frozenset())
+
+    def test_active(self):
+        """
+        Keys are only subscribed to while the tracker is started
+        """
+        self.tracker.set_handler('a', '/nao/speech/word')
+        self.assertEqual(self.calls, [])
+
+        self.tracker.start()
+        self.assertEqual(self.calls, [('subscribe', 'WordRecognized')])
+
+        self.tracker.stop()
+        self.assertEqual(self.calls[-1], ('unsubscribe', 'WordRecognized'))
+        self.assertEqual(self.tracker.subscribed, frozenset())
+
+        # Handlers are still tracked while stopped
+        self.tracker.start()
+        self.assertEqual(self.tracker.subscribed,
+                         frozenset(['WordRecognized']))
+
+    def test_errors(self):
+        """
+        A failed subscription is retried on the next update
+        """
+        self.failing = True
+        self.tracker.start()
+        self.tracker.set_handler('a', '/nao/speech/word')
+        self.assertEqual(self.tracker.subscribed, frozenset())
+
+        self.failing = False
+        self.tracker.set_handler('b', '/nao/touch/rear/touch')
+        self.assertEqual(self.tracker.subscribed,
+                         frozenset(['WordRecognized', 'RearTactilTouched']))
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the executor of the user interactions
+"""
+
+# Tested modules
+from internals.interactions import InteractionExecutor, POLICY_DROP, \
+    POLICY_PREEMPT, POLICY_QUEUE
+
+# Standard library
+import threading
+import time
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class InteractionExecutorTest(unittest.TestCase):
+    """
+    Tests the interactions executor
+    """
+    def setUp(self):
+        """
+        Prepares the list of executed interactions
+        """
+        self.executed = []
+        self.cancelled = []
+        self.executor = None
+
+    def tearDown(self):
+        """
+        Stops the executor
+        """
+        if self.executor is not None:
+            self.executor.stop()
+
+    def _start(self, policy, debounce=0, queue_size=4):
+        """
+        Starts an executor, running an interaction until the returned event
+        is set
+        """
+        self.executor = InteractionExecutor(policy, debounce, queue_size)
+        self.executor.start()
+
+        gate = threading.Event()
+        self.assertTrue(self.executor.submit('gate', self._blocking, gate))
+        self.assertTrue(self._wait(lambda: not self.executor._pending))
+        return gate
+
+    def _blocking(self, interaction, gate):
+        """
+        Interaction waiting for the gate to be set, or to be cancelled
+        """
+        while not gate.wait(.01):
+            if interaction.cancelled:
+                self.cancelled.append('gate')
+                return
+
+    def _interaction(self, interaction, name):
+        """
+        Interaction storing its name
+        """
+        self.executed.append(name)
+
+    @staticmethod
+    def _wait(condition, timeout=2):
+        """
+        Waits for a condition to be true
+        """
+        end = time.time() + timeout
+        while not condition() and time.time() < end:
+            time.sleep(.01)
+        return condition()
+
+    def test_arguments(self):
+        """
+        Unknown policies are refused
+        """
+        self.assertRaises(ValueError, InteractionExecutor, 'unknown')
+
+    def test_not_started(self):
+        """
+        Interactions are refused while the executor is stopped
+        """
+        self.executor = InteractionExecutor()
+        self.assertFalse(self.executor.submit('a', self._interaction, 'a'))
+
+    def test_queue(self):
+        """
+        With the queue policy, interactions are executed in order, up to the
+        size of the queue
+        """
+        gate = self._start(POLICY_QUEUE, queue_size=2)
+        self.assertTrue(self.executor.submit('a', self._interaction, 'a'))
+        self.assertTrue(self.executor.submit('b', self._interaction, 'b'))
+        self.assertFalse(self.executor.submit('c', self._interaction, 'c'))
+        self.assertEqual(self.executor.dropped, 1)
+
+        gate.set()
+        self.assertTrue(self._wait(lambda: not self.executor.busy))
+        self.assertEqual(self.executed, ['a', 'b'])
+        self.assertEqual(self.cancelled, [])
+
+    def test_drop(self):
+        """
+        With the drop policy, interactions are ignored while busy
+        """
+        gate = self._start(POLICY_DROP)
+        self.assertFalse(self.executor.submit('a', self._interaction, 'a'))
+        self.assertEqual(self.executor.dropped, 1)
+
+        gate.set()
+        self.assertTrue(self._wait(lambda: not self.executor.busy))
+        self.assertTrue(self.executor.submit('b', self._interaction, 'b'))
+        self.assertTrue(self._wait(lambda: self.executed == ['b']))
+
+    def test_preempt(self):
+        """
+        With the preempt policy, the running interaction is cancelled
+        """
+        self._start(POLICY_PREEMPT)
+        self.assertTrue(self.executor.submit('a', self._interaction, 'a'))
+
+        self.assertTrue(self._wait(lambda: self.executed == ['a']))
+        self.assertEqual(self.cancelled, ['gate'])
+        self.assertEqual(self.executor.preempted, 1)
+
+    def test_debounce(self):
+        """
+        Interactions of the same key are ignored during the debounce delay
+        """
+        self.executor = InteractionExecutor(POLICY_QUEUE, .2)
+        self.executor.start()
+
+        self.assertTrue(self.executor.submit('a', self._interaction, 1))
+        self.assertFalse(self.executor.submit('a', self._interaction, 2))
+        self.assertTrue(self.executor.submit('b', self._interaction, 3))
+        self.assertEqual(self.executor.debounced, 1)
+
+        time.sleep(.3)
+        self.assertTrue(self.executor.submit('a', self._interaction, 4))
+        self.assertTrue(self._wait(lambda: len(self.executed) == 3))
+        self.assertEqual(self.executed, [1, 3, 4])
+
+    def test_stop(self):
+        """
+        Stopping the executor cancels the running interaction and drops the
+        pending ones
+        """
+        self._start(POLICY_QUEUE)
+        self.assertTrue(self.executor.submit('a', self._interaction, 'a'))
+
+        self.executor.stop()
+        self.assertEqual(self.cancelled, ['gate'])
+        self.assertEqual(self.executed, [])
+        self.assertFalse(self.executor.submit('b', self._interaction, 'b'))
+
+    def test_track(self):
+        """
+        Futures tracked by an interaction are cancelled with it
+        """
+        class FakeFuture(object):
+            cancelled = False
+
+            def cancel(self):
+                self.cancelled = True
+
+        tracked = []
+        started = threading.Event()
+
+        def interaction(handle):
+            tracked.append(handle.track(FakeFuture()))
+            started.set()
+            while not handle.cancelled:
+                time.sleep(.01)
+
+            # Already cancelled: cancelled at once
+            tracked.append(handle.track(FakeFuture()))
+
+        self.executor = InteractionExecutor(POLICY_PREEMPT, 0)
+        self.executor.start()
+        self.executor.submit('a', interaction)
+        self.assertTrue(started.wait(2))
+
+        self.executor.submit('b', self._interaction, 'b')
+        self.assertTrue(self._wait(lambda: self.executed == ['b']))
+        self.assertEqual([future.cancelled for future in tracked],
+                         [True, True])
+
+    def test_errors(self):
+        """
+        Errors of an interaction don't stop the executor
+        """
+        self.executor = InteractionExecutor(POLICY_QUEUE, 0)
+        self.executor.start()
+        self.executor.submit('a', self._interaction)
+        self.executor.submit('b', self._interaction, 'b')
+        self.assertTrue(self._wait(lambda: self.executed == ['b']))
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
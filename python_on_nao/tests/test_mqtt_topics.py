@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the index of the MQTT subscriptions and its cache
+"""
+
+# Tested modules
+from internals.mqtt_topics import ListenersCache, TopicTree
+
+# Standard library
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class TopicTreeTest(unittest.TestCase):
+    """
+    Tests the subscriptions tree
+    """
+    def setUp(self):
+        """
+        Prepares an empty tree
+        """
+        self.tree = TopicTree()
+
+    def test_exact(self):
+        """
+        Filters without wildcard only match their topic
+        """
+        self.assertTrue(self.tree.add('/nao/touch', 'a'))
+        self.assertFalse(self.tree.add('/nao/touch', 'b'))
+        self.assertTrue(self.tree.add('/nao/speech', 'c'))
+
+        self.assertEqual(self.tree.match('/nao/touch'), {'a', 'b'})
+        self.assertEqual(self.tree.match('/nao/speech'), {'c'})
+        self.assertEqual(self.tree.match('/nao'), set())
+        self.assertEqual(self.tree.match('/nao/touch/front'), set())
+        self.assertEqual(len(self.tree), 2)
+        self.assertIn('/nao/touch', self.tree)
+
+    def test_single_level(self):
+        """
+        '+' matches exactly one level
+        """
+        self.tree.add('/nao/+/front', 'a')
+        self.tree.add('+/nao/touch/+', 'b')
+
+        self.assertEqual(self.tree.match('/nao/touch/front'), {'a', 'b'})
+        self.assertEqual(self.tree.match('/nao/sensor/front'), {'a'})
+        self.assertEqual(self.tree.match('/nao/touch/rear'), {'b'})
+        self.assertEqual(self.tree.match('/nao/front'), set())
+        self.assertEqual(self.tree.match('/nao/touch/front/x'), set())
+
+        # Empty levels are levels too
+        self.assertEqual(self.tree.match('/nao//front'), {'a'})
+
+    def test_multi_level(self):
+        """
+        '#' matches the parent level and all the levels below
+        """
+        self.tree.add('/nao/#', 'a')
+        self.tree.add('#', 'b')
+
+        self.assertEqual(self.tree.match('/nao'), {'a', 'b'})
+        self.assertEqual(self.tree.match('/nao/touch/front'), {'a', 'b'})
+        self.assertEqual(self.tree.match('/other'), {'b'})
+
+    def test_overlap(self):
+        """
+        A listener is returned once, even if several of its filters match
+        """
+        for subscription in ('/nao/touch', '/nao/+', '/nao/#'):
+            self.tree.add(subscription, 'a')
+
+        self.assertEqual(self.tree.match('/nao/touch'), {'a'})
+
+    def test_system_topics(self):
+        """
+        Topics starting with '$' are not matched by root wildcards
+        """
+        self.tree.add('#', 'a')
+        self.tree.add('+/broker/clients', 'b')
+        self.tree.add('$SYS/#', 'c')
+        self.tree.add('$SYS/+/clients', 'd')
+
+        self.assertEqual(self.tree.match('$SYS/broker/clients'), {'c', 'd'})
+        self.assertEqual(self.tree.match('SYS/broker/clients'), {'a', 'b'})
+
+    def test_remove(self):
+        """
+        Removing the last listener of a filter forgets it
+        """
+        self.tree.add('/nao/+/front', 'a')
+        self.tree.add('/nao/+/front', 'b')
+        self.tree.add('/nao/+', 'c')
+
+        self.assertFalse(self.tree.remove('/nao/+/front', 'a'))
+        self.assertEqual(self.tree.match('/nao/touch/front'), {'b'})
+
+        self.assertTrue(self.tree.remove('/nao/+/front', 'b'))
+        self.assertNotIn('/nao/+/front', self.tree)
+        self.assertEqual(self.tree.match('/nao/touch/front'), set())
+
+        # Shared levels are kept
+        self.assertEqual(self.tree.match('/nao/touch'), {'c'})
+
+        # Unknown filter or listener
+        self.assertRaises(KeyError, self.tree.remove, '/nao/+/front', 'b')
+        self.assertRaises(KeyError, self.tree.remove, '/nao/+', 'a')
+
+        # Pruned levels can be added again
+        self.assertTrue(self.tree.add('/nao/+/front', 'a'))
+        self.assertEqual(self.tree.match('/nao/touch/front'), {'a'})
+
+
+class ListenersCacheTest(unittest.TestCase):
+    """
+    Tests the cache of the listeners of topics
+    """
+    def test_get(self):
+        """
+        Stored topics are returned, others raise a KeyError
+        """
+        cache = ListenersCache()
+        cache.put('/nao/touch', frozenset(['a']))
+
+        self.assertEqual(cache.get('/nao/touch'), frozenset(['a']))
+        self.assertRaises(KeyError, cache.get, '/nao/speech')
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        cache.clear()
+        self.assertRaises(KeyError, cache.get, '/nao/touch')
+        self.assertEqual(len(cache), 0)
+
+    def test_lru(self):
+        """
+        The least recently used topic is evicted first
+        """
+        cache = ListenersCache(2)
+        cache.put('a', frozenset())
+        cache.put('b', frozenset())
+
+        # Use 'a': 'b' is now the least recently used topic
+        cache.get('a')
+        cache.put('c', frozenset())
+
+        self.assertEqual(len(cache), 2)
+        self.assertRaises(KeyError, cache.get, 'b')
+        cache.get('a')
+        cache.get('c')
+
+    def test_update(self):
+        """
+        Storing a topic again replaces its listeners
+        """
+        cache = ListenersCache(2)
+        cache.put('a', frozenset(['x']))
+        cache.put('a', frozenset(['y']))
+
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get('a'), frozenset(['y']))
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
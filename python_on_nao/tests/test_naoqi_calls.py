@@ -0,0 +1,326 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the NAOqi call service, with fake NAOqi proxies
+"""
+
+# Tested modules
+import internals.naoqi_calls as naoqi_calls
+
+# Standard library
+import threading
+import time
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class FakePost(object):
+    """
+    The ``post`` member of a fake proxy: starts fake tasks
+    """
+    def __init__(self, proxy):
+        """
+        Sets up members
+        """
+        self._proxy = proxy
+
+        # Set to block the posting of tasks
+        self.gate = None
+
+    def run(self, duration):
+        """
+        Starts a task lasting the given time
+
+        :param duration: Duration of the task (in seconds)
+        :return: The ID of the task
+        """
+        if self.gate is not None:
+            self.gate.wait()
+
+        return self._proxy.start_task(duration)
+
+
+class FakeProxy(object):
+    """
+    A fake NAOqi proxy, with the task management methods
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        self.post = FakePost(self)
+        self.checks = 0
+        self.stopped = []
+
+        # Concurrent synchronous calls
+        self.running = 0
+        self.max_running = 0
+
+        # Task ID -> end time
+        self._tasks = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def start_task(self, duration):
+        """
+        Starts a fake task
+        """
+        with self._lock:
+            self._next_id += 1
+            self._tasks[self._next_id] = time.time() + duration
+            return self._next_id
+
+    def isRunning(self, task_id):
+        """
+        Checks if a task is running
+        """
+        self.checks += 1
+        with self._lock:
+            return self._tasks.get(task_id, 0) > time.time()
+
+    def wait(self, task_id, timeout):
+        """
+        Waits for the end of a task
+
+        :return: True if the task is still running after the timeout
+        """
+        end = time.time() + timeout / 1000.
+        while time.time() < end:
+            with self._lock:
+                if self._tasks.get(task_id, 0) <= time.time():
+                    return False
+            time.sleep(.01)
+
+        with self._lock:
+            return self._tasks.get(task_id, 0) > time.time()
+
+    def stop(self, task_id):
+        """
+        Stops a task
+        """
+        with self._lock:
+            self._tasks.pop(task_id, None)
+        self.stopped.append(task_id)
+
+    def slow(self, duration):
+        """
+        Synchronous method lasting the given time
+        """
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.running, self.max_running)
+
+        time.sleep(duration)
+
+        with self._lock:
+            self.running -= 1
+        return duration
+
+    def fail(self, exception):
+        """
+        Synchronous method raising the given exception
+        """
+        raise exception
+
+
+class FakePool(object):
+    """
+    A fake proxies pool, sharing a single proxy
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        self.proxy = FakeProxy()
+        self.discarded = []
+
+    def get_proxy(self, module):
+        """
+        Returns the proxy
+        """
+        return self.proxy
+
+    def discard(self, module):
+        """
+        Stores the discarded modules
+        """
+        self.discarded.append(module)
+
+# ------------------------------------------------------------------------------
+
+
+class NaoCallsTest(unittest.TestCase):
+    """
+    Tests the NAOqi call service
+    """
+    def setUp(self):
+        """
+        Starts the service, with short waits of the posted tasks
+        """
+        self._wait_timeout = naoqi_calls.WAIT_TIMEOUT
+        naoqi_calls.WAIT_TIMEOUT = .2
+
+        self.pool = FakePool()
+        self.proxy = self.pool.proxy
+        self.calls = naoqi_calls.NaoCalls()
+        self.calls._pool = self.pool
+        self.calls._limits = {}
+        self.calls._validate(None)
+
+    def tearDown(self):
+        """
+        Stops the service
+        """
+        self.calls._invalidate(None)
+        naoqi_calls.WAIT_TIMEOUT = self._wait_timeout
+
+    def test_call(self):
+        """
+        Synchronous calls are resolved with the result of the method
+        """
+        self.assertEqual(self.calls.call('ALModule', 'slow', 0).result(2), 0)
+
+        future = self.calls.call('ALModule', 'fail', ValueError("Error"))
+        self.assertRaises(ValueError, future.result, 2)
+        self.assertEqual(self.pool.discarded, [])
+
+        # NAOqi errors reset the proxy
+        future = self.calls.call('ALModule', 'fail', RuntimeError("Error"))
+        self.assertRaises(RuntimeError, future.result, 2)
+        self.assertEqual(self.pool.discarded, ['ALModule'])
+
+        self.assertRaises(TypeError, self.calls.call, 'ALModule', 'slow', 0,
+                          unknown=True)
+
+    def test_module_limit(self):
+        """
+        The number of concurrent calls of a module is limited
+        """
+        self.calls._limits = {'ALModule': 1}
+        futures = [self.calls.call('ALModule', 'slow', .05)
+                   for _ in range(4)]
+        for future in futures:
+            future.result(2)
+
+        self.assertEqual(self.proxy.max_running, 1)
+
+    def test_post(self):
+        """
+        Posted calls are resolved with True at the end of their task
+        """
+        self.assertIs(self.calls.post('ALModule', 'run', .05).result(2), True)
+
+        # Longer than the worker wait: checked by the monitor
+        self.assertIs(self.calls.post('ALModule', 'run', .5).result(2), True)
+        self.assertGreater(self.proxy.checks, 0)
+        self.assertEqual(self.calls.get_statistics()['posted'], 2)
+
+    def test_post_timeout(self):
+        """
+        Posted tasks are stopped on timeout
+        """
+        future = self.calls.post('ALModule', 'run', 5, timeout=.1)
+        self.assertRaises(OSError, future.result, 2)
+        self.assertEqual(self.proxy.stopped, [1])
+
+        # Timeout while watched by the monitor
+        future = self.calls.post('ALModule', 'run', 5, timeout=.5)
+        self.assertRaises(OSError, future.result, 2)
+        self.assertEqual(self.proxy.stopped, [1, 2])
+        self.assertEqual(self.calls.get_statistics()['timeouts'], 2)
+
+    def test_call_timeout(self):
+        """
+        Synchronous calls are resolved with an error on timeout, but keep
+        their slot until the end of the method
+        """
+        self.calls._limits = {'ALModule': 1}
+        future = self.calls.call('ALModule', 'slow', .3, timeout=.1)
+        other = self.calls.call('ALModule', 'slow', 0)
+
+        start = time.time()
+        self.assertRaises(OSError, future.result, 2)
+        self.assertLess(time.time() - start, .25)
+        self.assertFalse(other.done())
+
+        self.assertEqual(other.result(2), 0)
+        self.assertRaises(OSError, future.result, 0)
+
+    def test_cancel_waiting(self):
+        """
+        Waiting calls can be cancelled
+        """
+        self.calls._limits = {'ALModule': 1}
+        running = self.calls.call('ALModule', 'slow', .2)
+        waiting = self.calls.call('ALModule', 'slow', 0)
+        posted = self.calls.post('ALModule', 'run', 0)
+
+        self.assertTrue(waiting.cancel())
+        self.assertIsNone(waiting.result(0))
+        self.assertTrue(posted.cancel())
+        self.assertIs(posted.result(0), False)
+
+        self.assertEqual(running.result(2), .2)
+        self.assertEqual(self.calls.get_statistics()['calls'], 1)
+
+    def test_cancel_running(self):
+        """
+        Running synchronous calls can't be cancelled
+        """
+        future = self.calls.call('ALModule', 'slow', .2)
+        time.sleep(.05)
+        self.assertFalse(future.cancel())
+        self.assertEqual(future.result(2), .2)
+
+    def test_cancel_posted(self):
+        """
+        Cancelling a posted call stops its task
+        """
+        future = self.calls.post('ALModule', 'run', 5)
+        time.sleep(.3)
+        self.assertTrue(future.cancel())
+        self.assertIs(future.result(2), False)
+        self.assertEqual(self.proxy.stopped, [1])
+
+    def test_cancel_posting(self):
+        """
+        A call cancelled while being posted is stopped once posted
+        """
+        self.proxy.post.gate = gate = threading.Event()
+        future = self.calls.post('ALModule', 'run', 5)
+        time.sleep(.05)
+
+        self.assertTrue(future.cancel())
+        gate.set()
+        self.assertIs(future.result(2), False)
+        self.assertEqual(self.proxy.stopped, [1])
+
+    def test_stopped(self):
+        """
+        Calls are refused once the service is stopped, and the pending ones
+        fail
+        """
+        self.calls._limits = {'ALModule': 1}
+        self.calls.call('ALModule', 'slow', .2)
+        pending = self.calls.call('ALModule', 'slow', 0)
+        time.sleep(.05)
+
+        self.calls._invalidate(None)
+        self.assertRaises(IOError, pending.result, 0)
+        self.assertRaises(IOError,
+                          self.calls.call('ALModule', 'slow', 0).result, 0)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
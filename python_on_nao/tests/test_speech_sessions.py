@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the speech recognition sessions and their batches
+"""
+
+# Tested modules
+from internals.speech_sessions import RecognitionSession, SessionQueue
+
+# Standard library
+import threading
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class RecognitionSessionTest(unittest.TestCase):
+    """
+    Tests the recognition sessions
+    """
+    def test_compatible(self):
+        """
+        Sessions are compatible if they have the same or disjoint words
+        """
+        session = RecognitionSession(['yes', 'no'])
+        self.assertTrue(session.compatible(RecognitionSession(['no', 'yes'])))
+        self.assertTrue(session.compatible(RecognitionSession(['maybe'])))
+        self.assertFalse(session.compatible(RecognitionSession(['no'])))
+
+    def test_match(self):
+        """
+        Only the results of the words of the session are kept, in order
+        """
+        session = RecognitionSession(['yes', 'no'])
+        self.assertEqual(
+            session.match([('no', .8), ('maybe', .6), ('yes', .2)]),
+            [('no', .8), ('yes', .2)])
+        self.assertEqual(session.match([('maybe', .6)]), [])
+
+    def test_timeout(self):
+        """
+        The timeout method is called if the session is not resolved
+        """
+        event = threading.Event()
+        session = RecognitionSession(['yes'])
+        session.set_timeout(.01, lambda timed_out: event.set())
+        self.assertTrue(event.wait(2))
+
+        # Resolving the session cancels its timeout
+        event.clear()
+        session = RecognitionSession(['yes'])
+        session.set_timeout(.1, lambda timed_out: event.set())
+        self.assertTrue(session.resolve('yes'))
+        self.assertFalse(event.wait(.3))
+        self.assertEqual(session.future.result(), 'yes')
+
+
+class SessionQueueTest(unittest.TestCase):
+    """
+    Tests the queue of recognition sessions
+    """
+    def setUp(self):
+        """
+        Prepares an empty queue
+        """
+        self.queue = SessionQueue()
+
+    def test_batch(self):
+        """
+        The oldest pending session is merged with the compatible ones
+        """
+        first = RecognitionSession(['yes', 'no'])
+        conflicting = RecognitionSession(['no'])
+        same = RecognitionSession(['no', 'yes'])
+        disjoint = RecognitionSession(['maybe'])
+        for session in (first, conflicting, same, disjoint):
+            self.queue.put(session)
+
+        self.assertEqual(self.queue.next_batch(), [first, same, disjoint])
+        self.assertEqual(self.queue.active(), [first, same, disjoint])
+        self.assertEqual(len(self.queue), 4)
+
+        # A single batch at a time
+        self.assertIsNone(self.queue.next_batch())
+
+        self.assertTrue(self.queue.finish([first, same, disjoint]))
+        self.assertEqual(self.queue.next_batch(), [conflicting])
+        self.assertTrue(self.queue.finish([conflicting]))
+        self.assertIsNone(self.queue.next_batch())
+        self.assertEqual(len(self.queue), 0)
+
+    def test_batch_compatibility(self):
+        """
+        A session joins a batch only if it is compatible with all its
+        sessions
+        """
+        first = RecognitionSession(['yes'])
+        second = RecognitionSession(['no'])
+        third = RecognitionSession(['yes', 'no'])
+        for session in (first, second, third):
+            self.queue.put(session)
+
+        self.assertEqual(self.queue.next_batch(), [first, second])
+        self.queue.finish([first, second])
+        self.assertEqual(self.queue.next_batch(), [third])
+
+    def test_finish(self):
+        """
+        The batch is over once all its sessions are finished
+        """
+        first = RecognitionSession(['yes'])
+        second = RecognitionSession(['no'])
+        self.queue.put(first)
+        self.queue.put(second)
+        self.queue.next_batch()
+
+        self.assertFalse(self.queue.finish([first]))
+        self.assertEqual(self.queue.active(), [second])
+        self.assertTrue(self.queue.finish([second]))
+
+    def test_remove(self):
+        """
+        Removing sessions tells if the running batch is over
+        """
+        first = RecognitionSession(['yes'])
+        second = RecognitionSession(['no'])
+        pending = RecognitionSession(['yes', 'no'])
+        for session in (first, second, pending):
+            self.queue.put(session)
+        self.queue.next_batch()
+
+        self.assertIs(self.queue.remove(pending), False)
+        self.assertIs(self.queue.remove(first), False)
+        self.assertIs(self.queue.remove(second), True)
+
+        # Not queued anymore
+        self.assertIsNone(self.queue.remove(second))
+        self.assertIsNone(self.queue.remove(RecognitionSession(['yes'])))
+
+    def test_clear(self):
+        """
+        Clearing the queue returns the active and pending sessions
+        """
+        first = RecognitionSession(['yes'])
+        conflicting = RecognitionSession(['yes', 'no'])
+        self.queue.put(first)
+        self.queue.put(conflicting)
+        self.queue.next_batch()
+
+        self.assertEqual(self.queue.clear(), [first, conflicting])
+        self.assertEqual(len(self.queue), 0)
+        self.assertIsNone(self.queue.next_batch())
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the filter of the touch sensors events
+"""
+
+# Tested modules
+from internals.touch_filter import TouchFilter
+
+# Standard library
+import time
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class TouchFilterTest(unittest.TestCase):
+    """
+    Tests the touch events filter
+    """
+    def test_couple(self):
+        """
+        Press/release couples are forwarded, repeated events are not
+        """
+        touch_filter = TouchFilter(0, 0)
+        self.assertTrue(touch_filter.accept('front', True))
+        self.assertFalse(touch_filter.accept('front', True))
+        self.assertTrue(touch_filter.accept('front', False))
+        self.assertFalse(touch_filter.accept('front', False))
+
+        # Sensors are independent
+        self.assertTrue(touch_filter.accept('front', True))
+        self.assertTrue(touch_filter.accept('rear', True))
+        self.assertTrue(touch_filter.accept('rear', False))
+        self.assertEqual(touch_filter.suppressed, {'front': 2})
+
+    def test_debounce(self):
+        """
+        A press right after a release is a bounce, and so is its release
+        """
+        touch_filter = TouchFilter(.2, 0)
+        self.assertTrue(touch_filter.accept('front', True))
+        self.assertTrue(touch_filter.accept('front', False))
+
+        # Bounce
+        self.assertFalse(touch_filter.accept('front', True))
+        self.assertFalse(touch_filter.accept('front', False))
+        self.assertEqual(touch_filter.suppressed, {'front': 2})
+
+        # The release of the bounce extends the debounce window
+        time.sleep(.1)
+        self.assertFalse(touch_filter.accept('front', True))
+        self.assertFalse(touch_filter.accept('front', False))
+
+        time.sleep(.3)
+        self.assertTrue(touch_filter.accept('front', True))
+        self.assertTrue(touch_filter.accept('front', False))
+
+    def test_min_interval(self):
+        """
+        Presses are forwarded at most once per minimal interval
+        """
+        touch_filter = TouchFilter(0, .2)
+        self.assertTrue(touch_filter.accept('front', True))
+        self.assertTrue(touch_filter.accept('front', False))
+
+        # Too frequent: the release is ignored too
+        self.assertFalse(touch_filter.accept('front', True))
+        self.assertFalse(touch_filter.accept('front', False))
+
+        time.sleep(.3)
+        self.assertTrue(touch_filter.accept('front', True))
+        self.assertTrue(touch_filter.accept('front', False))
+
+    def test_release_first(self):
+        """
+        A release without press is ignored
+        """
+        touch_filter = TouchFilter(0, 0)
+        self.assertFalse(touch_filter.accept('front', False))
+        self.assertTrue(touch_filter.accept('front', True))
+
+    def test_full(self):
+        """
+        A press sensed while the queue is full is dropped with its release
+        """
+        touch_filter = TouchFilter(0, 0)
+        self.assertFalse(touch_filter.accept('front', True, True))
+
+        # The release is dropped, even if the queue is no more full
+        self.assertFalse(touch_filter.accept('front', False))
+        self.assertEqual(touch_filter.dropped, {'front': 2})
+        self.assertEqual(touch_filter.suppressed, {})
+
+        # Releases of forwarded presses are never dropped
+        self.assertTrue(touch_filter.accept('front', True))
+        self.assertTrue(touch_filter.accept('front', False, True))
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
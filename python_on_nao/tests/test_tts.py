@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the pre-synthesized sentences of the text-to-speech service, with a
+local fake of the NAOqi modules
+"""
+
+# Tested modules
+from internals.audio import AudioArbiter
+from internals.futures import Future
+import internals.tts as tts
+
+# Standard library
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class FakeNaoqi(object):
+    """
+    Fake NAOqi call service: executes the calls immediately
+    """
+    def __init__(self):
+        """
+        Sets up members
+        """
+        # List of (module, method, args)
+        self.calls = []
+
+        # Method name -> exception to raise
+        self.failures = {}
+
+    def __execute(self, module, method, args):
+        """
+        Executes a fake call
+        """
+        self.calls.append((module, method, args))
+        future = Future()
+        if method in self.failures:
+            future.set_exception(self.failures[method])
+        elif method == 'sayToFile':
+            with open(args[1], 'w') as out_file:
+                out_file.write(args[0])
+            future.set_result(None)
+        elif method == 'getLanguage':
+            future.set_result('French')
+        elif method == 'getVoice':
+            future.set_result('Julie')
+        elif method == 'getParameter':
+            future.set_result(1.)
+        else:
+            future.set_result(True)
+        return future
+
+    def call(self, module, method, *args, **kwargs):
+        """
+        Fake synchronous call
+        """
+        return self.__execute(module, method, args)
+
+    def post(self, module, method, *args, **kwargs):
+        """
+        Fake posted call
+        """
+        return self.__execute(module, method, args)
+
+    def count(self, method):
+        """
+        Returns the number of calls to the given method
+        """
+        return len([call for call in self.calls if call[1] == method])
+
+
+class TTSCacheTest(unittest.TestCase):
+    """
+    Tests the pre-synthesized sentences of NaoTTS
+    """
+    def setUp(self):
+        """
+        Prepares a TTS component
+        """
+        self.directory = tempfile.mkdtemp()
+        self.naoqi = FakeNaoqi()
+        self.tts = tts.NaoTTS()
+        self.tts._audio = AudioArbiter()
+        self.tts._naoqi = self.naoqi
+        self.tts._cache_directory = self.directory
+        self.tts.validate(None)
+
+    def tearDown(self):
+        """
+        Cleans up
+        """
+        self.tts.invalidate(None)
+        shutil.rmtree(self.directory)
+
+    def _prepare(self, sentences):
+        """
+        Prepares sentences and waits for their rendering
+        """
+        self.tts.prepare(sentences)
+        end = time.time() + 5
+        while self.naoqi.count('sayToFile') < len(sentences) \
+                and time.time() < end:
+            time.sleep(.01)
+        time.sleep(.05)
+
+    def test_play_prepared(self):
+        """
+        Prepared sentences are played from the cache, without querying the
+        voice again
+        """
+        self._prepare(['Je vous écoute'])
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        queries = self.naoqi.count('getLanguage')
+
+        for _ in range(3):
+            self.assertTrue(self.tts.say('Je vous écoute').result(2))
+
+        self.assertEqual(self.naoqi.count('playFile'), 3)
+        self.assertEqual(self.naoqi.count('say'), 0)
+        self.assertEqual(self.naoqi.count('getLanguage'), queries)
+
+    def test_not_prepared(self):
+        """
+        Other sentences are synthesized
+        """
+        self._prepare(['Je vous écoute'])
+        self.assertTrue(self.tts.say('Bonjour').result(2))
+        self.assertEqual(self.naoqi.count('say'), 1)
+        self.assertEqual(self.naoqi.count('playFile'), 0)
+
+    def test_voice_error(self):
+        """
+        Sentences are synthesized if the voice can't be described
+        """
+        self.naoqi.failures['getLanguage'] = RuntimeError("NAOqi error")
+        self.tts.prepare(['Je vous écoute'])
+        self.assertTrue(self.tts.say('Je vous écoute').result(2))
+        self.assertEqual(self.naoqi.count('say'), 1)
+        self.assertEqual(self.naoqi.count('playFile'), 0)
+
+    def test_play_error(self):
+        """
+        Sentences are synthesized if their file can't be played
+        """
+        self._prepare(['Je vous écoute'])
+        self.naoqi.failures['playFile'] = RuntimeError("NAOqi error")
+        self.assertTrue(self.tts.say('Je vous écoute').result(2))
+        self.assertEqual(self.naoqi.count('playFile'), 1)
+        self.assertEqual(self.naoqi.count('say'), 1)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the priority queue of the sentences to say
+"""
+
+# Tested modules
+from internals.tts_queue import SpeechQueue
+
+# Standard library
+import threading
+import time
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class SpeechQueueTest(unittest.TestCase):
+    """
+    Tests the speech queue
+    """
+    def setUp(self):
+        """
+        Prepares an empty queue
+        """
+        self.queue = SpeechQueue()
+
+    def tearDown(self):
+        """
+        Stops the queue
+        """
+        self.queue.stop()
+
+    def _texts(self):
+        """
+        Returns the texts of the pending sentences, in the order they are
+        returned by the queue
+        """
+        texts = []
+        while True:
+            utterance = self.queue.get(0)
+            if utterance is None:
+                return texts
+            texts.append(utterance.text)
+
+    def test_order(self):
+        """
+        Sentences of the same priority are returned in order of arrival
+        """
+        for text in ('a', 'b', 'c'):
+            self.queue.put(text, 1)
+
+        self.assertEqual(len(self.queue), 3)
+        self.assertEqual(self._texts(), ['a', 'b', 'c'])
+        self.assertEqual(len(self.queue), 0)
+
+    def test_priority(self):
+        """
+        A sentence drops the pending sentences of lower priority
+        """
+        low = self.queue.put('low', 1)
+        same = self.queue.put('same', 2)
+        high = self.queue.put('high', 2)
+
+        self.assertIs(low.result(0), False)
+        self.assertFalse(same.done())
+        self.assertFalse(high.done())
+        self.assertEqual(self.queue.dropped, 1)
+
+        # Lower priority: queued after the others
+        self.queue.put('lower', 0)
+        self.assertEqual(self._texts(), ['same', 'high', 'lower'])
+
+    def test_coalesce(self):
+        """
+        Identical pending sentences share the same future
+        """
+        future = self.queue.put('a', 1)
+        self.assertIs(self.queue.put('a', 1), future)
+        self.assertIs(self.queue.put('a', 0), future)
+        self.assertEqual(self.queue.coalesced, 2)
+        self.assertEqual(self._texts(), ['a'])
+
+        # Not pending anymore
+        self.assertIsNot(self.queue.put('a', 1), future)
+
+    def test_coalesce_priority(self):
+        """
+        An identical sentence of higher priority keeps the pending future,
+        with the new priority
+        """
+        future = self.queue.put('a', 1)
+        self.queue.put('b', 2)
+        self.assertIs(future.result(0), False)
+
+        other = self.queue.put('c', 1)
+        self.assertIs(self.queue.put('c', 3), other)
+        self.assertFalse(other.done())
+        self.assertEqual(self.queue.coalesced, 1)
+
+        utterance = self.queue.get(0)
+        self.assertEqual((utterance.text, utterance.priority), ('c', 3))
+        self.assertIs(utterance.future, other)
+        self.assertEqual(self._texts(), [])
+
+    def test_max_age(self):
+        """
+        Stale sentences are dropped
+        """
+        stale = self.queue.put('stale', 1, .05)
+        kept = self.queue.put('kept', 1, 10)
+        extended = self.queue.put('extended', 1, .05)
+        self.queue.put('extended', 1)
+
+        time.sleep(.1)
+        self.assertEqual(self._texts(), ['kept', 'extended'])
+        self.assertIs(stale.result(0), False)
+        self.assertFalse(kept.done())
+        self.assertFalse(extended.done())
+
+    def test_get_wait(self):
+        """
+        get() waits for a sentence, until its timeout
+        """
+        start = time.time()
+        self.assertIsNone(self.queue.get(.1))
+        self.assertGreaterEqual(time.time() - start, .1)
+
+        timer = threading.Timer(.05, self.queue.put, ('a', 1))
+        timer.start()
+        utterance = self.queue.get(2)
+        self.assertEqual(utterance.text, 'a')
+
+    def test_stop(self):
+        """
+        Stopping the queue drops the pending sentences
+        """
+        future = self.queue.put('a', 1)
+        self.queue.get(0)
+        pending = self.queue.put('b', 1)
+        self.queue.stop()
+
+        self.assertFalse(self.queue.running)
+        self.assertFalse(future.done())
+        self.assertIs(pending.result(0), False)
+        self.assertIs(self.queue.put('c', 1).result(0), False)
+        self.assertIsNone(self.queue.get(0))
+
+    def test_stop_wait(self):
+        """
+        Stopping the queue wakes up get()
+        """
+        timer = threading.Timer(.05, self.queue.stop)
+        timer.start()
+        self.assertIsNone(self.queue.get())
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()
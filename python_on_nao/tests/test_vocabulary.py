@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# -- Content-Encoding: UTF-8 --
+"""
+Tests the vocabulary of the speech recognition listeners
+"""
+
+# Tested modules
+from internals.vocabulary import VocabularyIndex, parse_recognized
+
+# Standard library
+import unittest
+
+# ------------------------------------------------------------------------------
+
+# Module version
+__version_info__ = (0, 1, 1)
+__version__ = ".".join(str(x) for x in __version_info__)
+
+# Documentation strings format
+__docformat__ = "restructuredtext en"
+
+# ------------------------------------------------------------------------------
+
+
+class ParseRecognizedTest(unittest.TestCase):
+    """
+    Tests the parsing of the WordRecognized event
+    """
+    def test_parse(self):
+        """
+        Words are returned with their confidence, best confidence first
+        """
+        self.assertEqual(
+            parse_recognized(['yes', .4, 'no', .7, 'maybe', .4]),
+            [('no', .7), ('yes', .4), ('maybe', .4)])
+
+    def test_invalid(self):
+        """
+        Empty words, invalid confidences and incomplete couples are ignored
+        """
+        self.assertEqual(parse_recognized([]), [])
+        self.assertEqual(parse_recognized(['', .9, 'yes', None, 'no', '.5',
+                                           'maybe']),
+                         [('no', .5)])
+
+
+class VocabularyIndexTest(unittest.TestCase):
+    """
+    Tests the vocabulary index
+    """
+    def setUp(self):
+        """
+        Prepares an empty index
+        """
+        self.index = VocabularyIndex()
+
+    def test_match(self):
+        """
+        Words are associated to the listeners using them
+        """
+        self.index.add('a', ['yes', 'no'], .5)
+        self.index.add('b', ['no', 'maybe'])
+
+        self.assertEqual(self.index.match('yes'), frozenset(['a']))
+        self.assertEqual(self.index.match('no'), frozenset(['a', 'b']))
+        self.assertEqual(self.index.match('other'), frozenset())
+        self.assertEqual(len(self.index), 3)
+
+        self.assertEqual(self.index.threshold('a'), .5)
+        self.assertEqual(self.index.threshold('b'), 0.)
+        self.assertEqual(self.index.threshold('c'), 0.)
+
+    def test_version(self):
+        """
+        The version changes only when the union of words changes
+        """
+        version, words = self.index.snapshot()
+        self.assertEqual(words, frozenset())
+
+        self.index.add('a', ['yes', 'no'])
+        new_version, words = self.index.snapshot()
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(words, frozenset(['yes', 'no']))
+
+        # Same union of words
+        version = new_version
+        self.index.add('b', ['no'])
+        self.index.add('a', ['yes', 'no'], .8)
+        self.assertEqual(self.index.version, version)
+
+        # Shared word kept
+        self.index.add('a', ['yes'])
+        self.assertEqual(self.index.version, version)
+        self.assertEqual(self.index.match('no'), frozenset(['b']))
+
+        # Word removed from the union
+        self.index.remove('b')
+        new_version, words = self.index.snapshot()
+        self.assertNotEqual(new_version, version)
+        self.assertEqual(words, frozenset(['yes']))
+
+    def test_remove(self):
+        """
+        Removing a listener forgets its words and its threshold
+        """
+        self.index.add('a', ['yes'], .5)
+        self.index.remove('a')
+
+        self.assertEqual(self.index.match('yes'), frozenset())
+        self.assertEqual(self.index.threshold('a'), 0.)
+        self.assertEqual(len(self.index), 0)
+        self.assertRaises(KeyError, self.index.remove, 'a')
+
+    def test_clear(self):
+        """
+        Clearing the index removes all listeners
+        """
+        self.index.add('a', ['yes'])
+        version = self.index.version
+        self.index.clear()
+
+        self.assertNotEqual(self.index.version, version)
+        self.assertEqual(self.index.snapshot()[1], frozenset())
+        self.assertEqual(self.index.match('yes'), frozenset())
+
+        # Nothing changed
+        version = self.index.version
+        self.index.clear()
+        self.assertEqual(self.index.version, version)
+
+# ------------------------------------------------------------------------------
+
+if __name__ == "__main__":
+    unittest.main()